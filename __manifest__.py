@@ -53,12 +53,18 @@ Roles soportados:
         'views/building_stage_views.xml',
         'views/building_alert_views.xml',
         'views/building_budget_views.xml',
+        'views/building_budget_period_report_views.xml',  # Distribución por Periodo (filas + compacta)
         'views/building_progress_views.xml',  # FASE 3.2: Avance Físico
         'views/building_budget_progress_views.xml',  # FASE 3.3: Avance por Partida
+        'views/building_progress_snapshot_views.xml',  # Curvas de Avance (snapshots)
+        'views/building_work_kpi_views.xml',         # Portafolio (KPIs materializados)
         'views/building_real_line_views.xml',        # FASE 3.4: Gastos Reales
         'views/work_cost_views.xml',                 # FASE 4.1: Costos Operativos
         'views/work_evidence_views.xml',             # FASE 4.2: Evidencias
         'data/building_worker_role_data.xml',          # FASE 4.5: Datos iniciales roles
+        'data/building_work_kpi_cron.xml',             # Cron: refresco de portafolio
+        'data/building_alert_sweep_cron.xml',          # Cron: alertas por tiempo
+        'data/building_sat_sweep_cron.xml',            # Cron: revalidación SAT
         'views/building_worker_role_views.xml',      # FASE 4.5: Roles de Obra
         'views/building_worker_views.xml',           # FASE 4.5: Trabajadores (hr.employee)
         'views/building_jornal_views.xml',           # FASE 4.5: Jornales
@@ -67,6 +73,7 @@ Roles soportados:
         'views/menus.xml',
         'views/res_config_settings_views.xml',
         'views/cfdi_load_wizard_views.xml',
+        'views/cfdi_bulk_load_wizard_views.xml',
     ],
     'demo': [
         'data/demo.xml',
@@ -20,11 +20,10 @@ def post_init_hook(env):
     works = env['building.work'].search([])
     
     if works:
-        # Forzar recálculo de campos computados
-        # Esto invalida el caché y fuerza el recálculo
-        works._compute_budget_kpis()
-        works._compute_amount_available()
-        works._compute_financial_progress()
+        # Marcar KPIs de presupuesto: el ORM los recalcula en el flush
+        works._mark_budget_kpis_dirty()
+        # Snapshots de avance y totales por etapa (importe planeado, ponderado)
+        env['building.progress.engine'].recompute_works(works.ids)
         
         _logger.info(
             "building_dashboard: Recalculados KPIs para %d obras", 
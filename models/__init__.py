@@ -7,21 +7,30 @@ from . import bill_allocation
 from . import building_work
 from . import building_work_stage
 from . import building_work_alert
+from . import building_work_alert_threshold
 from . import building_ai_config
 from . import building_ai_chat
 from . import building_ai_service
 from . import progress_engine
+from . import building_progress_snapshot
+from . import building_work_kpi
 from . import encryption_service
+from . import sat_service
+from . import sat_status_cache
+from . import cfdi_parser
 from . import res_config_settings
 # Fase 3.4
 from . import building_real_line
 from . import financial_engine
+from . import distribution_engine
+from . import cashflow_engine
 from . import alert_engine
 # Presupuesto Paramétrico
 from . import building_budget
 from . import building_budget_chapter
 from . import building_budget_line
 from . import building_budget_period
+from . import building_budget_period_report
 # Avance Físico (FASE 3.2)
 from . import building_stage_progress
 # Avance por Partida (FASE 3.3)
@@ -1,4 +1,10 @@
-from odoo import models, fields
+from odoo import models, fields, api
+from odoo.tools import SQL
+
+# Campos de la línea analítica que alteran el real de obras en modo contable
+# (además de las columnas de planes analíticos)
+BUILDING_REAL_FIELDS = {'amount', 'date', 'move_line_id'}
+
 
 class AccountAnalyticLine(models.Model):
     _inherit = 'account.analytic.line'
@@ -9,3 +15,90 @@ class AccountAnalyticLine(models.Model):
         ondelete='cascade',
         index=True
     )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._building_mark_real_dirty(lines._building_get_real_work_ids())
+        return lines
+
+    def write(self, vals):
+        if not self._building_touches_real(vals):
+            return super().write(vals)
+        # Antes y después: la línea puede cambiar de cuenta analítica
+        linked = self._building_get_linked_accounts()
+        work_ids = self._building_get_real_work_ids(linked)
+        res = super().write(vals)
+        work_ids |= self._building_get_real_work_ids(linked)
+        self._building_mark_real_dirty(work_ids)
+        return res
+
+    def unlink(self):
+        self._building_mark_real_dirty(self._building_get_real_work_ids())
+        return super().unlink()
+
+    def _building_touches_real(self, vals):
+        """True si los valores escritos cambian el real: importe, fecha, apunte o cuenta."""
+        for fname in vals:
+            if fname in BUILDING_REAL_FIELDS:
+                return True
+            field = self._fields.get(fname)
+            if field and field.type == 'many2one' and field.comodel_name == 'account.analytic.account':
+                return True
+        return False
+
+    @api.model
+    def _building_get_linked_accounts(self):
+        """
+        Cuentas analíticas ligadas a obras en modo contable (cuenta de la
+        obra o de sus partidas), en una consulta.
+
+        Returns:
+            dict: {analytic_account_id: {work_id, ...}}
+        """
+        self.env['building.work'].flush_model(['real_source', 'analytic_account_id'])
+        self.env['building.budget.line'].flush_model(['work_id', 'analytic_account_id'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT w.analytic_account_id, w.id
+              FROM building_work w
+             WHERE w.real_source = 'accounting'
+               AND w.analytic_account_id IS NOT NULL
+             UNION
+            SELECT bl.analytic_account_id, w.id
+              FROM building_budget_line bl
+              JOIN building_work w ON w.id = bl.work_id
+             WHERE w.real_source = 'accounting'
+               AND bl.analytic_account_id IS NOT NULL
+            """
+        ))
+        linked = {}
+        for account_id, work_id in self.env.cr.fetchall():
+            linked.setdefault(account_id, set()).add(work_id)
+        return linked
+
+    def _building_get_real_work_ids(self, linked=None):
+        """Obras en modo contable cuyo real incluye alguna de estas líneas."""
+        if not self:
+            return set()
+        if linked is None:
+            linked = self._building_get_linked_accounts()
+        if not linked:
+            return set()
+        # Solo las columnas de los planes que usan las obras
+        accounts = self.env['account.analytic.account'].sudo().browse(list(linked))
+        work_ids = set()
+        for plan in accounts.root_plan_id:
+            for account_id in self.mapped(plan._column_name()).ids:
+                work_ids.update(linked.get(account_id, ()))
+        return work_ids
+
+    def _building_mark_real_dirty(self, work_ids):
+        """
+        Plan B: el real de obras en modo contable sale de la analítica, que
+        no forma parte de las dependencias ORM. Se marcan como modificadas
+        las obras afectadas para que sus KPIs (partidas, etapas, obra) se
+        recalculen igual que al cambiar la fuente del real.
+        """
+        if work_ids:
+            self.env['building.work'].sudo().browse(list(work_ids)).modified(['real_source'])
@@ -1,6 +1,17 @@
+import logging
+import time
+from datetime import timedelta
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
+_logger = logging.getLogger(__name__)
+
+# Facturas por lote del barrido SAT (una consulta concurrente y un commit por lote)
+SAT_SWEEP_BATCH = 50
+# Facturas pagadas con fecha reciente (días) que el barrido sigue revisando
+SAT_SWEEP_RECENT_DAYS = 90
+
 class AccountMoveBuilding(models.Model):
     """
     Herencia de account.move para agregar campos de
@@ -110,6 +121,12 @@ class AccountMoveBuilding(models.Model):
         ('not_found', 'No Encontrado'),
         ('error', 'Error / Sin Conexión')
     ], string='Estatus SAT', default='not_checked', tracking=True, readonly=True)
+    l10n_mx_cfdi_sat_checked_at = fields.Datetime(
+        string='Última Validación SAT',
+        copy=False,
+        readonly=True,
+        index='btree_not_null',
+    )
     
     l10n_mx_cfdi_folio = fields.Char(string='Folio CFDI', readonly=True)
     l10n_mx_cfdi_fecha = fields.Datetime(string='Fecha Timbrado', readonly=True)
@@ -144,67 +161,180 @@ class AccountMoveBuilding(models.Model):
         }
 
     def action_recheck_sat(self):
-        """Re-consulta el estatus del CFDI en el SAT."""
-        self.ensure_one()
-        if not self.l10n_mx_cfdi_uuid:
+        """
+        Re-consulta el estatus de los CFDI en el SAT.
+
+        Acepta varias facturas: las consultas se hacen en paralelo con el
+        cliente compartido (building.sat.service).
+        """
+        moves = self.filtered('l10n_mx_cfdi_uuid')
+        if not moves:
             raise UserError(_('No hay UUID para validar.'))
-        
+
         # Usar el RFC Receptor del XML si existe, sino el de la compañía
-        rfc_receptor = self.l10n_mx_cfdi_rfc_receptor or self.company_id.vat or ''
         # Usar el Monto del XML si existe, sino el total de la factura
-        total_verify = self.l10n_mx_cfdi_amount if self.l10n_mx_cfdi_amount else self.amount_total
-        
-        # Nota: Importamos el wizard para usar su metodo estatico o duplicamos logica
-        # Mejor usar metodo auxiliar local para no depender del wizard
-        status = self._check_sat_status(
-            self.l10n_mx_cfdi_rfc_emisor, 
-            rfc_receptor, 
-            total_verify, 
-            self.l10n_mx_cfdi_uuid
-        )
-        self.l10n_mx_cfdi_sat_status = status
-        
-        type_msg = 'success' if status == 'valid' else 'warning'
-        if status == 'cancelled': type_msg = 'danger'
-        
+        statuses = self.env['building.sat.service'].check_status_many([
+            (
+                move.l10n_mx_cfdi_rfc_emisor,
+                move.l10n_mx_cfdi_rfc_receptor or move.company_id.vat or '',
+                move.l10n_mx_cfdi_amount or move.amount_total,
+                move.l10n_mx_cfdi_uuid,
+            )
+            for move in moves
+        ])
+        moves_by_status = {}
+        for move in moves:
+            status = statuses[move.l10n_mx_cfdi_uuid]
+            moves_by_status[status] = moves_by_status.get(status, self.browse()) | move
+        moves._set_sat_status(statuses)
+
         # Mapeo de Estatus a Español
-        status_labels = {
-            'valid': 'Vigente',
-            'cancelled': 'Cancelado',
-            'not_found': 'No Encontrado',
-            'error': 'Error'
-        }
-        status_label = status_labels.get(status, status)
+        status_labels = dict(self._fields['l10n_mx_cfdi_sat_status']._description_selection(self.env))
+        if len(moves) == 1:
+            status = statuses[moves.l10n_mx_cfdi_uuid]
+            type_msg = 'success' if status == 'valid' else 'warning'
+            if status == 'cancelled': type_msg = 'danger'
+            message = _('Estatus Actualizado: %s') % status_labels.get(status, status)
+        else:
+            type_msg = 'danger' if 'cancelled' in moves_by_status else (
+                'success' if set(moves_by_status) == {'valid'} else 'warning')
+            message = _('%d CFDI revalidados: %s') % (len(moves), ', '.join(
+                '%s %d' % (status_labels.get(status, status), len(status_moves))
+                for status, status_moves in moves_by_status.items()
+            ))
 
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': _('Validación SAT'),
-                'message': _('Estatus Actualizado: %s') % status_label,
+                'message': message,
                 'type': type_msg,
                 'sticky': False,
             }
         }
 
     def _check_sat_status(self, rfc_emisor, rfc_receptor, total, uuid):
-        """Helper para consultar SAT (copiado de wizard para independencia)."""
-        import requests
-        url = 'https://consultaqr.facturaelectronica.sat.gob.mx/ConsultaCFDIService.svc'
-        total_str = '%.6f' % abs(total)
-        soap_body = f"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tem="http://tempuri.org/">
-           <soapenv:Body>
-              <tem:Consulta>
-                 <tem:expresionImpresa>?re={rfc_emisor}&amp;rr={rfc_receptor}&amp;tt={total_str}&amp;id={uuid}</tem:expresionImpresa>
-              </tem:Consulta>
-           </soapenv:Body>
-        </soapenv:Envelope>"""
-        headers = {'Content-Type': 'text/xml; charset=utf-8', 'SOAPAction': 'http://tempuri.org/IConsultaCFDIService/Consulta'}
-        try:
-            response = requests.post(url, data=soap_body, headers=headers, timeout=5)
-            if 'Vigente' in response.text: return 'valid'
-            if 'Cancelado' in response.text: return 'cancelled'
-            if 'No Encontrado' in response.text: return 'not_found'
-            return 'error'
-        except:
-            return 'error'
+        """Helper para consultar SAT (cliente compartido de building.sat.service)."""
+        return self.env['building.sat.service'].check_status(rfc_emisor, rfc_receptor, total, uuid)
+
+    def _set_sat_status(self, statuses):
+        """
+        Guarda el estatus SAT ({uuid: estatus}) y la fecha de validación,
+        un write por estatus. Un 'error' (SAT caído) no se guarda: la
+        factura conserva su último estatus y sigue pendiente de revalidar.
+        Si alguna factura aplicada a obras pasa a cancelada, se encolan
+        sus obras en el motor de alertas.
+
+        Returns:
+            recordset: facturas que pasaron a cancelada.
+        """
+        now = fields.Datetime.now()
+        by_status = {}
+        flipped = self.browse()
+        for move in self:
+            status = statuses.get(move.l10n_mx_cfdi_uuid)
+            if not status or status == 'error':
+                continue
+            if status == 'cancelled' and move.l10n_mx_cfdi_sat_status != 'cancelled':
+                flipped |= move
+            by_status[status] = by_status.get(status, self.browse()) | move
+        for status, moves in by_status.items():
+            moves.write({'l10n_mx_cfdi_sat_status': status, 'l10n_mx_cfdi_sat_checked_at': now})
+
+        if flipped:
+            lines = self.env['building.bill.allocation.line'].sudo().search([
+                ('allocation_id.move_id', 'in', flipped.ids),
+                ('allocation_id.state', '=', 'active'),
+            ])
+            if lines:
+                self.env['building.alert.engine'].enqueue(lines.work_id.ids)
+        return flipped
+
+    @api.model
+    def _get_sat_sweep_domain(self):
+        """
+        Facturas de proveedor con CFDI pendientes de revalidar: no canceladas
+        en el SAT, abiertas o recientes, y sin validación vigente según la
+        vigencia de su estatus (la misma de building.sat.status.cache).
+        """
+        now = fields.Datetime.now()
+        stale = [('l10n_mx_cfdi_sat_checked_at', '=', False)]
+        for status, ttl in self.env['building.sat.status.cache']._get_ttls().items():
+            if ttl is None:
+                continue
+            stale = ['|'] + stale + [
+                '&',
+                ('l10n_mx_cfdi_sat_status', '=', status),
+                ('l10n_mx_cfdi_sat_checked_at', '<', now - ttl),
+            ]
+        today = fields.Date.context_today(self)
+        return [
+            ('move_type', 'in', ('in_invoice', 'in_refund')),
+            ('state', '!=', 'cancel'),
+            ('l10n_mx_cfdi_uuid', '!=', False),
+            ('l10n_mx_cfdi_sat_status', '!=', 'cancelled'),
+            '|',
+            ('payment_state', 'in', ('not_paid', 'partial', 'in_payment')),
+            ('invoice_date', '>=', today - timedelta(days=SAT_SWEEP_RECENT_DAYS)),
+        ] + stale
+
+    @api.model
+    def _cron_recheck_sat(self, time_budget=240, batch_size=SAT_SWEEP_BATCH):
+        """
+        Cron: revalida en el SAT las facturas más desactualizadas primero,
+        en lotes concurrentes, hasta agotar el presupuesto de tiempo.
+
+        Es reanudable sin marcas adicionales: cada factura validada sale del
+        dominio (fecha vigente), así la siguiente corrida continúa con las
+        que faltan. Cada lote se confirma por separado.
+
+        El presupuesto de tiempo también acota las consultas en curso: al
+        agotarse no se inicia ningún intento más. Si un lote completo vuelve
+        sin respuesta (SAT caído) el barrido se detiene; esas facturas
+        conservan su estatus y se reintentan en la siguiente corrida.
+
+        Returns:
+            dict: métricas (facturas, canceladas, errores, lotes, ms).
+        """
+        started = time.monotonic()
+        deadline = started + time_budget
+        Service = self.env['building.sat.service']
+        domain = self._get_sat_sweep_domain()
+        metrics = {'moves': 0, 'cancelled': 0, 'batches': 0, 'errors': 0}
+        # Facturas ya intentadas en esta corrida (las de error siguen en el dominio)
+        done_ids = []
+        while time.monotonic() < deadline:
+            moves = self.search(domain + [('id', 'not in', done_ids)],
+                                order='l10n_mx_cfdi_sat_checked_at asc nulls first, id',
+                                limit=batch_size)
+            if not moves:
+                break
+            done_ids += moves.ids
+            statuses = Service.check_status_many([
+                (
+                    move.l10n_mx_cfdi_rfc_emisor,
+                    move.l10n_mx_cfdi_rfc_receptor or move.company_id.vat or '',
+                    move.l10n_mx_cfdi_amount or move.amount_total,
+                    move.l10n_mx_cfdi_uuid,
+                )
+                for move in moves
+            ], deadline=deadline)
+            flipped = moves._set_sat_status(statuses)
+            answered = sum(1 for status in statuses.values() if status != 'error')
+            metrics['moves'] += answered
+            metrics['errors'] += len(statuses) - answered
+            metrics['cancelled'] += len(flipped)
+            metrics['batches'] += 1
+            self.env.flush_all()
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            if not answered:
+                _logger.warning("account.move: barrido SAT detenido, el SAT no respondió un lote completo")
+                break
+        metrics['ms'] = int((time.monotonic() - started) * 1000)
+        _logger.info(
+            "account.move: barrido SAT en %(ms)d ms (%(moves)d facturas, "
+            "%(cancelled)d canceladas, %(errors)d con error, %(batches)d lotes)", metrics,
+        )
+        return metrics
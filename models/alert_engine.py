@@ -1,193 +1,545 @@
 # -*- coding: utf-8 -*-
+import logging
+import time
+from datetime import timedelta
+
 from odoo import models, fields, api, _
+from odoo.tools import SQL
+
+# Llave de la cola de alertas en cr.precommit.data (vive lo que la transacción)
+ALERT_QUEUE_KEY = 'building.alert.engine.queue'
+
+# Reglas que dependen del paso del tiempo (las evalúa también el barrido programado)
+TIME_RULE_DOMAIN = [
+    '|',
+    ('rule_code', '=like', 'RULE_03_%'),
+    ('rule_code', '=', 'LEGACY_OVERDUE_STAGES'),
+]
+
+_logger = logging.getLogger(__name__)
+
 
 class BuildingAlertEngine(models.AbstractModel):
     """
     Motor de Alertas (Alert Engine).
     Centraliza la lógica de generación y actualización de alertas de obra.
+
+    COLA DIFERIDA:
+    Los cambios (gastos, avances, etapas, presupuestos) solo encolan la obra
+    con enqueue(); la cola se procesa una vez al final de la transacción
+    (pre-commit) con rebuild_alerts() sobre todas las obras encoladas.
+
+    BARRIDO PROGRAMADO:
+    Las reglas de tiempo (etapa sin avance, etapas vencidas) cambian sin que
+    nada se escriba; sweep_time_rules() las evalúa por cron para todas las
+    obras en ejecución con una sola consulta.
     """
     _name = 'building.alert.engine'
     _description = 'Motor de Alertas'
 
+    # =====================================================
+    # COLA DIFERIDA Y DEDUPLICADA
+    # =====================================================
+
+    @api.model
+    def _get_queue(self):
+        """
+        Retorna el conjunto de obras pendientes de la transacción actual.
+        Al crearlo se registra el procesamiento en el pre-commit del cursor.
+        """
+        data = self.env.cr.precommit.data
+        queue = data.get(ALERT_QUEUE_KEY)
+        if queue is None:
+            queue = data[ALERT_QUEUE_KEY] = set()
+            engine = self
+            self.env.cr.precommit.add(lambda: engine.flush_queue())
+        return queue
+
+    @api.model
+    def enqueue(self, work_ids):
+        """Encola obras para reevaluar sus alertas al final de la transacción."""
+        if isinstance(work_ids, int):
+            work_ids = [work_ids]
+        work_ids = [wid for wid in work_ids if wid]
+        if work_ids:
+            self._get_queue().update(work_ids)
+
+    @api.model
+    def flush_queue(self):
+        """Procesa la cola: una sola evaluación por lote de obras."""
+        queue = self.env.cr.precommit.data.get(ALERT_QUEUE_KEY)
+        # Reconstruir puede encolar de nuevo (recálculos en cascada): repetir
+        while queue:
+            work_ids = list(queue)
+            queue.clear()
+            # Las alertas leen avance: vaciar antes la cola del Progress Engine
+            self.env['building.progress.engine'].flush_dirty()
+            self.rebuild_alerts(work_ids)
+            self.env.flush_all()
+
+    # =====================================================
+    # RECONSTRUCCIÓN (MULTI-OBRA)
+    # =====================================================
+
     @api.model
-    def rebuild_alerts(self, work_id):
+    def rebuild_alerts(self, work_ids):
         """
-        Reconstruye las alertas de la obra basándose en reglas operativas.
-        Se debe llamar después de cualquier cambio significativo (avance, presupuesto, gastos).
+        Reconstruye las alertas de las obras basándose en reglas operativas.
+
+        Acepta un id o una lista de ids. Cada regla se evalúa una sola vez
+        para todas las obras (ver _evaluate_rules) y el resultado se aplica
+        como diferencia sobre las existentes (ver _sync_alerts).
         """
-        work = self.env['building.work'].browse(work_id)
-        if not work:
+        if isinstance(work_ids, int):
+            work_ids = [work_ids]
+        works = self.env['building.work'].browse([wid for wid in work_ids if wid]).exists()
+        if not works:
             return
+        self._sync_alerts(works, self._evaluate_rules(works))
 
-        from datetime import timedelta
+    @api.model
+    def _sync_alerts(self, works, desired_by_work, rule_domain=None):
+        """
+        Aplica el conjunto deseado de alertas sobre las existentes, por
+        (obra, rule_code), sin borrar ni recrear:
+
+        - Nuevas: se crean en un solo create().
+        - Existentes: se actualizan solo si cambió mensaje, severidad o tipo,
+          o si estaban resueltas (se reactivan). Las descartadas por el
+          usuario (dismissed) siguen ocultas mientras la condición persista.
+        - Resueltas: se desactivan en un solo write() y se limpia el
+          descarte, para que vuelvan a avisar si la condición reaparece.
+
+        Con rule_domain solo se consideran las alertas existentes de esas
+        reglas (el resto de las alertas de la obra no se toca).
+
+        Returns:
+            dict: {'created', 'updated', 'resolved'} número de alertas.
+        """
         AlertModel = self.env['building.work.alert']
-        
-        # Eliminar alertas automáticas existentes (las que tienen rule_code)
-        # Usamos sudo() por si el usuario actual no tiene permisos de borrado,
-        # aunque el sistema debería manejarlo.
-        work.alert_ids.filtered(lambda a: a.rule_code).unlink()
-        
-        alerts_to_create = []
-        
-        # =====================================================
-        # REGLA 1: PRESUPUESTO NO VALIDADO
-        # Condición: Si el presupuesto no está en estado 'validated'
-        # Severidad: Advertencia | Tipo: Planeación
-        # =====================================================
-        budget = work._get_active_budget()
+        existing = AlertModel.search([
+            ('work_id', 'in', works.ids),
+            ('rule_code', '!=', False),
+        ] + (rule_domain or []))
+        existing_by_key = {(alert.work_id.id, alert.rule_code): alert for alert in existing}
+
+        to_create = []
+        updated = 0
+        seen = AlertModel
+        for work_id, desired in desired_by_work.items():
+            for vals in desired:
+                alert = existing_by_key.get((work_id, vals['rule_code']))
+                if not alert:
+                    to_create.append(vals)
+                    continue
+                seen |= alert
+                changes = {
+                    fname: vals[fname]
+                    for fname in ('name', 'severity', 'alert_type')
+                    if alert[fname] != vals[fname]
+                }
+                if not alert.is_active and not alert.dismissed:
+                    changes['is_active'] = True
+                if changes:
+                    alert.write(changes)
+                    updated += 1
+
+        resolved = (existing - seen).filtered(lambda a: a.is_active or a.dismissed)
+        if resolved:
+            resolved.write({'is_active': False, 'dismissed': False})
+        if to_create:
+            AlertModel.create(to_create)
+        return {'created': len(to_create), 'updated': updated, 'resolved': len(resolved)}
+
+    # =====================================================
+    # TEXTOS DE REGLAS DE TIEMPO (compartidos con el barrido)
+    # =====================================================
+
+    @api.model
+    def _no_progress_message(self, stage_name, days_limit, has_progress):
+        """Mensaje de la Regla 3 (con o sin avances previos)."""
+        if has_progress:
+            return _('La etapa "%s" no tiene avances registrados en los últimos %d días.') % (
+                stage_name, days_limit)
+        return _('La etapa "%s" inició hace más de %d días y aún no registra avances.') % (
+            stage_name, days_limit)
+
+    @api.model
+    def _no_progress_rule_code(self, stage_id, has_progress):
+        """Código de la Regla 3 por etapa."""
+        if has_progress:
+            return 'RULE_03_NO_PROGRESS_%d' % stage_id
+        return 'RULE_03_NO_START_PROGRESS_%d' % stage_id
+
+    @api.model
+    def _overdue_message(self, count):
+        """Mensaje de la regla heredada de etapas vencidas."""
+        return _('Etapas vencidas: %d') % count
+
+    # =====================================================
+    # BARRIDO PROGRAMADO DE REGLAS DE TIEMPO
+    # =====================================================
+
+    @api.model
+    def sweep_time_rules(self):
+        """
+        Evalúa las reglas de tiempo (Regla 3 y etapas vencidas) de todas
+        las obras en ejecución en una pasada set-based:
+
+        1. Una consulta con las etapas que cumplen alguna condición
+           (índices de last_progress_date, date_start y date_deadline).
+        2. Un _sync_alerts restringido a esas reglas para todas las obras.
+
+        Returns:
+            dict: métricas del barrido (obras, etapas, created, updated,
+            resolved, ms).
+        """
+        started = time.monotonic()
+        cr = self.env.cr
+        self.env['building.work'].flush_model(['state', 'days_without_progress'])
+        self.env['building.work.alert.threshold'].flush_model()
+        self.env['building.work.stage'].flush_model([
+            'work_id', 'name', 'state', 'last_progress_date', 'date_start', 'date_deadline',
+        ])
+        cr.execute(SQL("SELECT id FROM building_work WHERE state = 'running'"))
+        work_ids = [row[0] for row in cr.fetchall()]
+        desired = {work_id: [] for work_id in work_ids}
+        stage_count = 0
+
+        if work_ids:
+            cr.execute(SQL(
+                """
+                WITH limits AS (
+                    SELECT w.id AS work_id,
+                           COALESCE(trunc(t.value)::int, NULLIF(w.days_without_progress, 0), 7) AS days_limit
+                      FROM building_work w
+                      LEFT JOIN building_work_alert_threshold t
+                             ON t.work_id = w.id AND t.rule_key = 'stage_no_progress'
+                     WHERE w.id = ANY(%(works)s)
+                )
+                SELECT s.id, s.work_id, s.name, s.last_progress_date IS NOT NULL,
+                       s.state = 'in_progress'
+                           AND COALESCE(s.last_progress_date, s.date_start::timestamp, s.write_date)
+                               < %(now)s - make_interval(days => l.days_limit),
+                       s.state != 'done' AND s.date_deadline < %(today)s,
+                       l.days_limit
+                  FROM building_work_stage s
+                  JOIN limits l ON l.work_id = s.work_id
+                 WHERE (s.state = 'in_progress'
+                        AND COALESCE(s.last_progress_date, s.date_start::timestamp, s.write_date)
+                            < %(now)s - make_interval(days => l.days_limit))
+                    OR (s.state != 'done' AND s.date_deadline < %(today)s)
+                """,
+                works=work_ids,
+                now=fields.Datetime.now(),
+                today=fields.Date.context_today(self),
+            ))
+            overdue = {}
+            for stage_id, work_id, name, has_progress, stalled, is_overdue, days_limit in cr.fetchall():
+                stage_count += 1
+                if stalled:
+                    desired[work_id].append(self._alert_vals(
+                        work_id,
+                        self._no_progress_message(name, days_limit, has_progress),
+                        'warning', 'operational',
+                        self._no_progress_rule_code(stage_id, has_progress),
+                    ))
+                if is_overdue:
+                    overdue[work_id] = overdue.get(work_id, 0) + 1
+            for work_id, count in overdue.items():
+                desired[work_id].append(self._alert_vals(
+                    work_id, self._overdue_message(count),
+                    'critical', 'time', 'LEGACY_OVERDUE_STAGES',
+                ))
+
+        works = self.env['building.work'].browse(work_ids)
+        metrics = self._sync_alerts(works, desired, rule_domain=TIME_RULE_DOMAIN)
+        metrics.update(works=len(work_ids), stages=stage_count,
+                       ms=int((time.monotonic() - started) * 1000))
+        _logger.info(
+            "building.alert.engine: barrido de reglas de tiempo en %(ms)d ms "
+            "(%(works)d obras, %(stages)d etapas; %(created)d creadas, "
+            "%(updated)d actualizadas, %(resolved)d resueltas)", metrics,
+        )
+        return metrics
+
+    @api.model
+    def _cron_sweep_time_rules(self):
+        """Cron: barrido de reglas de tiempo."""
+        self.sweep_time_rules()
+
+    @api.model
+    def _alert_vals(self, work_id, name, severity, alert_type, rule_code):
+        """Valores de una alerta activa."""
+        return {
+            'work_id': work_id,
+            'name': name,
+            'severity': severity,
+            'alert_type': alert_type,
+            'rule_code': rule_code,
+            'is_active': True,
+        }
+
+    # =====================================================
+    # REGISTRO DECLARATIVO DE REGLAS
+    # =====================================================
+
+    @api.model
+    def _get_alert_rules(self):
+        """
+        Registro de reglas de alerta.
+
+        Cada regla es un dict con:
+            key: identificador estable (umbrales por obra en
+                 building.work.alert.threshold).
+            name: nombre visible de la regla.
+            method: método evaluador, firma (work, data, threshold) -> [vals].
+            sources: conjuntos de datos que necesita ('work', 'stages',
+                     'budget'); cada uno se carga una sola vez por lote.
+            threshold_field: campo de la obra con el umbral (opcional).
+            default_threshold: umbral si no hay campo ni ajuste (opcional).
+
+        Otros módulos agregan reglas heredando el motor y extendiendo la
+        lista con super(), sin tocar la evaluación.
+        """
+        return [
+            {'key': 'budget_not_validated', 'name': _('R1: Presupuesto no validado'),
+             'method': '_rule_budget_not_validated', 'sources': ('budget',)},
+            {'key': 'financial_exceeds_physical', 'name': _('R2: Avance financiero > físico'),
+             'method': '_rule_financial_exceeds_physical', 'sources': ('work',),
+             'threshold_field': 'financial_tolerance', 'default_threshold': 5.0},
+            {'key': 'stage_no_progress', 'name': _('R3: Etapa activa sin avance (días)'),
+             'method': '_rule_stage_no_progress', 'sources': ('stages',),
+             'threshold_field': 'days_without_progress', 'default_threshold': 7},
+            {'key': 'stage_delayed', 'name': _('R4: Etapa retrasada vs planeación (%)'),
+             'method': '_rule_stage_delayed', 'sources': ('stages',),
+             'default_threshold': 10.0},
+            {'key': 'advances_exceed_client', 'name': _('R5: Anticipos > anticipo del cliente'),
+             'method': '_rule_advances_exceed_client', 'sources': ('work', 'budget')},
+            {'key': 'budget_exceeded', 'name': _('Exceso sobre presupuesto'),
+             'method': '_rule_budget_exceeded', 'sources': ('work',)},
+            {'key': 'stages_to_approve', 'name': _('Etapas por aprobar'),
+             'method': '_rule_stages_to_approve', 'sources': ('stages',)},
+            {'key': 'overdue_stages', 'name': _('Etapas vencidas'),
+             'method': '_rule_overdue_stages', 'sources': ('stages',)},
+            {'key': 'sat_cancelled', 'name': _('Factura aplicada cancelada en el SAT'),
+             'method': '_rule_sat_cancelled', 'sources': ('sat',)},
+        ]
+
+    @api.model
+    def _evaluate_rules(self, works):
+        """
+        Evalúa todas las reglas registradas para un lote de obras.
+
+        Cada fuente de datos pedida por alguna regla se carga una sola vez
+        para todo el lote (_load_<fuente>), igual que los umbrales por obra;
+        después cada regla se evalúa contra esos datos sin consultar más.
+
+        Returns:
+            dict: {work_id: [valores de las alertas que deben estar activas]}
+        """
+        rules = self._get_alert_rules()
+        sources = {source for rule in rules for source in rule.get('sources', ())}
+        datasets = {source: getattr(self, '_load_%s' % source)(works) for source in sorted(sources)}
+        overrides = self._load_thresholds(works)
+
+        result = {}
+        for work in works:
+            data = {source: dataset.get(work.id) for source, dataset in datasets.items()}
+            alerts = result[work.id] = []
+            for rule in rules:
+                threshold = self._get_threshold(rule, work, overrides)
+                alerts.extend(getattr(self, rule['method'])(work, data, threshold) or [])
+        return result
+
+    @api.model
+    def _get_threshold(self, rule, work, overrides):
+        """Umbral de la regla: ajuste de la obra > campo de la obra > por defecto."""
+        if (work.id, rule['key']) in overrides:
+            return overrides[(work.id, rule['key'])]
+        value = work[rule['threshold_field']] if rule.get('threshold_field') else False
+        return value or rule.get('default_threshold')
+
+    # === FUENTES DE DATOS (una carga por lote) ===
+
+    @api.model
+    def _load_thresholds(self, works):
+        """Umbrales ajustados por obra: {(work_id, rule_key): valor}."""
+        records = self.env['building.work.alert.threshold'].search([('work_id', 'in', works.ids)])
+        return {(rec.work_id.id, rec.rule_key): rec.value for rec in records}
+
+    @api.model
+    def _load_work(self, works):
+        """KPIs almacenados de las obras (una lectura): {work_id: work}."""
+        works.fetch([
+            'financial_progress', 'overall_progress', 'budget_total', 'amount_committed',
+            'amount_paid', 'client_advance_planned', 'financial_tolerance', 'days_without_progress',
+        ])
+        return {work.id: work for work in works}
+
+    @api.model
+    def _load_stages(self, works):
+        """Etapas de las obras (una búsqueda): {work_id: etapas}."""
+        Stage = self.env['building.work.stage']
+        result = {work.id: Stage for work in works}
+        for stage in Stage.search([('work_id', 'in', works.ids)]):
+            result[stage.work_id.id] |= stage
+        return result
+
+    @api.model
+    def _load_budget(self, works):
+        """
+        Presupuesto activo y suma de anticipos de sus capítulos (una
+        agrupación): {work_id: {'budget': presupuesto, 'advances': monto}}.
+        """
+        budgets = {work.id: work._get_active_budget() for work in works}
+        budget_ids = [budget.id for budget in budgets.values() if budget]
+        advances = dict(self.env['building.budget.chapter']._read_group(
+            [('budget_id', 'in', budget_ids)],
+            groupby=['budget_id'],
+            aggregates=['total_advance:sum'],
+        )) if budget_ids else {}
+        return {
+            work_id: {'budget': budget, 'advances': advances.get(budget, 0.0) or 0.0}
+            for work_id, budget in budgets.items()
+        }
+
+    @api.model
+    def _load_sat(self, works):
+        """
+        Facturas aplicadas (distribuciones activas) canceladas en el SAT
+        (una búsqueda): {work_id: facturas}.
+        """
+        Move = self.env['account.move']
+        result = {work.id: Move for work in works}
+        lines = self.env['building.bill.allocation.line'].sudo().search([
+            ('work_id', 'in', works.ids),
+            ('allocation_id.state', '=', 'active'),
+            ('allocation_id.move_id.l10n_mx_cfdi_sat_status', '=', 'cancelled'),
+        ])
+        for line in lines:
+            result[line.work_id.id] |= line.allocation_id.move_id
+        return result
+
+    # === REGLAS ===
+
+    def _rule_budget_not_validated(self, work, data, threshold):
+        """
+        REGLA 1: PRESUPUESTO NO VALIDADO
+        Condición: Si el presupuesto no está en estado 'validated'
+        Severidad: Advertencia | Tipo: Planeación
+        """
+        budget = data['budget']['budget']
         if budget and budget.state != 'validated':
-            alerts_to_create.append({
-                'work_id': work.id,
-                'name': _('El presupuesto aún no está validado.'),
-                'severity': 'warning',
-                'alert_type': 'planning',
-                'rule_code': 'RULE_01_BUDGET_NOT_VALIDATED',
-                'is_active': True,
-            })
-        
-        # =====================================================
-        # REGLA 2: AVANCE FINANCIERO > AVANCE FÍSICO + TOLERANCIA
-        # Condición: financial_progress > overall_progress + tolerancia
-        # Severidad: Crítica | Tipo: Financiera
-        # =====================================================
-        # IMPORTANTE: Asegurarse de que los valores de work estén frescos
-        # work.invalidate_recordset(['financial_progress', 'overall_progress']) 
-        # (Opcional, pero recomendable si venimos de un write reciente)
-        
-        tolerance = work.financial_tolerance or 5.0
-        if work.financial_progress > (work.overall_progress + tolerance):
-            alerts_to_create.append({
-                'work_id': work.id,
-                'name': _('El gasto va más rápido que el avance físico. (Financiero: %.1f%% vs Físico: %.1f%%)') % (
+            return [self._alert_vals(work.id, _('El presupuesto aún no está validado.'),
+                                     'warning', 'planning', 'RULE_01_BUDGET_NOT_VALIDATED')]
+        return []
+
+    def _rule_financial_exceeds_physical(self, work, data, threshold):
+        """
+        REGLA 2: AVANCE FINANCIERO > AVANCE FÍSICO + TOLERANCIA
+        Condición: financial_progress > overall_progress + tolerancia
+        Severidad: Crítica | Tipo: Financiera
+
+        financial_progress es almacenado: el ORM lo recalcula al cambiar
+        presupuesto, comprometido o pagado, aquí solo se lee la columna.
+        """
+        if work.financial_progress > (work.overall_progress + threshold):
+            return [self._alert_vals(
+                work.id,
+                _('El gasto va más rápido que el avance físico. (Financiero: %.1f%% vs Físico: %.1f%%)') % (
                     work.financial_progress, work.overall_progress
-                ),
-                'severity': 'critical',
-                'alert_type': 'financial',
-                'rule_code': 'RULE_02_FINANCIAL_EXCEEDS_PHYSICAL',
-                'is_active': True,
-            })
-        
-        # =====================================================
-        # REGLA 3: ETAPA ACTIVA SIN AVANCE
-        # Condición: Etapa en 'in_progress' sin avance en X días
-        # Severidad: Advertencia | Tipo: Operativa
-        # =====================================================
-        days_limit = work.days_without_progress or 7
+                ), 'critical', 'financial', 'RULE_02_FINANCIAL_EXCEEDS_PHYSICAL')]
+        return []
+
+    def _rule_stage_no_progress(self, work, data, threshold):
+        """
+        REGLA 3: ETAPA ACTIVA SIN AVANCE
+        Condición: Etapa en 'in_progress' sin avance en X días
+        Severidad: Advertencia | Tipo: Operativa
+
+        Si tiene avance, se revisa la fecha del último avance. Sin avance,
+        el tiempo desde el inicio de la etapa (holgura inicial); si no tiene
+        date_start se usa write_date (fecha de cambio de estado aprox).
+        """
+        days_limit = int(threshold)
         threshold_datetime = fields.Datetime.now() - timedelta(days=days_limit)
-        
-        for stage in work.stage_ids.filtered(lambda s: s.state == 'in_progress'):
-            # Si tiene avance, revisar fecha del último avance
-            if stage.last_progress_date:
-                if stage.last_progress_date < threshold_datetime:
-                   alerts_to_create.append({
-                        'work_id': work.id,
-                        'name': _('La etapa "%s" no tiene avances registrados en los últimos %d días.') % (
-                            stage.name, days_limit
-                        ),
-                        'severity': 'warning',
-                        'alert_type': 'operational',
-                        'rule_code': 'RULE_03_NO_PROGRESS_%d' % stage.id,
-                        'is_active': True,
-                    })
-            else:
-                # Si NO tiene avance, verificar tiempo desde el inicio de la etapa (holgura inicial)
-                # Si no tiene date_start, usamos write_date (fecha de cambio de estado aprox)
-                reference_date = stage.date_start or stage.write_date
-                # Convertir a datetime si es date
-                if reference_date:
-                     # Asegurar compatibilidad de tipos (datetime vs date)
-                    ref_dt = fields.Datetime.to_datetime(reference_date)
-                    if ref_dt < threshold_datetime:
-                        alerts_to_create.append({
-                            'work_id': work.id,
-                            'name': _('La etapa "%s" inició hace más de %d días y aún no registra avances.') % (
-                                stage.name, days_limit
-                            ),
-                            'severity': 'warning',
-                            'alert_type': 'operational',
-                            'rule_code': 'RULE_03_NO_START_PROGRESS_%d' % stage.id,
-                            'is_active': True,
-                        })
-        
-        # =====================================================
-        # REGLA 4: ETAPA RETRASADA VS PLANEACIÓN
-        # Condición: avance_real < avance_esperado según fechas
-        # Severidad: Advertencia | Tipo: Operativa
-        # =====================================================
-        for stage in work.stage_ids.filtered(lambda s: s.state == 'in_progress'):
-            # Solo si tiene fechas planeadas y el avance real es menor al esperado
-            if stage.planned_progress > 0 and stage.progress_pct < (stage.planned_progress - 10):
-                alerts_to_create.append({
-                    'work_id': work.id,
-                    'name': _('La etapa "%s" presenta retraso respecto a la planeación. (Real: %.1f%% vs Esperado: %.1f%%)') % (
+        result = []
+        for stage in data['stages'].filtered(lambda s: s.state == 'in_progress'):
+            has_progress = bool(stage.last_progress_date)
+            reference_date = stage.last_progress_date or stage.date_start or stage.write_date
+            if reference_date and fields.Datetime.to_datetime(reference_date) < threshold_datetime:
+                result.append(self._alert_vals(
+                    work.id, self._no_progress_message(stage.name, days_limit, has_progress),
+                    'warning', 'operational', self._no_progress_rule_code(stage.id, has_progress)))
+        return result
+
+    def _rule_stage_delayed(self, work, data, threshold):
+        """
+        REGLA 4: ETAPA RETRASADA VS PLANEACIÓN
+        Condición: avance_real < avance_esperado - tolerancia (puntos)
+        Severidad: Advertencia | Tipo: Operativa
+        """
+        result = []
+        for stage in data['stages'].filtered(lambda s: s.state == 'in_progress'):
+            if stage.planned_progress > 0 and stage.progress_pct < (stage.planned_progress - threshold):
+                result.append(self._alert_vals(
+                    work.id,
+                    _('La etapa "%s" presenta retraso respecto a la planeación. (Real: %.1f%% vs Esperado: %.1f%%)') % (
                         stage.name, stage.progress_pct, stage.planned_progress
-                    ),
-                    'severity': 'warning',
-                    'alert_type': 'operational',
-                    'rule_code': 'RULE_04_STAGE_DELAYED_%d' % stage.id,
-                    'is_active': True,
-                })
-        
-        # =====================================================
-        # REGLA 5: ANTICIPOS PLANEADOS > ANTICIPO DEL CLIENTE
-        # Condición: suma_anticipos_partidas > anticipo_cliente_planeado
-        # Severidad: Informativa | Tipo: Liquidez
-        # =====================================================
-        if budget and work.client_advance_planned > 0:
-            total_advances = sum(budget.chapter_ids.mapped('total_advance'))
-            if total_advances > work.client_advance_planned:
-                alerts_to_create.append({
-                    'work_id': work.id,
-                    'name': _('Los anticipos planeados ($%.2f) superan el anticipo del cliente ($%.2f).') % (
-                        total_advances, work.client_advance_planned
-                    ),
-                    'severity': 'info',
-                    'alert_type': 'liquidity',
-                    'rule_code': 'RULE_05_ADVANCES_EXCEED_CLIENT',
-                    'is_active': True,
-                })
-        
-        # =====================================================
-        # REGLAS HEREDADAS (mantener compatibilidad)
-        # =====================================================
-        
-        # Exceso sobre presupuesto (ya existía)
-        if work.budget_total > 0:
-            total_gastado = work.amount_committed + work.amount_paid
-            if total_gastado > work.budget_total:
-                alerts_to_create.append({
-                    'work_id': work.id,
-                    'name': _('Exceso sobre presupuesto: comprometido/pagado supera el total.'),
-                    'severity': 'critical',
-                    'alert_type': 'budget',
-                    'rule_code': 'LEGACY_BUDGET_EXCEEDED',
-                    'is_active': True,
-                })
-        
-        # Etapas pendientes de aprobación (ya existía)
-        stages_to_approve = work.stage_ids.filtered(lambda s: s.state == 'to_approve')
+                    ), 'warning', 'operational', 'RULE_04_STAGE_DELAYED_%d' % stage.id))
+        return result
+
+    def _rule_advances_exceed_client(self, work, data, threshold):
+        """
+        REGLA 5: ANTICIPOS PLANEADOS > ANTICIPO DEL CLIENTE
+        Condición: suma_anticipos_partidas > anticipo_cliente_planeado
+        Severidad: Informativa | Tipo: Liquidez
+        """
+        total_advances = data['budget']['advances']
+        if data['budget']['budget'] and work.client_advance_planned > 0 \
+                and total_advances > work.client_advance_planned:
+            return [self._alert_vals(
+                work.id,
+                _('Los anticipos planeados ($%.2f) superan el anticipo del cliente ($%.2f).') % (
+                    total_advances, work.client_advance_planned
+                ), 'info', 'liquidity', 'RULE_05_ADVANCES_EXCEED_CLIENT')]
+        return []
+
+    def _rule_budget_exceeded(self, work, data, threshold):
+        """Regla heredada: comprometido + pagado supera el presupuesto."""
+        if work.budget_total > 0 and (work.amount_committed + work.amount_paid) > work.budget_total:
+            return [self._alert_vals(work.id, _('Exceso sobre presupuesto: comprometido/pagado supera el total.'),
+                                     'critical', 'budget', 'LEGACY_BUDGET_EXCEEDED')]
+        return []
+
+    def _rule_stages_to_approve(self, work, data, threshold):
+        """Regla heredada: etapas pendientes de aprobación."""
+        stages_to_approve = data['stages'].filtered(lambda s: s.state == 'to_approve')
         if stages_to_approve:
-            alerts_to_create.append({
-                'work_id': work.id,
-                'name': _('Etapas por aprobar: %d') % len(stages_to_approve),
-                'severity': 'warning',
-                'alert_type': 'approval',
-                'rule_code': 'LEGACY_STAGES_TO_APPROVE',
-                'is_active': True,
-            })
-        
-        # Etapas vencidas (ya existía)
-        overdue_stages = work.stage_ids.filtered(lambda s: s.is_overdue)
+            return [self._alert_vals(work.id, _('Etapas por aprobar: %d') % len(stages_to_approve),
+                                     'warning', 'approval', 'LEGACY_STAGES_TO_APPROVE')]
+        return []
+
+    def _rule_overdue_stages(self, work, data, threshold):
+        """Regla heredada: etapas vencidas."""
+        overdue_stages = data['stages'].filtered(lambda s: s.is_overdue)
         if overdue_stages:
-            alerts_to_create.append({
-                'work_id': work.id,
-                'name': _('Etapas vencidas: %d') % len(overdue_stages),
-                'severity': 'critical',
-                'alert_type': 'time',
-                'rule_code': 'LEGACY_OVERDUE_STAGES',
-                'is_active': True,
-            })
-        
-        # Crear todas las alertas
-        if alerts_to_create:
-            AlertModel.create(alerts_to_create)
+            return [self._alert_vals(work.id, self._overdue_message(len(overdue_stages)),
+                                     'critical', 'time', 'LEGACY_OVERDUE_STAGES')]
+        return []
+
+    def _rule_sat_cancelled(self, work, data, threshold):
+        """
+        Factura de proveedor aplicada a la obra y cancelada en el SAT
+        (la detecta el barrido de revalidación SAT).
+        Severidad: Crítica | Tipo: Factura
+        """
+        return [
+            self._alert_vals(
+                work.id,
+                _('La factura %s (UUID %s) aplicada a la obra fue CANCELADA en el SAT.') % (
+                    move.display_name, move.l10n_mx_cfdi_uuid
+                ), 'critical', 'invoice', 'SAT_CANCELLED_%d' % move.id)
+            for move in data['sat']
+        ]
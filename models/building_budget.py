@@ -6,6 +6,9 @@ Entidad principal del presupuesto paramétrico.
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from odoo.tools import SQL
+
+from .distribution_engine import DISTRIBUTION_METHODS
 
 
 class BuildingBudget(models.Model):
@@ -116,6 +119,42 @@ class BuildingBudget(models.Model):
         for budget in self:
             budget.version_label = f"V{budget.version_no}" if budget.version_no > 0 else "Borrador"
 
+    distribution_version = fields.Integer(
+        string='Versión de Distribución',
+        default=0,
+        copy=False,
+        readonly=True,
+        help='Marca que cambia con cada escritura de la distribución por periodos '
+             '(filas o vectores); la usa el caché de planeado del flujo de efectivo'
+    )
+
+    def init(self):
+        # Secuencia no transaccional: una marca de una transacción revertida no se repite
+        self.env.cr.execute(SQL(
+            "CREATE SEQUENCE IF NOT EXISTS building_budget_distribution_version_seq"
+        ))
+
+    @api.model
+    def _bump_distribution_version(self, budget_ids):
+        """
+        Cambia la versión de distribución de los presupuestos (un UPDATE).
+
+        Va por SQL para no pasar por las protecciones de write (presupuestos
+        consolidados u obras finalizadas) ni recalcular la obra.
+        """
+        budget_ids = list({budget_id for budget_id in budget_ids if budget_id})
+        if not budget_ids:
+            return
+        self.env.cr.execute(SQL(
+            """
+            UPDATE building_budget
+               SET distribution_version = nextval('building_budget_distribution_version_seq')
+             WHERE id = ANY(%s)
+            """,
+            budget_ids,
+        ))
+        self.browse(budget_ids).invalidate_recordset(['distribution_version'])
+
     # === CAMPOS DE REAPERTURA ===
     reopened_by = fields.Many2one(
         'res.users',
@@ -137,6 +176,32 @@ class BuildingBudget(models.Model):
         help='Número de periodos (M1, M2, ..., MN) para distribución'
     )
 
+    date_start = fields.Date(
+        string='Inicio (M1)',
+        help='Mes al que corresponde el periodo M1 (flujo de efectivo). '
+             'Si está vacío se usa la fecha de creación del presupuesto.'
+    )
+
+    distribution_method = fields.Selection(
+        DISTRIBUTION_METHODS,
+        string='Método de Distribución',
+        default='uniform',
+        required=True,
+        help='Forma de repartir el importe de cada partida entre sus periodos (Distribuir Todo)'
+    )
+
+    compact_distribution = fields.Boolean(
+        string='Distribución Compacta',
+        default=False,
+        help='Guarda la distribución de cada partida como un vector (una fila por partida) '
+             'en lugar de una fila por periodo'
+    )
+
+    distribution_weights = fields.Char(
+        string='Pesos Personalizados',
+        help='Pesos separados por coma (ej. 10,20,40,20,10); se ajustan al rango de cada partida'
+    )
+
     # === RELACIONES ===
     chapter_ids = fields.One2many(
         'building.budget.chapter',
@@ -267,7 +332,7 @@ class BuildingBudget(models.Model):
         
         # Regenerar alertas de la obra (FASE 3.1)
         if self.work_id:
-            self.env['building.alert.engine'].rebuild_alerts(self.work_id.id)
+            self.env['building.alert.engine'].enqueue(self.work_id.id)
             # FASE 7: Transición automática de Obra a Planeación
             self.work_id.action_set_planning()
         
@@ -341,7 +406,7 @@ class BuildingBudget(models.Model):
         
         # Regenerar alertas de la obra (FASE 3.1)
         if self.work_id:
-            self.env['building.alert.engine'].rebuild_alerts(self.work_id.id)
+            self.env['building.alert.engine'].enqueue(self.work_id.id)
         
         return {
             'type': 'ir.actions.client',
@@ -441,12 +506,24 @@ class BuildingBudget(models.Model):
         }
 
 
+    def _get_distribution_weights(self):
+        """Pesos personalizados como lista de floats (método 'custom')."""
+        self.ensure_one()
+        if self.distribution_method != 'custom':
+            return None
+        try:
+            return [float(w) for w in (self.distribution_weights or '').split(',') if w.strip()]
+        except ValueError:
+            raise UserError(_('Los pesos personalizados deben ser números separados por coma.'))
+
     def action_distribute_all(self):
-        """Distribuye uniformemente todos los importes."""
+        """Distribuye todos los importes según el método del presupuesto (una pasada)."""
         self.ensure_one()
-        for chapter in self.chapter_ids:
-            for line in chapter.line_ids:
-                line.action_distribute_uniform()
+        self.env['building.distribution.engine'].distribute_lines(
+            self.chapter_ids.line_ids,
+            method=self.distribution_method,
+            custom_weights=self._get_distribution_weights(),
+        )
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
@@ -482,6 +559,17 @@ class BuildingBudget(models.Model):
             'context': {'default_budget_id': self.id},
         }
 
+    def action_view_period_distribution(self):
+        """Pivote de la distribución por periodo (filas y vectores compactos)."""
+        self.ensure_one()
+        return {
+            'name': _('Distribución por Periodo'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'building.budget.period.report',
+            'view_mode': 'pivot,list',
+            'domain': [('budget_id', '=', self.id)],
+        }
+
     def action_view_difference_lines(self):
         """Ver partidas con diferencia (Undistributed != 0)."""
         self.ensure_one()
@@ -509,7 +597,7 @@ class BuildingBudget(models.Model):
 
     # === SINCRONIZACIÓN CON OBRA ===
     def write(self, vals):
-        """Override write para forzar recálculo de KPIs en building.work."""
+        """Override write para marcar los KPIs de building.work (una vez por lote)."""
         # FASE 7: Bloquear edición si la obra está finalizada
         for budget in self:
             if budget.work_id.state == 'done':
@@ -519,13 +607,25 @@ class BuildingBudget(models.Model):
             if budget.budget_type == 'consolidated' and not (len(vals) == 1 and 'active' in vals) and not self.env.context.get('skip_consolidated_protection'):
                 raise UserError(_('Un presupuesto consolidado no puede editarse. Elimínelo y genere uno nuevo.'))
 
+        works = self.work_id
         result = super().write(vals)
-        # Forzar recálculo de KPIs en la obra después de cualquier cambio
-        for budget in self:
-            if budget.work_id:
-                budget.work_id._compute_budget_kpis()
-                budget.work_id._compute_amount_available()
-                budget.work_id._compute_financial_progress()
+        # Cambio de almacenamiento: convertir la distribución existente
+        if 'compact_distribution' in vals:
+            Engine = self.env['building.distribution.engine']
+            lines = self.chapter_ids.line_ids
+            if vals['compact_distribution']:
+                Engine.compact_lines(lines)
+            else:
+                Engine.expand_lines(lines)
+        # Obra anterior y nueva (por si cambia work_id)
+        (works | self.work_id)._mark_budget_kpis_dirty()
+        return result
+
+    def unlink(self):
+        """Override unlink para encolar el refresco de KPIs de portafolio."""
+        works = self.work_id
+        result = super().unlink()
+        self.env['building.work.kpi']._mark_dirty(works.ids)
         return result
 
     def action_archive(self):
@@ -586,9 +686,11 @@ class BuildingBudget(models.Model):
                 
                 # 4. Transferir DISTRIBUCION (Period Values)
                 # Asumimos que la asignada tiene la distribución "viva".
-                if assigned.period_value_ids:
+                if assigned.period_value_ids or assigned.distribution_vector:
                     base.period_value_ids.unlink() # Borrar la de la base
+                    base.distribution_vector = False
                     assigned.period_value_ids.write({'line_id': base.id}) # Mover la asignada
+                    base.distribution_vector = assigned.distribution_vector
                 
                 # 5. Borrar duplicado
                 # Antes de borrar, debemos resetear el avance físico en la línea asignada
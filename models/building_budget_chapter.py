@@ -77,7 +77,7 @@ class BuildingBudgetChapter(models.Model):
     def create(self, vals_list):
         """Asegura código consecutivo en creación inline y bloquea si está validado.
         
-        También fuerza recálculo de KPIs en building.work.
+        También marca los KPIs de building.work para recálculo.
         """
         for vals in vals_list:
             budget_id = vals.get('budget_id') or self.env.context.get('default_budget_id')
@@ -111,15 +111,7 @@ class BuildingBudgetChapter(models.Model):
                 vals['name'] = " ".join(vals.get('name').strip().split()).title()
         
         records = super().create(vals_list)
-        
-        # Forzar recálculo de KPIs en la obra
-        works = records.mapped('work_id')
-        for work in works:
-            if work:
-                work._compute_budget_kpis()
-                work._compute_amount_available()
-                work._compute_financial_progress()
-        
+        records.work_id._mark_budget_kpis_dirty()
         return records
 
 
@@ -269,10 +261,13 @@ class BuildingBudgetChapter(models.Model):
         }
 
     def action_distribute_chapter(self):
-        """Distribuye uniformemente todas las partidas del capítulo."""
+        """Distribuye todas las partidas del capítulo según el método del presupuesto."""
         self.ensure_one()
-        for line in self.line_ids:
-            line.action_distribute_uniform()
+        self.env['building.distribution.engine'].distribute_lines(
+            self.line_ids,
+            method=self.budget_id.distribution_method,
+            custom_weights=self.budget_id._get_distribution_weights(),
+        )
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
@@ -316,7 +311,7 @@ class BuildingBudgetChapter(models.Model):
     def unlink(self):
         """Bloquea eliminación si el presupuesto está validado.
         
-        También fuerza recálculo de KPIs en building.work.
+        También marca los KPIs de building.work para recálculo.
         """
         works = self.mapped('work_id')
         
@@ -327,21 +322,17 @@ class BuildingBudgetChapter(models.Model):
                     'Primero debe reabrir el presupuesto.'
                 ))
         
+        budgets = self.budget_id
         result = super().unlink()
-        
-        # Forzar recálculo después de eliminar
-        for work in works:
-            if work:
-                work._compute_budget_kpis()
-                work._compute_amount_available()
-                work._compute_financial_progress()
-        
+        works._mark_budget_kpis_dirty()
+        # Sus partidas y valores por periodo se borran en cascada
+        self.env['building.budget']._bump_distribution_version(budgets.ids)
         return result
 
     def write(self, vals):
         """Bloquea edición de campos importantes si el presupuesto está validado.
         
-        También fuerza recálculo de KPIs en building.work.
+        También marca los KPIs de building.work para recálculo.
         """
         # Campos protegidos cuando el presupuesto está validado
         protected_fields = {'name', 'code', 'sequence'}
@@ -355,13 +346,10 @@ class BuildingBudgetChapter(models.Model):
                         'Primero debe reabrir el presupuesto.'
                     ))
         
+        budgets = self.budget_id if 'budget_id' in vals else self.env['building.budget']
         result = super().write(vals)
-        
-        # Forzar recálculo de KPIs en la obra
-        for chapter in self:
-            if chapter.work_id:
-                chapter.work_id._compute_budget_kpis()
-                chapter.work_id._compute_amount_available()
-                chapter.work_id._compute_financial_progress()
-        
+        self.work_id._mark_budget_kpis_dirty()
+        if 'budget_id' in vals:
+            # Las partidas (y su distribución) cambian de presupuesto
+            self.env['building.budget']._bump_distribution_version((budgets | self.budget_id).ids)
         return result
@@ -160,6 +160,21 @@ class BuildingBudgetLine(models.Model):
         string='Valores por Periodo'
     )
 
+    # Distribución compacta: un vector por partida (índice 0 = M1) en lugar
+    # de una fila por periodo. La escribe el Motor de Distribución.
+    distribution_vector = fields.Json(
+        string='Distribución Compacta',
+        readonly=True,
+        copy=False,
+        help='Montos por periodo [M1, M2, ...] cuando el presupuesto usa distribución compacta'
+    )
+
+    distribution_preview = fields.Char(
+        string='Distribución',
+        compute='_compute_distribution_preview',
+        help='Resumen de la distribución compacta'
+    )
+
     # === CAMPOS COMPUTADOS (stored) ===
     total_distributed = fields.Float(
         string='Total Distribuido',
@@ -282,41 +297,32 @@ class BuildingBudgetLine(models.Model):
         ('red', 'Excedido'),
     ], string='Semáforo', compute='_compute_financial_data', store=True)
 
-    @api.depends('amount', 'real_line_ids.amount', 'work_id.real_source')
+    @api.depends(
+        'amount', 'real_line_ids.amount', 'real_line_ids.approval_state', 'real_line_ids.is_migrated',
+        'real_line_ids.date', 'work_id.real_source', 'work_id.real_cutover_date',
+    )
     def _compute_financial_data(self):
         """
         Calcula métricas financieras y semáforo.
         Utiliza building.financial.engine para lógica centralizada.
+
+        El gasto real de todo el lote sale de una consulta agrupada del engine
+        (mismas reglas de aprobación, migración y corte que get_real_amounts).
         """
         Engine = self.env['building.financial.engine']
         
-        # Obtener umbrales desde configuración (o defaults)
-        ICP = self.env['ir.config_parameter'].sudo()
-        thresh_warn = float(ICP.get_param('building.budget_real_threshold_warning', 90.0))
-        thresh_crit = float(ICP.get_param('building.budget_real_threshold_critical', 100.0))
+        # Obtener umbrales desde configuración (una lectura por transacción)
+        thresh_warn, thresh_crit = Engine.get_thresholds(default_warning=90.0)
+
+        # Registros nuevos (onchange) usan su origen, si lo tienen
+        line_ids = [line_id for line_id in self._origin.ids if line_id]
+        real_by_work = Engine.get_real_amounts_multi(
+            self._origin.work_id.ids, line_ids=line_ids,
+        ) if line_ids else {}
 
         for line in self:
-            # 1. Calcular Real (Delegar a lógica simple o motor si fuera complejo)
-            # Como tenemos real_line_ids, podemos sumar directo si "internal".
-            # Pero para consistencia con filtros de 'work.real_source', usamos el engine si es posible,
-            # o replicamos lógica simple aquí si el engine opera en batch.
-            # Para eficiencia en listados grandes, sumamos directo de la relación filtrando lo necesario.
-            
-            # NOTA: Si la fuente es 'accounting', esto podría requerir lógica más compleja.
-            # Por ahora asumimos fuente interna o contable mapeada en real_line_ids.
-            
-            # Suma simple de líneas reales (el motor ya filtra al crear/consultar, 
-            # pero aquí accedemos a la BD directamente para store=True).
-            # TODO: Refinar si real_source cambia dinámicamente.
-            
-            real = sum(line.real_line_ids.filtered(lambda r: not r.is_migrated).mapped('amount'))
-            # Nota: la logica de 'is_migrated' depende de si estamos leyendo de contabilidad o no.
-            # Si work.real_source == 'internal', sumamos todo. 
-            # Si work.real_source == 'accounting', sumamos account.move.line (v2).
-            
-            # Simplificación Fase 3.3.2: Usamos sum(amount) de real_line_ids presentes.
-            # El Financial Engine debe encargarse de popular/leer real_line_ids correctamente.
-            real = sum(line.real_line_ids.mapped('amount'))
+            # 1. Gasto real aprobado (respeta real_source / real_cutover_date de la obra)
+            real = real_by_work.get(line._origin.work_id.id, {}).get(line._origin.id, 0.0)
 
             line.real_total = real
             line.variance_amount = line.amount - real
@@ -350,11 +356,18 @@ class BuildingBudgetLine(models.Model):
             else:
                 line.period_to = 12
 
-    @api.depends('period_value_ids', 'period_value_ids.amount', 'amount', 'advance')
+    @api.depends('period_value_ids', 'period_value_ids.amount', 'distribution_vector', 'amount', 'advance')
     def _compute_distribution(self):
-        """Calcula totales de distribución y detecta advertencias."""
+        """Calcula totales de distribución y detecta advertencias.
+
+        Suma filas por periodo y vector compacto: solo uno de los dos está
+        lleno (el Motor de Distribución escribe uno y limpia el otro, y crear
+        filas sobre una partida compacta materializa antes su vector).
+        """
         for line in self:
-            line.total_distributed = sum(line.period_value_ids.mapped('amount'))
+            line.total_distributed = (
+                sum(line.period_value_ids.mapped('amount')) + sum(line.distribution_vector or [])
+            )
             line.amount_undistributed = line.amount - line.total_distributed
             
             # La diferencia debe considerar el anticipo (se resta del importe total)
@@ -362,6 +375,16 @@ class BuildingBudgetLine(models.Model):
             line.difference = distributable - line.total_distributed
             line.has_warning = abs(line.difference) > 0.01
 
+    @api.depends('distribution_vector')
+    def _compute_distribution_preview(self):
+        """Resumen legible del vector compacto (M1: monto · M2: monto ...)."""
+        for line in self:
+            line.distribution_preview = ' · '.join(
+                'M%d: %.2f' % (index + 1, amount)
+                for index, amount in enumerate(line.distribution_vector or [])
+                if amount
+            ) or False
+
     @api.depends('has_warning', 'difference')
     def _compute_warning_message(self):
         """Genera mensaje de advertencia (campo no almacenado)."""
@@ -410,7 +433,7 @@ class BuildingBudgetLine(models.Model):
     def create(self, vals_list):
         """Bloquea creación si el presupuesto está validado.
         
-        También fuerza recálculo de KPIs en building.work.
+        También marca los KPIs de building.work para recálculo.
         Aplica normalización (R2, R3).
         """
         for vals in vals_list:
@@ -432,25 +455,28 @@ class BuildingBudgetLine(models.Model):
         
         records = super().create(vals_list)
         
-        # Forzar recálculo de KPIs en la obra
-        works = records.mapped('work_id')
-        for work in works:
-            if work:
-                work._compute_budget_kpis()
-                work._compute_amount_available()
-                work._compute_financial_progress()
+        # KPIs de la obra: una marca por lote, recálculo en el flush
+        works = records.work_id
+        works._mark_budget_kpis_dirty()
+        self.env['building.budget']._bump_distribution_version(
+            records.filtered('distribution_vector').budget_id.ids
+        )
+        Engine = self.env['building.progress.engine']
+        with Engine.deferred_recompute():
+            for work in works:
                 # ENGINE: Lineas nuevas empiezan en 0, pero si tienen stage
                 # podrían afectar el promedio ponderedo (ahora más monto total).
-                self.env['building.progress.engine'].recompute_hierarchy(work.id)
+                Engine.mark_dirty(work.id)
         
         return records
 
     def unlink(self):
         """Bloquea eliminación si el presupuesto está validado.
         
-        También fuerza recálculo de KPIs en building.work.
+        También marca los KPIs de building.work para recálculo.
         """
         works = self.mapped('work_id')
+        budgets = self.budget_id
         
         for line in self:
             if line.state == 'validated' and not self.env.context.get('allow_stage_assignment_on_validated'):
@@ -475,21 +501,23 @@ class BuildingBudgetLine(models.Model):
         
         result = super().unlink()
         
-        # Forzar recálculo después de eliminar
-        for work in works:
-            if work:
-                work._compute_budget_kpis()
-                work._compute_amount_available()
-                work._compute_financial_progress()
+        # KPIs de la obra: una marca por lote, recálculo en el flush
+        works._mark_budget_kpis_dirty()
+        self.env['building.work.kpi']._mark_dirty(works.ids)
+        # Sus valores por periodo se borran en cascada
+        self.env['building.budget']._bump_distribution_version(budgets.ids)
+        Engine = self.env['building.progress.engine']
+        with Engine.deferred_recompute():
+            for work in works.filtered('id'):
                 # ENGINE: Recalcular pesos
-                self.env['building.progress.engine'].recompute_hierarchy(work.id)
+                Engine.mark_dirty(work.id)
         
         return result
 
     def write(self, vals):
         """Bloquea edición de campos importantes si el presupuesto está validado.
         
-        También fuerza recálculo de KPIs en building.work.
+        También marca los KPIs de building.work para recálculo.
         Aplica Normalización (R2, R3).
         """
         # Normalización
@@ -534,27 +562,31 @@ class BuildingBudgetLine(models.Model):
                         'Debe cancelar los avances antes de moverla o eliminarla de la etapa.'
                     ) % (line.name, line.physical_progress))
         
+        # Distribución (vector) o presupuesto de la partida: presupuesto anterior y nuevo
+        touches_distribution = 'distribution_vector' in vals or 'chapter_id' in vals
+        budgets = self.budget_id if touches_distribution else self.env['building.budget']
         result = super().write(vals)
         
-        # Forzar recálculo de KPIs en la obra y ENGINE
-        engine_needs_update = False
-        if 'amount' in vals or 'stage_id' in vals:
-            engine_needs_update = True
+        # KPIs de la obra: una marca por lote, recálculo en el flush
+        self.work_id._mark_budget_kpis_dirty()
+        if touches_distribution:
+            self.env['building.budget']._bump_distribution_version((budgets | self.budget_id).ids)
 
-        for line in self:
-            if line.work_id:
-                line.work_id._compute_budget_kpis()
-                line.work_id._compute_amount_available()
-                line.work_id._compute_financial_progress()
-
-                if engine_needs_update:
-                     self.env['building.progress.engine'].recompute_hierarchy(
-                         line.work_id.id,
-                         line_ids=[line.id]
-                     )
+        # ENGINE: solo si cambia el peso o la etapa de la partida
+        if 'amount' in vals or 'stage_id' in vals:
+            Engine = self.env['building.progress.engine']
+            with Engine.deferred_recompute():
+                for line in self.filtered('work_id'):
+                    # La cola deduplica: un recálculo por obra al final
+                    Engine.mark_dirty(line.work_id.id, line_ids=[line.id])
         
         return result
 
+    def load(self, fields, data):
+        """Importación masiva: difiere el recálculo de avance al final de la carga."""
+        with self.env['building.progress.engine'].deferred_recompute():
+            return super().load(fields, data)
+
     # === ACCIONES ===
     def action_distribute_uniform(self):
         """Distribuye el importe uniformemente entre los periodos seleccionados."""
@@ -562,41 +594,9 @@ class BuildingBudgetLine(models.Model):
         if not self.budget_id or self.budget_id.duration_months <= 0:
             return False
 
-        # Validar períodos
-        period_from = self.period_from or 1
-        period_to = self.period_to or self.budget_id.duration_months
-        
-        # Asegurar que period_to no exceda la duración
-        if period_to > self.budget_id.duration_months:
-            period_to = self.budget_id.duration_months
-        
-        # Asegurar que period_from sea válido
-        if period_from < 1:
-            period_from = 1
-        if period_from > period_to:
-            period_from = period_to
+        # Motor de Distribución: reemplazo masivo de los valores por periodo
+        self.env['building.distribution.engine'].distribute_lines(self, method='uniform')
 
-        # Eliminar valores existentes
-        self.period_value_ids.unlink()
-
-        # Calcular cantidad de períodos a distribuir
-        num_periods = period_to - period_from + 1
-        
-        # Calcular monto por periodo (importe - anticipo)
-        distributable = self.amount - self.advance
-        amount_per_period = distributable / num_periods if num_periods > 0 else 0
-
-        # Crear valores solo para los periodos seleccionados
-        period_vals = []
-        for i in range(period_from, period_to + 1):
-            period_vals.append({
-                'line_id': self.id,
-                'period_number': i,
-                'amount': amount_per_period,
-            })
-
-        self.env['building.budget.period.value'].create(period_vals)
-        
         # Recargar el modal para mostrar la distribución
         return self.action_open_distribution()
 
@@ -604,11 +604,18 @@ class BuildingBudgetLine(models.Model):
         """Limpia la distribución de periodos."""
         self.ensure_one()
         self.period_value_ids.unlink()
+        self.distribution_vector = False
         
         # Recargar el modal para mostrar el cambio
         return self.action_open_distribution()
 
 
+    def action_expand_distribution(self):
+        """Convierte la distribución compacta en filas editables por periodo."""
+        self.ensure_one()
+        self.env['building.distribution.engine'].expand_lines(self)
+        return self.action_open_distribution()
+
     def action_open_distribution(self):
         """Abre vista para editar partida y distribución por periodos.
         
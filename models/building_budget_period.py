@@ -56,7 +56,8 @@ class BuildingBudgetPeriodValue(models.Model):
     budget_id = fields.Many2one(
         related='line_id.budget_id',
         store=True,
-        readonly=True
+        readonly=True,
+        index=True
     )
 
     line_name = fields.Char(
@@ -91,6 +92,9 @@ class BuildingBudgetPeriodValue(models.Model):
             line = self[0].line_id
             if line:
                 line.action_distribute_uniform()
+                if line.distribution_vector:
+                    # Presupuesto compacto: no hay filas que listar
+                    return line.action_open_distribution()
                 # Retornar acción para recargar la vista
                 return {
                     'type': 'ir.actions.act_window',
@@ -104,39 +108,42 @@ class BuildingBudgetPeriodValue(models.Model):
         return True
 
     # === SINCRONIZACIÓN CON OBRA ===
+    def _expand_compact_lines(self, line_ids):
+        """
+        Materializa como filas el vector compacto de las partidas indicadas
+        antes de agregarles filas: una partida nunca tiene ambas
+        representaciones (total_distributed suma las dos).
+        """
+        lines = self.env['building.budget.line'].browse(
+            {line_id for line_id in line_ids if line_id}
+        ).filtered('distribution_vector')
+        if lines:
+            self.env['building.distribution.engine'].expand_lines(lines)
+
     @api.model_create_multi
     def create(self, vals_list):
-        """Override create para forzar recálculo de KPIs en building.work."""
+        """Override create para marcar los KPIs de building.work (una vez por lote)."""
+        self._expand_compact_lines([vals.get('line_id') for vals in vals_list])
         records = super().create(vals_list)
-        # Forzar recálculo de KPIs en la obra
-        works = records.mapped('line_id.work_id')
-        for work in works:
-            if work:
-                work._compute_budget_kpis()
-                work._compute_amount_available()
-                work._compute_financial_progress()
+        records.line_id.work_id._mark_budget_kpis_dirty()
+        self.env['building.budget']._bump_distribution_version(records.budget_id.ids)
         return records
 
     def write(self, vals):
-        """Override write para forzar recálculo de KPIs en building.work."""
+        """Override write para marcar los KPIs de building.work (una vez por lote)."""
+        if vals.get('line_id'):
+            self._expand_compact_lines([vals['line_id']])
+        budgets = self.budget_id
         result = super().write(vals)
-        # Forzar recálculo de KPIs en la obra
-        works = self.mapped('line_id.work_id')
-        for work in works:
-            if work:
-                work._compute_budget_kpis()
-                work._compute_amount_available()
-                work._compute_financial_progress()
+        self.line_id.work_id._mark_budget_kpis_dirty()
+        self.env['building.budget']._bump_distribution_version((budgets | self.budget_id).ids)
         return result
 
     def unlink(self):
-        """Override unlink para forzar recálculo de KPIs en building.work."""
-        works = self.mapped('line_id.work_id')
+        """Override unlink para marcar los KPIs de building.work (una vez por lote)."""
+        works = self.line_id.work_id
+        budgets = self.budget_id
         result = super().unlink()
-        # Forzar recálculo después de eliminar
-        for work in works:
-            if work:
-                work._compute_budget_kpis()
-                work._compute_amount_available()
-                work._compute_financial_progress()
+        works._mark_budget_kpis_dirty()
+        self.env['building.budget']._bump_distribution_version(budgets.ids)
         return result
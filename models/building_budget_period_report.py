@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Reporte: Distribución por Periodo (building.budget.period.report)
+
+Vista SQL de solo lectura con una fila por (partida, periodo) sin importar
+cómo se guarda la distribución: filas de building.budget.period.value o
+vector compacto (building.budget.line.distribution_vector, índice 0 = M1).
+Alimenta la lista y el pivote de distribución por periodo.
+"""
+
+from odoo import models, fields
+from odoo.tools import SQL
+
+
+class BuildingBudgetPeriodReport(models.Model):
+    """Distribución por periodo unificada (filas + vector compacto)."""
+    _name = 'building.budget.period.report'
+    _description = 'Distribución por Periodo (Reporte)'
+    _auto = False
+    _order = 'budget_id, line_id, period_number'
+    # Campos que se escriben a la base antes de leer la vista
+    _depends = {
+        'building.budget.period.value': ['line_id', 'period_number', 'amount'],
+        'building.budget.line': ['chapter_id', 'budget_id', 'work_id', 'distribution_vector'],
+    }
+
+    line_id = fields.Many2one('building.budget.line', string='Partida', readonly=True)
+    chapter_id = fields.Many2one('building.budget.chapter', string='Capítulo', readonly=True)
+    budget_id = fields.Many2one('building.budget', string='Presupuesto', readonly=True)
+    work_id = fields.Many2one('building.work', string='Obra', readonly=True)
+    period_number = fields.Integer(string='# Periodo', readonly=True)
+    period_name = fields.Char(string='Periodo', readonly=True)
+    amount = fields.Float(string='Monto', readonly=True)
+    storage = fields.Selection([
+        ('rows', 'Por Periodo'),
+        ('compact', 'Compacta'),
+    ], string='Almacenamiento', readonly=True)
+
+    def init(self):
+        self.env.cr.execute(SQL(
+            """
+            CREATE OR REPLACE VIEW %(view)s AS (
+                SELECT row_number() OVER (ORDER BY d.line_id, d.period_number, d.storage) AS id,
+                       d.line_id, l.chapter_id, l.budget_id, l.work_id,
+                       d.period_number, 'M' || d.period_number AS period_name,
+                       d.amount, d.storage
+                  FROM (
+                        SELECT pv.line_id, pv.period_number, pv.amount, 'rows' AS storage
+                          FROM building_budget_period_value pv
+                        UNION ALL
+                        SELECT l.id, v.ordinality::int, v.amount::float8, 'compact'
+                          FROM building_budget_line l,
+                               jsonb_array_elements_text(l.distribution_vector)
+                                   WITH ORDINALITY AS v(amount, ordinality)
+                         WHERE jsonb_typeof(l.distribution_vector) = 'array'
+                           AND v.amount::float8 <> 0
+                       ) d
+                  JOIN building_budget_line l ON l.id = d.line_id
+            )
+            """,
+            view=SQL.identifier(self._table),
+        ))
@@ -107,47 +107,37 @@ class BuildingBudgetProgress(models.Model):
     @api.constrains('percent_accumulated')
     def _check_accumulated_limit(self):
         """El acumulado no puede exceder 100%."""
-        for record in self:
-            if record.state == 'confirmed' and record.percent_accumulated > 100.01: # Tolerancia flotante
+        confirmed = self.filtered(lambda r: r.state == 'confirmed')
+        if not confirmed:
+            return
+        # Mismo agregado que el cómputo: el total de la partida es su máximo acumulado
+        _running, totals = self.env['building.progress.engine']._get_running_totals(
+            self._name, 'line_id', 'percent_period', confirmed.line_id.ids,
+        )
+        for record in confirmed:
+            total = totals.get(record.line_id.id, 0.0)
+            if total > 100.01: # Tolerancia flotante
                 raise ValidationError(_(
-                    'El avance acumulado no puede exceder el 100%.\n'
+                    'El avance acumulado no puede exceder el 100%%.\n'
                     'Acumulado calculado: %.2f%%'
-                ) % record.percent_accumulated)
+                ) % total)
 
     # === COMPUTED FIELDS ===
     @api.depends('line_id', 'date', 'state', 'percent_period')
     def _compute_accumulated(self):
-        """Calcula el acumulado histórico hasta este registro."""
+        """Calcula el acumulado histórico hasta este registro (una consulta para todo el lote)."""
+        running, totals = self.env['building.progress.engine']._get_running_totals(
+            self._name, 'line_id', 'percent_period', self.line_id.ids,
+        )
         for record in self:
             if record.state == 'cancelled':
-                # Si está cancelado, mostramos lo que "habría sido" o 0?
-                # Mejor 0 para no confundir, o el valor del registro anterior?
                 # Regla: Cancelado no suma.
                 record.percent_accumulated = 0.0
-                continue
-
-            # Buscar registros anteriores o iguales de la misma partida activos
-            domain = [
-                ('line_id', '=', record.line_id.id),
-                ('state', '=', 'confirmed'),
-                '|', ('date', '<', record.date),
-                     '&', ('date', '=', record.date), ('id', '<=', record.id) 
-                     # Nota: si es NewId, id es falso, cuidado.
-                     # Al crear, compute corre antes de tener ID.
-            ]
-            
-            # Si es new record (id es False o NewId), sumar todo lo guardado + este valor
-            if not record.id:
-                 previous = self.search([
-                     ('line_id', '=', record.line_id.id),
-                     ('state', '=', 'confirmed')
-                 ])
-                 total = sum(previous.mapped('percent_period')) + record.percent_period
+            elif record.id in running:
+                record.percent_accumulated = running[record.id]
             else:
-                 previous = self.search(domain)
-                 total = sum(previous.mapped('percent_period'))
-            
-            record.percent_accumulated = total
+                # Registro nuevo (NewId): todo lo guardado + este valor
+                record.percent_accumulated = totals.get(record.line_id.id, 0.0) + record.percent_period
 
     @api.depends('line_id.code', 'date', 'percent_period')
     def _compute_display_name(self):
@@ -174,18 +164,31 @@ class BuildingBudgetProgress(models.Model):
         self._trigger_engine_update()
         return res
 
+    def unlink(self):
+        """Override unlink para encolar el refresco de KPIs de portafolio."""
+        works = self.line_id.work_id
+        result = super().unlink()
+        self.env['building.work.kpi']._mark_dirty(works.ids)
+        return result
+
     def _trigger_engine_update(self):
-        """Delega la actualización al Motor Único."""
+        """Delega la actualización al Motor Único (cola deduplicada por obra)."""
+        if self.env.context.get('skip_progress_engine'):
+            # El engine ya propaga el avance (apply_progress incremental)
+            return
         # Identificar qué obras/etapas/partidas tocaron
         lines = self.mapped('line_id')
-        works = lines.mapped('work_id')
-        # Optimización: llamar por obra
-        for work in works:
-            work_lines = lines.filtered(lambda l: l.work_id == work)
-            self.env['building.progress.engine'].recompute_hierarchy(
-                work.id, 
-                line_ids=work_lines.ids
-            )
+        Engine = self.env['building.progress.engine']
+        # Un solo recálculo por obra aunque el lote toque muchas partidas
+        with Engine.deferred_recompute():
+            for work in lines.mapped('work_id'):
+                work_lines = lines.filtered(lambda l: l.work_id == work)
+                Engine.mark_dirty(work.id, line_ids=work_lines.ids)
+
+    def load(self, fields, data):
+        """Importación masiva: difiere el recálculo de avance al final de la carga."""
+        with self.env['building.progress.engine'].deferred_recompute():
+            return super().load(fields, data)
 
     # === ACCIONES ===
     def action_cancel(self):
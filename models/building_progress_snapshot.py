@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Modelo: Historial de Snapshots de Avance (building.progress.snapshot)
+
+Tabla compacta y de solo-agregar con una foto diaria del avance físico y
+financiero por obra y por etapa. El Progress Engine encola las obras que
+recalcula y el snapshot se escribe una sola vez en el pre-commit de la
+transacción (como máximo una fila por entidad y día: el último valor del
+día reemplaza al anterior). Permite obtener curvas S sin reprocesar el
+historial de building.budget.progress.
+"""
+
+from odoo import models, fields, api
+from odoo.models import UniqueIndex
+from odoo.tools import SQL
+
+# Llave de la cola de snapshots en cr.precommit.data (vive lo que la transacción)
+SNAPSHOT_QUEUE_KEY = 'building.progress.snapshot.queue'
+
+
+class BuildingProgressSnapshot(models.Model):
+    """
+    Snapshot diario de avance.
+    stage_id vacío = fila de la obra completa.
+    """
+    _name = 'building.progress.snapshot'
+    _description = 'Snapshot Diario de Avance'
+    _order = 'work_id, stage_id, date'
+
+    # === CONSTRAINTS (Odoo 19 Style) ===
+    # COALESCE para que la fila de obra (stage_id NULL) también sea única por día
+    _unique_work_stage_date = UniqueIndex(
+        '(work_id, COALESCE(stage_id, 0), date)',
+        message='Solo puede existir un snapshot por obra/etapa y día.'
+    )
+
+    work_id = fields.Many2one(
+        'building.work',
+        string='Obra',
+        required=True,
+        ondelete='cascade',
+        index=True,
+        readonly=True
+    )
+
+    stage_id = fields.Many2one(
+        'building.work.stage',
+        string='Etapa',
+        ondelete='cascade',
+        readonly=True,
+        help='Vacío para el snapshot de la obra completa'
+    )
+
+    date = fields.Date(
+        string='Fecha',
+        required=True,
+        readonly=True
+    )
+
+    physical_pct = fields.Float(
+        string='Avance Físico (%)',
+        readonly=True
+    )
+
+    financial_pct = fields.Float(
+        string='Avance Financiero (%)',
+        readonly=True
+    )
+
+    executed_amount = fields.Monetary(
+        string='Importe Ejecutado',
+        currency_field='currency_id',
+        readonly=True,
+        help='Valor ganado: SUM(avance * importe) de las partidas'
+    )
+
+    currency_id = fields.Many2one(
+        related='work_id.currency_id',
+        readonly=True
+    )
+
+    # === COLA POR TRANSACCIÓN (Progress Engine) ===
+    @api.model
+    def _get_queue(self):
+        """
+        Retorna el conjunto de obras pendientes de la transacción actual.
+        Al crearlo se registra la escritura en el pre-commit del cursor.
+        """
+        data = self.env.cr.precommit.data
+        queue = data.get(SNAPSHOT_QUEUE_KEY)
+        if queue is None:
+            queue = data[SNAPSHOT_QUEUE_KEY] = set()
+            snapshot = self
+            self.env.cr.precommit.add(lambda: snapshot.flush_queue())
+        return queue
+
+    @api.model
+    def enqueue(self, work_ids):
+        """Encola obras para guardar su snapshot del día al final de la transacción."""
+        work_ids = [wid for wid in work_ids if wid]
+        if work_ids:
+            self._get_queue().update(work_ids)
+
+    @api.model
+    def flush_queue(self):
+        """Escribe el snapshot de las obras encoladas: un solo INSERT por lote."""
+        queue = self.env.cr.precommit.data.get(SNAPSHOT_QUEUE_KEY)
+        while queue:
+            # El snapshot lee avance: vaciar antes la cola del Progress Engine y
+            # escribir lo pendiente (el pre-commit corre después del flush)
+            self.env['building.progress.engine'].flush_dirty()
+            self.env.flush_all()
+            work_ids = list(queue)
+            queue.clear()
+            self._record_works(work_ids)
+
+    # === ESCRITURA ===
+    @api.model
+    def _record_works(self, work_ids, date=None):
+        """
+        Guarda el snapshot del día para las obras indicadas y todas sus etapas.
+
+        Los valores se leen de los snapshots ya calculados por el engine
+        (overall_progress, progress_pct, progress_weighted) y se escriben con
+        un único INSERT ... ON CONFLICT: si ya hay fila del día se actualiza.
+        """
+        work_ids = list({wid for wid in work_ids if wid})
+        if not work_ids:
+            return
+        date = date or fields.Date.context_today(self)
+        works = self.env['building.work'].browse(work_ids).exists()
+        if not works:
+            return
+        works.stage_ids.fetch(['work_id', 'progress_pct', 'progress_weighted', 'consume_pct'])
+
+        rows = []
+        for work in works:
+            executed = 0.0
+            for stage in work.stage_ids:
+                stage_executed = stage.progress_weighted / 100.0
+                executed += stage_executed
+                rows.append((work.id, stage.id, stage.progress_pct, stage.consume_pct, stage_executed))
+            rows.append((work.id, None, work.overall_progress, work.financial_progress, executed))
+
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO building_progress_snapshot
+                   (work_id, stage_id, date, physical_pct, financial_pct, executed_amount,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT v.work_id::int4, v.stage_id::int4, %(date)s, v.physical::float8,
+                   v.financial::float8, v.executed::numeric,
+                   %(uid)s, (now() at time zone 'UTC'), %(uid)s, (now() at time zone 'UTC')
+              FROM (VALUES %(values)s) AS v(work_id, stage_id, physical, financial, executed)
+                ON CONFLICT (work_id, COALESCE(stage_id, 0), date) DO UPDATE
+               SET physical_pct = EXCLUDED.physical_pct,
+                   financial_pct = EXCLUDED.financial_pct,
+                   executed_amount = EXCLUDED.executed_amount,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+            """,
+            date=date,
+            uid=self.env.uid,
+            values=SQL(", ").join(
+                SQL("(%s)", SQL(", ").join(SQL("%s", value) for value in row))
+                for row in rows
+            ),
+        ))
+        self.invalidate_model()
+
+    # === LECTURA (Curvas S) ===
+    @api.model
+    def get_curves(self, work_ids, date_from=None, date_to=None, include_stages=False):
+        """
+        Curvas de avance físico vs financiero en una sola consulta.
+
+        Args:
+            work_ids (list): obras a consultar.
+            date_from, date_to (date): rango opcional.
+            include_stages (bool): incluir también las curvas por etapa.
+
+        Returns:
+            dict: {(work_id, stage_id|False): [
+                {'date', 'physical_pct', 'financial_pct', 'executed_amount'}, ...
+            ]} ordenado por fecha.
+        """
+        curves = {}
+        if not work_ids:
+            return curves
+        self.flush_model()
+        conditions = [SQL("work_id = ANY(%s)", list(work_ids))]
+        if not include_stages:
+            conditions.append(SQL("stage_id IS NULL"))
+        if date_from:
+            conditions.append(SQL("date >= %s", date_from))
+        if date_to:
+            conditions.append(SQL("date <= %s", date_to))
+        self.env.cr.execute(SQL(
+            """
+            SELECT work_id, stage_id, date, physical_pct, financial_pct, executed_amount
+              FROM building_progress_snapshot
+             WHERE %s
+          ORDER BY work_id, stage_id NULLS FIRST, date
+            """,
+            SQL(" AND ").join(conditions),
+        ))
+        for work_id, stage_id, date, physical, financial, executed in self.env.cr.fetchall():
+            curves.setdefault((work_id, stage_id or False), []).append({
+                'date': date,
+                'physical_pct': physical or 0.0,
+                'financial_pct': financial or 0.0,
+                'executed_amount': executed or 0.0,
+            })
+        return curves
@@ -202,10 +202,8 @@ class BuildingRealLine(models.Model):
                             'porque la obra usa fuente Contable.'
                         ) % work.real_cutover_date)
         records = super().create(vals_list)
-        # Regenerar alertas de las obras afectadas (Regla 2: Gasto > Avance)
-        works = records.mapped('work_id')
-        for work in works:
-            self.env['building.alert.engine'].rebuild_alerts(work.id)
+        # Encolar alertas de las obras afectadas (Regla 2: Gasto > Avance)
+        self.env['building.alert.engine'].enqueue(records.work_id.ids)
         return records
 
     def write(self, vals):
@@ -214,21 +212,19 @@ class BuildingRealLine(models.Model):
                 if line.is_migrated:
                     raise UserError(_('No se puede modificar un gasto ya migrado a contabilidad.'))
         result = super().write(vals)
-        # Regenerar alertas por cambios en monto
-        works = self.mapped('work_id')
-        for work in works:
-            self.env['building.alert.engine'].rebuild_alerts(work.id)
+        # Encolar alertas por cambios en monto
+        self.env['building.alert.engine'].enqueue(self.work_id.ids)
         return result
 
     def unlink(self):
         for line in self:
             if line.is_migrated:
                 raise UserError(_('No se puede eliminar un gasto ya migrado a contabilidad.'))
-        works = self.mapped('work_id')
+        work_ids = self.work_id.ids
         result = super().unlink()
-        # Regenerar alertas tras eliminar gasto
-        for work in works:
-            self.env['building.alert.engine'].rebuild_alerts(work.id)
+        # Encolar alertas tras eliminar gasto
+        self.env['building.alert.engine'].enqueue(work_ids)
+        self.env['building.work.kpi']._mark_dirty(work_ids)
         return result
 
     # === FLUJO DE APROBACIÓN (ETAPA 5.2) ===
@@ -102,40 +102,36 @@ class BuildingStageProgress(models.Model):
     @api.constrains('progress_pct', 'stage_id', 'state')
     def _check_cumulative_limit(self):
         """Valida que el acumulado no exceda 100%."""
-        for record in self:
-            if record.state == 'confirmed':
-                # Calcular suma de avances confirmados para esta etapa
-                confirmed_records = self.search([
-                    ('stage_id', '=', record.stage_id.id),
-                    ('state', '=', 'confirmed'),
-                ])
-                total = sum(confirmed_records.mapped('progress_pct'))
-                if total > 100:
-                    raise ValidationError(_(
-                        'El avance acumulado no puede exceder 100%%.\n'
-                        'Acumulado actual: %.1f%%'
-                    ) % total)
+        confirmed = self.filtered(lambda r: r.state == 'confirmed')
+        if not confirmed:
+            return
+        # Suma de avances confirmados por etapa (mismo agregado que el acumulado)
+        _running, totals = self.env['building.progress.engine']._get_running_totals(
+            self._name, 'stage_id', 'progress_pct', confirmed.stage_id.ids,
+        )
+        for record in confirmed:
+            total = totals.get(record.stage_id.id, 0.0)
+            if total > 100:
+                raise ValidationError(_(
+                    'El avance acumulado no puede exceder 100%%.\n'
+                    'Acumulado actual: %.1f%%'
+                ) % total)
 
     # === MÉTODOS COMPUTE ===
     @api.depends('stage_id', 'date', 'state')
     def _compute_cumulative(self):
-        """Calcula el porcentaje acumulado hasta este registro."""
+        """Calcula el porcentaje acumulado hasta este registro (una consulta para todo el lote)."""
+        running, totals = self.env['building.progress.engine']._get_running_totals(
+            self._name, 'stage_id', 'progress_pct', self.stage_id.ids,
+        )
         for record in self:
             if record.state == 'cancelled':
                 record.cumulative_pct = 0
-                continue
-            
-            # Obtener todos los registros confirmados de la etapa hasta esta fecha
-            earlier_records = self.search([
-                ('stage_id', '=', record.stage_id.id),
-                ('state', '=', 'confirmed'),
-                '|',
-                ('date', '<', record.date),
-                '&',
-                ('date', '=', record.date),
-                ('id', '<=', record.id),
-            ])
-            record.cumulative_pct = min(100.0, sum(earlier_records.mapped('progress_pct')))
+            elif record.id in running:
+                record.cumulative_pct = min(100.0, running[record.id])
+            else:
+                # Registro nuevo (NewId): todo lo guardado + este valor
+                record.cumulative_pct = min(100.0, totals.get(record.stage_id.id, 0.0) + record.progress_pct)
 
     @api.depends('stage_id.name', 'date', 'progress_pct')
     def _compute_display_name(self):
@@ -159,14 +155,12 @@ class BuildingStageProgress(models.Model):
                     'last_progress_date': fields.Datetime.now()
                 })
         
-        # 2. Forzar recálculo de jerarquía en building.progress.engine
+        # 2. Recálculo de jerarquía en building.progress.engine (una vez por obra)
         works = records.mapped('stage_id.work_id')
-        for work in works:
-            self.env['building.progress.engine'].recompute_hierarchy(work.id)
+        records._trigger_engine_update(works)
 
-        # 3. Regenerar alertas de las obras afectadas (ahora con datos frescos)
-        for work in works:
-            self.env['building.alert.engine'].rebuild_alerts(work.id)
+        # 3. Encolar alertas de las obras afectadas (se evalúan al final de la transacción)
+        self.env['building.alert.engine'].enqueue(works.ids)
         
         return records
 
@@ -197,13 +191,11 @@ class BuildingStageProgress(models.Model):
                 else:
                     stage.write({'last_progress_date': False})
             
-            # 2. Forzar recálculo del engine global
-            for work in works:
-                self.env['building.progress.engine'].recompute_hierarchy(work.id)
+            # 2. Recálculo del engine global (una vez por obra)
+            self._trigger_engine_update(works)
 
-            # 3. Regenerar alertas (Engine)
-            for work in works:
-                self.env['building.alert.engine'].rebuild_alerts(work.id)
+            # 3. Encolar alertas (Engine)
+            self.env['building.alert.engine'].enqueue(works.ids)
             
             return result
         
@@ -217,6 +209,19 @@ class BuildingStageProgress(models.Model):
         
         return super().write(vals)
 
+    def _trigger_engine_update(self, works):
+        """
+        Encola el recálculo de las obras y lo vacía antes de evaluar alertas.
+
+        Las alertas leen el avance de etapa, por lo que la cola de estas obras
+        se vacía aquí aunque exista un bloque diferido externo.
+        """
+        Engine = self.env['building.progress.engine']
+        with Engine.deferred_recompute():
+            for work in works:
+                Engine.mark_dirty(work.id)
+        Engine.flush_dirty(works.ids)
+
     def unlink(self):
         """Bloquea eliminación de registros confirmados."""
         for record in self:
@@ -102,6 +102,15 @@ class BuildingWork(models.Model):
         store=True,
         help='Total distribuido en periodos (FASE 3.x: control operativo)'
     )
+
+    # Total GLOBAL (validados/consolidados): base del avance financiero
+    budget_global_total = fields.Monetary(
+        string='Presupuesto Global',
+        currency_field='currency_id',
+        compute='_compute_budget_kpis',
+        store=True,
+        help='Suma de todos los presupuestos validados y consolidados (sin importar la selección)'
+    )
     
     # Pagado: calculado según la fuente real (Fase 3.4)
     amount_paid = fields.Monetary(
@@ -132,6 +141,13 @@ class BuildingWork(models.Model):
         'work_id',
         string='Alertas'
     )
+
+    alert_threshold_ids = fields.One2many(
+        'building.work.alert.threshold',
+        'work_id',
+        string='Umbrales de Alertas',
+        help='Umbrales de reglas ajustados para esta obra'
+    )
     
     # === GASTOS REALES (FASE 3.4) ===
     real_line_ids = fields.One2many(
@@ -200,12 +216,14 @@ class BuildingWork(models.Model):
     financial_progress = fields.Float(
         string='Avance Financiero (%)',
         compute='_compute_financial_progress',
+        store=True,
         help='(Pagado + Comprometido) / Presupuesto Total * 100'
     )
 
     consistency_warning = fields.Boolean(
         string='Alerta Consistencia',
         compute='_compute_consistency_warning',
+        store=True,
         help='True si avance financiero > avance físico'
     )
 
@@ -306,6 +324,7 @@ class BuildingWork(models.Model):
     @api.depends(
         'budget_ids',
         'budget_ids.state',
+        'budget_ids.active',
         'budget_ids.total_amount',
         'budget_ids.total_distributed',
         'selected_budget_id'
@@ -314,8 +333,13 @@ class BuildingWork(models.Model):
         """Calcula KPIs del presupuesto (Soporte Multi-Presupuesto).
         
         Usa _get_selected_budget() para sumar uno o varios.
+        El total global (validados/consolidados) se guarda aparte para el
+        avance financiero.
         """
         for work in self:
+            work.budget_global_total = sum(work.budget_ids.filtered(
+                lambda b: b.state in ('validated', 'consolidated')
+            ).mapped('total_amount'))
             budgets = work._get_selected_budget()
             if budgets:
                 work.budget_total = sum(budgets.mapped('total_amount'))
@@ -324,6 +348,18 @@ class BuildingWork(models.Model):
                 work.budget_total = 0.0
                 work.amount_committed = 0.0
 
+    def _mark_budget_kpis_dirty(self):
+        """Marca los KPIs de presupuesto de las obras para recálculo.
+
+        Punto único usado por presupuestos, capítulos, partidas y periodos:
+        se invalidan las dependencias de budget_ids y el ORM recalcula
+        budget_total, comprometido, disponible y avance financiero una sola
+        vez por obra al siguiente flush, sin importar el tamaño del lote.
+        """
+        works = self.filtered('id')
+        if works:
+            works.modified(['budget_ids'])
+
     @api.depends('budget_total', 'amount_committed', 'amount_paid')
     def _compute_amount_available(self):
         """Calcula el monto disponible del presupuesto."""
@@ -331,9 +367,20 @@ class BuildingWork(models.Model):
             available = work.budget_total - work.amount_committed - work.amount_paid
             work.amount_available = max(0.0, available)
 
-    @api.depends('real_source', 'real_line_ids.amount', 'real_line_ids.approval_state')
+    @api.depends(
+        'real_source', 'real_cutover_date', 'real_line_ids.amount', 'real_line_ids.approval_state',
+        'real_line_ids.is_migrated', 'real_line_ids.date',
+    )
     def _compute_amount_paid(self):
-        """Calcula el monto pagado (KPI) — solo gastos aprobados (Etapa 5.2)."""
+        """Calcula el monto pagado (KPI) — solo gastos aprobados (Etapa 5.2).
+
+        Plan B: interno anterior al corte + contabilidad analítica desde el
+        corte, resuelto por el Financial Engine en una pasada para el lote.
+        """
+        accounting_works = self.filtered(lambda w: w.real_source == 'accounting')
+        accounting_totals = self.env['building.financial.engine'].get_real_totals_multi(
+            [work_id for work_id in accounting_works._origin.ids if work_id]
+        ) if accounting_works else {}
         for work in self:
             if work.real_source == 'internal':
                 approved = work.real_line_ids.filtered(
@@ -341,8 +388,7 @@ class BuildingWork(models.Model):
                 )
                 work.amount_paid = sum(approved.mapped('amount'))
             else:
-                # TODO: Integración contable
-                work.amount_paid = 0.0
+                work.amount_paid = accounting_totals.get(work._origin.id, 0.0)
 
     @api.depends('stage_ids')
     def _compute_stage_count(self):
@@ -539,16 +585,12 @@ class BuildingWork(models.Model):
 
 
 
-    @api.depends('budget_total', 'amount_committed', 'amount_paid')
+    @api.depends('budget_global_total', 'amount_committed', 'amount_paid')
     def _compute_financial_progress(self):
         """Calcula el avance financiero: (Pagado + Comprometido) / Presupuesto Total GLOBAL."""
         for work in self:
-            # Siempre usar el total GLOBAL para avance financiero
-            all_budgets = work.budget_ids.filtered(
-                lambda b: b.state in ('validated', 'consolidated')
-            )
-            global_total = sum(all_budgets.mapped('total_amount'))
-            
+            # Siempre usar el total GLOBAL para avance financiero (columna almacenada)
+            global_total = work.budget_global_total
             if global_total > 0:
                 work.financial_progress = (
                     (work.amount_paid + work.amount_committed) / global_total
@@ -5,6 +5,7 @@ Sistema de alertas para desviaciones, aprobaciones y notificaciones.
 """
 
 from odoo import models, fields, api
+from odoo.models import UniqueIndex
 
 
 class BuildingWorkAlert(models.Model):
@@ -16,6 +17,13 @@ class BuildingWorkAlert(models.Model):
     _description = 'Alerta de Obra'
     _order = 'severity desc, create_date desc'
 
+    # === CONSTRAINTS (Odoo 19 Style) ===
+    # Identidad de las alertas automáticas: una por regla y obra
+    _work_rule_code_uniq = UniqueIndex(
+        '(work_id, rule_code) WHERE rule_code IS NOT NULL',
+        message='Ya existe una alerta automática con esa regla para la obra.'
+    )
+
     # === CAMPOS PRINCIPALES ===
     name = fields.Char(
         string='Descripción',
@@ -63,6 +71,12 @@ class BuildingWorkAlert(models.Model):
         help='Las alertas inactivas no se muestran en el dashboard'
     )
     
+    dismissed = fields.Boolean(
+        string='Descartada',
+        default=False,
+        help='Descartada por el usuario: el motor no la reactiva mientras la condición persista'
+    )
+    
     # === CAMPOS DE NAVEGACIÓN (opcional MVP) ===
     action_xml_id = fields.Char(
         string='XML ID de Acción',
@@ -115,9 +129,16 @@ class BuildingWorkAlert(models.Model):
         for alert in self:
             alert.alert_emoji = emojis.get(alert.severity, '⚪')
 
+    def unlink(self):
+        """Override unlink para encolar el refresco de KPIs de portafolio."""
+        works = self.work_id
+        result = super().unlink()
+        self.env['building.work.kpi']._mark_dirty(works.ids)
+        return result
+
     def action_dismiss(self):
-        """Desactiva/oculta la alerta."""
-        self.write({'is_active': False})
+        """Desactiva/oculta la alerta (el motor no la reactiva mientras siga vigente)."""
+        self.write({'is_active': False, 'dismissed': True})
 
     def action_navigate(self):
         """
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Modelo: Umbrales de Alertas por Obra (building.work.alert.threshold)
+Ajusta el umbral de una regla del motor de alertas para una obra concreta.
+"""
+
+from odoo import models, fields, api
+from odoo.models import UniqueIndex
+
+
+class BuildingWorkAlertThreshold(models.Model):
+    """
+    Umbral de una regla de alerta para una obra.
+    Tiene prioridad sobre el campo de la obra y el valor por defecto de la
+    regla (ver building.alert.engine._get_threshold).
+    """
+    _name = 'building.work.alert.threshold'
+    _description = 'Umbral de Alerta por Obra'
+    _order = 'work_id, rule_key'
+
+    # === CONSTRAINTS (Odoo 19 Style) ===
+    _work_rule_key_uniq = UniqueIndex(
+        '(work_id, rule_key)',
+        message='Ya existe un umbral para esa regla en la obra.'
+    )
+
+    work_id = fields.Many2one(
+        'building.work',
+        string='Obra',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+
+    rule_key = fields.Selection(
+        selection='_selection_rule_key',
+        string='Regla',
+        required=True
+    )
+
+    value = fields.Float(
+        string='Umbral',
+        required=True,
+        help='Valor del umbral en las unidades de la regla (porcentaje, días, puntos)'
+    )
+
+    company_id = fields.Many2one(
+        related='work_id.company_id',
+        store=True,
+        readonly=True
+    )
+
+    @api.model
+    def _selection_rule_key(self):
+        """Reglas registradas en el motor de alertas."""
+        return [
+            (rule['key'], rule['name'])
+            for rule in self.env['building.alert.engine']._get_alert_rules()
+        ]
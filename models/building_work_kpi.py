@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Modelo: KPIs de Portafolio (building.work.kpi)
+
+Tabla de reporte con UNA fila por obra que materializa los KPIs del
+listado de obras (presupuesto, comprometido, pagado, disponible, avance
+físico y financiero). La lista de portafolio se lee de esta tabla con una
+sola consulta indexada, sin recorrer presupuestos por obra.
+
+REFRESCO INCREMENTAL:
+---------------------
+Solo se recalculan las obras tocadas desde el último refresco: obras cuyo
+registro o cuyos presupuestos, partidas, etapas, avances, gastos reales,
+costos o alertas tienen write_date igual o posterior a la marca guardada en
+`building.work_kpi.last_refresh`. Las obras en Plan B (contabilidad) se
+refrescan siempre, porque su real no deja rastro en esas tablas.
+
+La marca no es la hora del refresco sino el inicio de la transacción
+abierta más antigua de la base (pg_stat_activity): una transacción que
+empezó antes del refresco y confirma después escribe write_date anteriores
+a esa hora, y se revisaría nunca. Los borrados no dejan write_date: se
+encolan en building.work.kpi.dirty y el refresco consume la cola.
+Los agregados se obtienen con consultas agrupadas (Financial Engine) y se
+escriben con un único INSERT ... ON CONFLICT.
+"""
+
+import logging
+
+from odoo import models, fields, api
+from odoo.models import UniqueIndex
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+# Marca del último refresco incremental (ir.config_parameter)
+LAST_REFRESH_PARAM = 'building.work_kpi.last_refresh'
+
+# Tablas cuyo write_date indica que la obra (columna work_id) cambió
+TOUCH_TABLES = (
+    'building_budget',
+    'building_budget_line',
+    'building_work_stage',
+    'building_budget_progress',
+    'building_real_line',
+    'building_work_cost',
+    'building_work_alert',
+)
+
+
+class BuildingWorkKpi(models.Model):
+    """
+    KPIs materializados por obra (solo lectura).
+    Los escribe exclusivamente refresh() vía SQL.
+    """
+    _name = 'building.work.kpi'
+    _description = 'KPIs de Portafolio de Obras'
+    _order = 'work_id'
+    _rec_name = 'work_id'
+
+    # === CONSTRAINTS (Odoo 19 Style) ===
+    _unique_work = UniqueIndex(
+        '(work_id)',
+        message='Solo puede existir una fila de KPIs por obra.'
+    )
+
+    work_id = fields.Many2one(
+        'building.work',
+        string='Obra',
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+
+    work_state = fields.Selection(
+        related='work_id.state',
+        string='Estado'
+    )
+
+    company_id = fields.Many2one(
+        'res.company',
+        string='Compañía',
+        readonly=True
+    )
+
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Moneda',
+        readonly=True
+    )
+
+    budget_total = fields.Monetary(string='Presupuesto Total', currency_field='currency_id', readonly=True)
+    amount_committed = fields.Monetary(string='Comprometido', currency_field='currency_id', readonly=True)
+    amount_paid = fields.Monetary(string='Pagado', currency_field='currency_id', readonly=True)
+    amount_available = fields.Monetary(string='Disponible', currency_field='currency_id', readonly=True)
+    cost_total = fields.Monetary(
+        string='Costos Operativos',
+        currency_field='currency_id',
+        readonly=True,
+        help='Costos operativos aprobados (presupuestados y adicionales)'
+    )
+    overall_progress = fields.Float(string='Avance Físico (%)', readonly=True)
+    financial_progress = fields.Float(string='Avance Financiero (%)', readonly=True)
+    active_alert_count = fields.Integer(string='# Alertas Activas', readonly=True)
+
+    refreshed_at = fields.Datetime(
+        string='Actualizado',
+        readonly=True
+    )
+
+    # === REFRESCO ===
+    @api.model
+    def refresh(self, work_ids=None):
+        """
+        Recalcula los KPIs de las obras indicadas (o de las tocadas desde el
+        último refresco si work_ids es None) y los guarda con un upsert.
+
+        Returns:
+            int: número de obras refrescadas.
+        """
+        cr = self.env.cr
+        ICP = self.env['ir.config_parameter'].sudo()
+        incremental = work_ids is None
+        cr.execute(SQL("SELECT now() at time zone 'UTC'"))
+        started_at = cr.fetchone()[0]
+        if incremental:
+            # Antes de buscar: lo que escriban las transacciones aún abiertas
+            # (y las que empiecen después) entra en el siguiente refresco
+            marker = self._get_refresh_marker()
+            work_ids = self._get_touched_work_ids(ICP.get_param(LAST_REFRESH_PARAM))
+            work_ids += self._pop_dirty_work_ids()
+        work_ids = list({wid for wid in work_ids if wid})
+
+        if work_ids:
+            rows = self._compute_kpi_rows(work_ids)
+            self._upsert_rows(rows, started_at)
+        if incremental:
+            ICP.set_param(LAST_REFRESH_PARAM, str(marker))
+        return len(work_ids)
+
+    @api.model
+    def _get_refresh_marker(self):
+        """
+        Inicio de la transacción abierta más antigua de la base (o de esta).
+        Ninguna escritura aún no confirmada tiene write_date anterior.
+        """
+        self.env.cr.execute(SQL(
+            """
+            SELECT LEAST(now(), MIN(xact_start)) at time zone 'UTC'
+              FROM pg_stat_activity
+             WHERE datname = current_database()
+               AND xact_start IS NOT NULL
+            """
+        ))
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _mark_dirty(self, work_ids):
+        """Encola obras para el siguiente refresco (borrados sin write_date)."""
+        work_ids = list({wid for wid in work_ids if wid})
+        if work_ids:
+            self.env.cr.execute(SQL(
+                "INSERT INTO building_work_kpi_dirty (work_id) SELECT unnest(%s::int[])",
+                work_ids,
+            ))
+
+    @api.model
+    def _pop_dirty_work_ids(self):
+        """
+        Consume la cola de obras pendientes. Las filas de transacciones aún
+        no confirmadas no son visibles ni se borran: quedan para la siguiente.
+        """
+        self.env.cr.execute(SQL("DELETE FROM building_work_kpi_dirty RETURNING work_id"))
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _get_touched_work_ids(self, last_refresh):
+        """Obras modificadas (directa o indirectamente) desde last_refresh."""
+        self.env.flush_all()
+        if not last_refresh:
+            self.env.cr.execute(SQL("SELECT id FROM building_work"))
+            return [row[0] for row in self.env.cr.fetchall()]
+        branches = [
+            SQL("SELECT id FROM building_work WHERE write_date >= %s", last_refresh),
+            # Obras nuevas sin fila de KPIs
+            SQL("SELECT w.id FROM building_work w LEFT JOIN building_work_kpi k ON k.work_id = w.id "
+                "WHERE k.id IS NULL"),
+            # Plan B: el real contable no deja rastro en las tablas de obra
+            SQL("SELECT id FROM building_work WHERE real_source = 'accounting'"),
+        ]
+        branches += [
+            SQL("SELECT work_id FROM %s WHERE write_date >= %s", SQL.identifier(table), last_refresh)
+            for table in TOUCH_TABLES
+        ]
+        self.env.cr.execute(SQL("SELECT DISTINCT id FROM (%s) AS touched(id) WHERE id IS NOT NULL",
+                                SQL(" UNION ").join(branches)))
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _compute_kpi_rows(self, work_ids):
+        """
+        KPIs de las obras en un número fijo de consultas:
+        1. Obras + presupuestos (seleccionado / validados y consolidados).
+        2. Real pagado (Financial Engine, una consulta por fuente).
+        3. Costos operativos aprobados (Financial Engine).
+        """
+        cr = self.env.cr
+        Engine = self.env['building.financial.engine'].sudo()
+
+        # 1. Presupuesto del dashboard: el seleccionado o la suma de validados/consolidados.
+        #    El avance financiero usa siempre el total GLOBAL almacenado en la obra.
+        cr.execute(SQL(
+            """
+            SELECT w.id, w.company_id, w.currency_id,
+                   COALESCE(w.overall_progress, 0), COALESCE(w.active_alert_count, 0),
+                   COALESCE(SUM(b.total_amount) FILTER (WHERE b.is_selected), 0),
+                   COALESCE(SUM(b.total_distributed) FILTER (WHERE b.is_selected), 0),
+                   COALESCE(w.budget_global_total, 0)
+              FROM building_work w
+              LEFT JOIN LATERAL (
+                    SELECT bb.total_amount, bb.total_distributed,
+                           CASE WHEN w.selected_budget_id IS NOT NULL
+                                THEN bb.id = w.selected_budget_id
+                                ELSE bb.active AND bb.state IN ('validated', 'consolidated')
+                           END AS is_selected
+                      FROM building_budget bb
+                     WHERE bb.work_id = w.id
+                   ) b ON TRUE
+             WHERE w.id = ANY(%s)
+          GROUP BY w.id
+            """,
+            work_ids,
+        ))
+        budget_rows = cr.fetchall()
+
+        # 2 y 3. Real pagado y costos (consultas agrupadas multi-obra)
+        paid = Engine.get_real_totals_multi(work_ids)
+        costs = Engine.get_cost_totals(work_ids)
+
+        rows = []
+        for (work_id, company_id, currency_id, overall, alerts,
+             budget_total, committed, global_total) in budget_rows:
+            amount_paid = paid.get(work_id, 0.0)
+            financial = ((amount_paid + committed) / global_total) * 100 if global_total > 0 else 0.0
+            rows.append({
+                'work_id': work_id,
+                'company_id': company_id,
+                'currency_id': currency_id,
+                'budget_total': budget_total,
+                'amount_committed': committed,
+                'amount_paid': amount_paid,
+                'amount_available': max(0.0, budget_total - committed - amount_paid),
+                'cost_total': costs.get(work_id, {}).get('executed_total_amount', 0.0),
+                'overall_progress': overall,
+                'financial_progress': financial,
+                'active_alert_count': alerts,
+            })
+        return rows
+
+    @api.model
+    def _upsert_rows(self, rows, refreshed_at):
+        """Inserta o actualiza las filas de KPIs con un único INSERT ... ON CONFLICT."""
+        if not rows:
+            return
+        fnames = [fname for fname in rows[0] if fname != 'work_id']
+        columns = ['work_id'] + fnames
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO building_work_kpi (%(columns)s, refreshed_at,
+                                           create_uid, create_date, write_uid, write_date)
+            VALUES %(values)s
+                ON CONFLICT (work_id) DO UPDATE
+               SET %(updates)s,
+                   refreshed_at = EXCLUDED.refreshed_at,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+            """,
+            columns=SQL(", ").join(SQL.identifier(c) for c in columns),
+            values=SQL(", ").join(
+                SQL("(%s, %s, %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC'))",
+                    SQL(", ").join(SQL("%s", row[c]) for c in columns),
+                    refreshed_at, self.env.uid, self.env.uid)
+                for row in rows
+            ),
+            updates=SQL(", ").join(
+                SQL("%s = EXCLUDED.%s", SQL.identifier(f), SQL.identifier(f)) for f in fnames
+            ),
+        ))
+        self.invalidate_model()
+
+    @api.model
+    def _cron_refresh(self):
+        """Cron: refresco incremental del portafolio."""
+        count = self.refresh()
+        _logger.info("building.work.kpi: %d obras refrescadas", count)
+
+    @api.model
+    def action_open_portfolio(self):
+        """
+        Abre el portafolio y adelanta el cron de refresco (se ejecuta aparte,
+        como superusuario), sin escribir KPIs en la transacción del usuario.
+        """
+        cron = self.env.ref('building_dashboard.ir_cron_building_work_kpi_refresh', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        action = self.env['ir.actions.act_window']._for_xml_id('building_dashboard.building_work_kpi_action')
+        return action
+
+
+class BuildingWorkKpiDirty(models.Model):
+    """
+    Cola de obras pendientes de refresco por borrados (no dejan write_date).
+    La llenan los unlink de las tablas de obra y la consume refresh().
+    """
+    _name = 'building.work.kpi.dirty'
+    _description = 'Obras Pendientes de Refresco de KPIs'
+    _log_access = False
+
+    work_id = fields.Many2one(
+        'building.work',
+        string='Obra',
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
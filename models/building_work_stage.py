@@ -55,7 +55,32 @@ class BuildingWorkStage(models.Model):
         readonly=True, # Gestionado por Engine
         help='Porcentaje de avance acumulado de la etapa (0-100). Calculado por Progress Engine.'
     )
-    
+
+    # === TOTALES PARA EL PROMEDIO PONDERADO (Gestionados por Engine) ===
+    # Se actualizan al cambiar importes o asignación de partidas, así el avance
+    # de la obra se obtiene sin volver a sumar las partidas de cada etapa.
+    planned_amount = fields.Monetary(
+        string='Importe Planeado',
+        currency_field='currency_id',
+        default=0.0,
+        readonly=True,
+        help='Suma del importe de las partidas asignadas. Calculado por Progress Engine.'
+    )
+
+    progress_weighted = fields.Float(
+        string='Avance Ponderado',
+        default=0.0,
+        readonly=True,
+        help='Numerador del promedio ponderado: SUM(avance * importe) de las partidas. Calculado por Progress Engine.'
+    )
+
+    planned_line_count = fields.Integer(
+        string='# Partidas Planeadas',
+        default=0,
+        readonly=True,
+        help='Número de partidas asignadas (promedio simple si los importes son 0). Calculado por Progress Engine.'
+    )
+
     # === RELACIÓN CON REGISTROS DE AVANCE (FASE 3.2) ===
     progress_ids = fields.One2many(
         'building.stage.progress',
@@ -120,6 +145,7 @@ class BuildingWorkStage(models.Model):
     
     date_deadline = fields.Date(
         string='Fecha Límite',
+        index='btree_not_null',
         help='Fecha límite para completar la etapa'
     )
     
@@ -151,11 +177,13 @@ class BuildingWorkStage(models.Model):
     # === CAMPOS DE SEGUIMIENTO ===
     last_progress_date = fields.Datetime(
         string='Último Avance Registrado',
+        index='btree_not_null',
         help='Fecha y hora del último registro de avance en esta etapa'
     )
     
     date_start = fields.Date(
         string='Fecha Inicio Planeada',
+        index='btree_not_null',
         help='Fecha planeada de inicio de la etapa'
     )
     
@@ -229,29 +257,29 @@ class BuildingWorkStage(models.Model):
     ], string='Semáforo', compute='_compute_financial_data', store=True)
     is_over_budget = fields.Boolean(compute='_compute_financial_data', store=True)
 
-    @api.depends('budget_line_ids.amount', 'real_line_ids.amount', 'work_id.real_source')
+    @api.depends(
+        'budget_line_ids.amount', 'real_line_ids.amount', 'real_line_ids.approval_state',
+        'real_line_ids.is_migrated', 'real_line_ids.date', 'work_id.real_source', 'work_id.real_cutover_date',
+    )
     def _compute_financial_data(self):
         """
         Calcula semáforos financieros delegando al Engine.
-        WARNING: Este método puede ser intensivo. Se optimiza procesando por Obra.
+        Todas las obras del lote se resuelven con una llamada multi-obra.
         """
         # Agrupar por obra para hacer batch processing
         works = self.mapped('work_id')
         Engine = self.env['building.financial.engine']
         
-        # Obtener umbrales desde configuración
-        ICP = self.env['ir.config_parameter'].sudo()
-        thresh_warn = float(ICP.get_param('building.budget_real_threshold_warning', 80.0))
-        thresh_crit = float(ICP.get_param('building.budget_real_threshold_critical', 100.0))
+        # Obtener umbrales desde configuración (una lectura por transacción)
+        thresh_warn, thresh_crit = Engine.get_thresholds(default_warning=80.0)
+
+        # Una sola llamada al engine para todas las obras (consultas agrupadas)
+        totals_by_work = Engine.get_stage_financial_totals_multi(works.ids, self.ids)
 
         for work in works:
             stages_in_work = self.filtered(lambda s: s.work_id == work)
-            if not stages_in_work:
-                continue
-                
-            # Llamada batch al engine
-            totals = Engine.get_stage_financial_totals(work.id, stages_in_work.ids)
-            
+            totals = totals_by_work.get(work.id, {})
+
             for stage in stages_in_work:
                 data = totals.get(stage.id, {'budget': 0.0, 'real': 0.0})
                 budget = data['budget']
@@ -454,9 +482,7 @@ class BuildingWorkStage(models.Model):
             )
 
     def _trigger_work_alerts(self):
-        works = self.mapped('work_id')
-        for work in works:
-            self.env['building.alert.engine'].rebuild_alerts(work.id)
+        self.env['building.alert.engine'].enqueue(self.work_id.ids)
 
     @api.model_create_multi
     def create(self, vals_list):
@@ -486,3 +512,10 @@ class BuildingWorkStage(models.Model):
             self._trigger_work_alerts()
         
         return result
+
+    def unlink(self):
+        """Override unlink para encolar el refresco de KPIs de portafolio."""
+        works = self.work_id
+        result = super().unlink()
+        self.env['building.work.kpi']._mark_dirty(works.ids)
+        return result
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de Flujo de Efectivo (building.cashflow.engine)
+
+Proyección mensual de gasto por obra (o del portafolio completo):
+
+- Planeado: distribución por periodos de los presupuestos validados y
+  consolidados (filas de building.budget.period.value y vectores
+  compactos), donde el periodo Mn es el mes n contado desde el inicio del
+  presupuesto.
+- Real: gastos reales aprobados, por mes de su fecha.
+- Jornales: jornales confirmados no vinculados a un gasto real (para no
+  contarlos dos veces), por mes de la semana.
+
+El planeado de cada presupuesto se guarda en un caché de proceso con una
+firma de versión (versión, fecha de inicio y versión de distribución del
+presupuesto); solo se recalculan los presupuestos cuya firma cambió. La
+versión de distribución sale de una secuencia y cambia con cada escritura
+de filas o vectores de periodo, así que una transacción revertida no deja
+una firma que otra pueda repetir.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from odoo import models, api
+from odoo.tools import SQL
+
+# Caché de planeado por presupuesto: {(dbname, budget_id): (firma, {mes: monto})}
+_PLANNED_CACHE = OrderedDict()
+_PLANNED_CACHE_SIZE = 512
+_PLANNED_CACHE_LOCK = threading.Lock()
+
+
+class BuildingCashflowEngine(models.AbstractModel):
+    """
+    Motor de Flujo de Efectivo Centralizado.
+    Devuelve matrices obra × mes (o portafolio × mes) con planeado, real y
+    jornales, en un número fijo de consultas agrupadas.
+    """
+    _name = 'building.cashflow.engine'
+    _description = 'Motor de Flujo de Efectivo'
+
+    @api.model
+    def get_matrix(self, work_ids=None, date_from=None, date_to=None, portfolio=False):
+        """
+        Matriz de flujo mensual.
+
+        Args:
+            work_ids: obras a incluir (None = todas las obras no finalizadas).
+            date_from, date_to: acotan los meses (inclusive, por mes).
+            portfolio: si True, una sola fila 'portfolio' con la suma de obras.
+
+        Returns:
+            dict: {
+                'months': [date(primer día del mes), ...] ordenados,
+                'rows': {work_id | 'portfolio': {mes: {'planned', 'real', 'jornal'}}},
+            }
+        """
+        if work_ids is None:
+            work_ids = self.env['building.work'].search([('state', '!=', 'done')]).ids
+        work_ids = list({wid for wid in work_ids if wid})
+        rows = {wid: {} for wid in work_ids}
+        if not work_ids:
+            return {'months': [], 'rows': {'portfolio': {}} if portfolio else {}}
+
+        month_from = date_from and self._month(date_from)
+        month_to = date_to and self._month(date_to)
+
+        def add(work_id, month, key, amount):
+            if not amount or (month_from and month < month_from) or (month_to and month > month_to):
+                return
+            cell = rows[work_id].setdefault(month, {'planned': 0.0, 'real': 0.0, 'jornal': 0.0})
+            cell[key] += amount
+
+        for work_id, series in self._get_planned(work_ids).items():
+            for month, amount in series.items():
+                add(work_id, month, 'planned', amount)
+        for work_id, month, amount in self._get_real(work_ids):
+            add(work_id, month, 'real', amount)
+        for work_id, month, amount in self._get_jornal(work_ids):
+            add(work_id, month, 'jornal', amount)
+
+        if portfolio:
+            total = {}
+            for series in rows.values():
+                for month, cell in series.items():
+                    target = total.setdefault(month, {'planned': 0.0, 'real': 0.0, 'jornal': 0.0})
+                    for key, amount in cell.items():
+                        target[key] += amount
+            rows = {'portfolio': total}
+
+        months = sorted({month for series in rows.values() for month in series})
+        return {'months': months, 'rows': rows}
+
+    @api.model
+    def _month(self, value):
+        """Primer día del mes de una fecha."""
+        return date(value.year, value.month, 1)
+
+    # === PLANEADO (con caché por versión de presupuesto) ===
+    @api.model
+    def _get_planned(self, work_ids):
+        """Planeado mensual por obra: {work_id: {mes: monto}}."""
+        signatures = self._get_budget_signatures(work_ids)
+        dbname = self.env.cr.dbname
+        planned = {}
+        with _PLANNED_CACHE_LOCK:
+            for budget_id, (_work_id, signature) in signatures.items():
+                cached = _PLANNED_CACHE.get((dbname, budget_id))
+                if cached is not None and cached[0] == signature:
+                    _PLANNED_CACHE.move_to_end((dbname, budget_id))
+                    planned[budget_id] = cached[1]
+        stale = [budget_id for budget_id in signatures if budget_id not in planned]
+        if stale:
+            fresh = self._compute_planned(stale)
+            with _PLANNED_CACHE_LOCK:
+                for budget_id in stale:
+                    planned[budget_id] = fresh.get(budget_id, {})
+                    _PLANNED_CACHE[(dbname, budget_id)] = (signatures[budget_id][1], planned[budget_id])
+                while len(_PLANNED_CACHE) > _PLANNED_CACHE_SIZE:
+                    _PLANNED_CACHE.popitem(last=False)
+
+        result = {}
+        for budget_id, (work_id, _signature) in signatures.items():
+            series = result.setdefault(work_id, {})
+            for month, amount in planned[budget_id].items():
+                series[month] = series.get(month, 0.0) + amount
+        return result
+
+    @api.model
+    def _get_budget_signatures(self, work_ids):
+        """
+        Presupuestos vigentes de las obras con su firma de versión.
+
+        Solo lee la fila del presupuesto: la distribución de partidas y
+        periodos se resume en distribution_version.
+
+        Returns:
+            dict: {budget_id: (work_id, firma)}
+        """
+        self.env['building.budget'].flush_model([
+            'work_id', 'version_no', 'date_start', 'active', 'state', 'distribution_version',
+        ])
+        self.env.cr.execute(SQL(
+            """
+            SELECT b.id, b.work_id, b.version_no, b.date_start, b.create_date, b.distribution_version
+              FROM building_budget b
+             WHERE b.work_id = ANY(%s)
+               AND b.active
+               AND b.state IN ('validated', 'consolidated')
+            """,
+            work_ids,
+        ))
+        return {
+            budget_id: (work_id, tuple(signature))
+            for budget_id, work_id, *signature in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _compute_planned(self, budget_ids):
+        """
+        Planeado mensual de los presupuestos en UNA consulta agrupada:
+        filas por periodo + vectores compactos, desplazados al mes de inicio.
+
+        Returns:
+            dict: {budget_id: {mes: monto}}
+        """
+        self.env['building.budget.line'].flush_model(['budget_id', 'distribution_vector'])
+        self.env['building.budget.period.value'].flush_model(['budget_id', 'period_number', 'amount'])
+        self.env.cr.execute(SQL(
+            """
+            WITH periods AS (
+                SELECT v.budget_id, v.period_number, v.amount
+                  FROM building_budget_period_value v
+                 WHERE v.budget_id = ANY(%(budgets)s)
+             UNION ALL
+                SELECT l.budget_id, e.ordinality::int, e.value::float8
+                  FROM building_budget_line l,
+                       jsonb_array_elements_text(l.distribution_vector) WITH ORDINALITY AS e(value, ordinality)
+                 WHERE l.budget_id = ANY(%(budgets)s)
+                   AND jsonb_typeof(l.distribution_vector) = 'array'
+            )
+            SELECT p.budget_id,
+                   (date_trunc('month', COALESCE(b.date_start, b.create_date::date))
+                        + (p.period_number - 1) * interval '1 month')::date AS month,
+                   SUM(p.amount)
+              FROM periods p
+              JOIN building_budget b ON b.id = p.budget_id
+          GROUP BY p.budget_id, month
+            """,
+            budgets=budget_ids,
+        ))
+        result = {}
+        for budget_id, month, amount in self.env.cr.fetchall():
+            result.setdefault(budget_id, {})[month] = amount or 0.0
+        return result
+
+    # === REAL Y JORNALES ===
+    @api.model
+    def _get_real(self, work_ids):
+        """Gastos reales aprobados por obra y mes: [(work_id, mes, monto)]."""
+        self.env['building.real.line'].flush_model(['work_id', 'date', 'amount', 'approval_state'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT work_id, date_trunc('month', date)::date, SUM(amount)
+              FROM building_real_line
+             WHERE work_id = ANY(%s)
+               AND approval_state = 'approved'
+          GROUP BY work_id, 2
+            """,
+            work_ids,
+        ))
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _get_jornal(self, work_ids):
+        """Jornales confirmados sin gasto real vinculado, por obra y mes: [(work_id, mes, monto)]."""
+        self.env['building.jornal'].flush_model(
+            ['work_id', 'fecha_semana', 'total_jornal', 'state', 'real_line_id']
+        )
+        self.env.cr.execute(SQL(
+            """
+            SELECT work_id, date_trunc('month', fecha_semana)::date, SUM(total_jornal)
+              FROM building_jornal
+             WHERE work_id = ANY(%s)
+               AND state = 'confirmado'
+               AND real_line_id IS NULL
+               AND fecha_semana IS NOT NULL
+          GROUP BY work_id, 2
+            """,
+            work_ids,
+        ))
+        return self.env.cr.fetchall()
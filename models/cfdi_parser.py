@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Parser de CFDI (building.cfdi.parser)
+
+Lee un CFDI 3.3 o 4.0 en una sola pasada con iterparse:
+
+- La versión se detecta por el namespace del nodo raíz; las etiquetas y
+  las XPath de impuestos por concepto están precompiladas por namespace.
+- Cada Concepto se extrae al cerrarse y se libera del árbol, de modo que
+  facturas con miles de conceptos no sostienen el árbol completo.
+- El resultado es un CfdiDocument (con __slots__) de solo lectura.
+
+Los documentos parseados se guardan en un caché de proceso por hash del
+contenido: la previsualización del wizard y la carga comparten un solo
+parseo del mismo XML.
+"""
+
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from lxml import etree
+
+from odoo import models, api, _
+from odoo.exceptions import UserError
+
+NS_CFDI_33 = 'http://www.sat.gob.mx/cfd/3'
+NS_CFDI_40 = 'http://www.sat.gob.mx/cfd/4'
+NS_TFD = 'http://www.sat.gob.mx/TimbreFiscalDigital'
+
+TFD_TAG = '{%s}TimbreFiscalDigital' % NS_TFD
+
+# Caché de documentos parseados: {sha256: CfdiDocument}
+_PARSED_CACHE = OrderedDict()
+_PARSED_CACHE_SIZE = 64
+_PARSED_CACHE_LOCK = threading.Lock()
+
+
+class CfdiError(ValueError):
+    """XML que no es un CFDI legible."""
+
+
+class CfdiConcepto:
+    """Concepto del CFDI (tasas: tasas de traslado del concepto, como float)."""
+    __slots__ = ('descripcion', 'cantidad', 'valor_unitario', 'importe', 'tasas')
+
+    def __init__(self, descripcion, cantidad, valor_unitario, importe, tasas):
+        self.descripcion = descripcion
+        self.cantidad = cantidad
+        self.valor_unitario = valor_unitario
+        self.importe = importe  # informativo
+        self.tasas = tasas
+
+
+class CfdiDocument:
+    """
+    Datos del CFDI que usa la carga de facturas.
+
+    Montos en float, fecha como datetime y conceptos como tupla de
+    CfdiConcepto. Se comparte desde el caché: no se debe modificar.
+    """
+    __slots__ = (
+        'version', 'uuid', 'serie', 'folio', 'fecha', 'tipo', 'forma_pago', 'metodo_pago',
+        'moneda', 'tipo_cambio', 'subtotal', 'total',
+        'rfc_emisor', 'nombre_emisor', 'rfc_receptor', 'conceptos',
+    )
+
+    def __init__(self):
+        self.version = ''
+        self.uuid = ''
+        self.serie = ''
+        self.folio = ''
+        self.fecha = None
+        self.tipo = 'I'
+        self.forma_pago = ''
+        self.metodo_pago = ''
+        self.moneda = 'MXN'
+        self.tipo_cambio = 1.0
+        self.subtotal = 0.0
+        self.total = 0.0
+        self.rfc_emisor = ''
+        self.nombre_emisor = ''
+        self.rfc_receptor = ''
+        self.conceptos = ()
+
+
+class _CfdiSchema:
+    """Etiquetas y XPath precompiladas para un namespace de CFDI."""
+    __slots__ = ('emisor', 'receptor', 'concepto', 'tasas')
+
+    def __init__(self, ns):
+        self.emisor = '{%s}Emisor' % ns
+        self.receptor = '{%s}Receptor' % ns
+        self.concepto = '{%s}Concepto' % ns
+        # Relativa al Concepto: solo traslados propios (no los globales)
+        self.tasas = etree.XPath(
+            'cfdi:Impuestos/cfdi:Traslados/cfdi:Traslado/@TasaOCuota',
+            namespaces={'cfdi': ns},
+        )
+
+
+_SCHEMAS = {ns: _CfdiSchema(ns) for ns in (NS_CFDI_33, NS_CFDI_40)}
+
+
+def _get_schema(root):
+    """Esquema según el namespace del Comprobante (los no estándar se compilan al vuelo)."""
+    qname = etree.QName(root)
+    if not qname.namespace or qname.localname != 'Comprobante':
+        raise CfdiError(_('El archivo no es un CFDI (nodo raíz: %s).') % root.tag)
+    return _SCHEMAS.get(qname.namespace) or _CfdiSchema(qname.namespace)
+
+
+def _parse_fecha(value):
+    """'2026-02-15T10:30:00' (con o sin fracción/zona) -> datetime."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+
+
+def parse_cfdi(content):
+    """
+    Parsea el XML (bytes) de un CFDI en una sola pasada.
+
+    Raises:
+        CfdiError: el XML no es válido, no está timbrado o le faltan datos.
+    """
+    doc = CfdiDocument()
+    conceptos = []
+    schema = None
+    emisor = receptor = False
+    events = etree.iterparse(
+        io.BytesIO(content), events=('start', 'end'),
+        resolve_entities=False, no_network=True, remove_comments=True,
+    )
+    try:
+        for event, elem in events:
+            if event == 'start':
+                if schema is None:
+                    # Nodo raíz: versión por namespace y atributos del comprobante
+                    schema = _get_schema(elem)
+                    _read_comprobante(doc, elem)
+                continue
+            tag = elem.tag
+            if tag == schema.concepto:
+                conceptos.append(CfdiConcepto(
+                    elem.get('Descripcion', ''),
+                    float(elem.get('Cantidad', '1.0')),
+                    float(elem.get('ValorUnitario', '0.0')),
+                    float(elem.get('Importe', '0.0')),
+                    [float(tasa) for tasa in schema.tasas(elem)],
+                ))
+                # Liberar el concepto ya leído y sus hermanos anteriores
+                elem.clear()
+                parent = elem.getparent()
+                while elem.getprevious() is not None:
+                    del parent[0]
+            elif tag == schema.emisor:
+                emisor = True
+                doc.rfc_emisor = elem.get('Rfc', '')
+                doc.nombre_emisor = elem.get('Nombre', '')
+            elif tag == schema.receptor:
+                receptor = True
+                doc.rfc_receptor = elem.get('Rfc', '')
+            elif tag == TFD_TAG:
+                doc.uuid = (elem.get('UUID') or '').upper()
+    except CfdiError:
+        raise
+    except etree.XMLSyntaxError as e:
+        raise CfdiError(_('El archivo no es un XML válido: %s') % e) from e
+    except (TypeError, ValueError) as e:
+        raise CfdiError(_('Estructura del XML inválida o faltan campos requeridos: %s') % e) from e
+
+    if not doc.uuid:
+        raise CfdiError(_('El XML no tiene Timbre Fiscal Digital (no está timbrado).'))
+    if not (emisor and receptor):
+        raise CfdiError(_('Estructura del XML inválida o faltan campos requeridos: %s')
+                        % _('Emisor o Receptor'))
+    doc.conceptos = tuple(conceptos)
+    return doc
+
+
+def _read_comprobante(doc, root):
+    """Atributos del nodo Comprobante."""
+    doc.version = root.get('Version', '')
+    doc.serie = root.get('Serie', '')
+    doc.folio = f"{doc.serie}{root.get('Folio', '')}".strip()
+    doc.fecha = _parse_fecha(root.get('Fecha', ''))
+    doc.tipo = root.get('TipoDeComprobante', 'I')
+    doc.forma_pago = root.get('FormaPago', '')
+    doc.metodo_pago = root.get('MetodoPago', '')
+    doc.moneda = root.get('Moneda', 'MXN')
+    doc.tipo_cambio = float(root.get('TipoCambio', '1.0'))
+    doc.subtotal = float(root.get('SubTotal', '0.0'))
+    doc.total = float(root.get('Total', '0.0'))
+
+
+def get_document(content):
+    """Documento parseado desde el caché de proceso (por sha256 del contenido)."""
+    key = hashlib.sha256(content).digest()
+    with _PARSED_CACHE_LOCK:
+        doc = _PARSED_CACHE.get(key)
+        if doc is not None:
+            _PARSED_CACHE.move_to_end(key)
+            return doc
+    doc = parse_cfdi(content)
+    with _PARSED_CACHE_LOCK:
+        _PARSED_CACHE[key] = doc
+        while len(_PARSED_CACHE) > _PARSED_CACHE_SIZE:
+            _PARSED_CACHE.popitem(last=False)
+    return doc
+
+
+class BuildingCfdiParser(models.AbstractModel):
+    """
+    Parser de CFDI compartido por el wizard de carga (previsualización y
+    carga) y la carga masiva.
+    """
+    _name = 'building.cfdi.parser'
+    _description = 'Parser de CFDI'
+
+    @api.model
+    def parse(self, content):
+        """
+        CfdiDocument del XML.
+
+        Args:
+            content: bytes del XML.
+
+        Raises:
+            UserError: el XML no es un CFDI timbrado legible.
+        """
+        try:
+            return get_document(content)
+        except CfdiError as e:
+            raise UserError(str(e)) from e
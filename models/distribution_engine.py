@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de Distribución (building.distribution.engine)
+
+Calcula y escribe la distribución por periodos de muchas partidas en una
+sola pasada: un vector de pesos por rango de periodos (uniforme, carga
+inicial, curva S o pesos personalizados), un DELETE y un INSERT masivos.
+Los totales de partida, capítulo, presupuesto y obra se recalculan por
+dependencias ORM, una sola vez por registro.
+
+ALMACENAMIENTO COMPACTO:
+------------------------
+Si el presupuesto tiene `compact_distribution`, la distribución de cada
+partida se guarda como un vector JSON en `distribution_vector` (índice 0 =
+M1) en lugar de una fila de building.budget.period.value por periodo.
+read_period_matrix() lee ambas representaciones con la misma forma, y
+expand_lines() / compact_lines() convierten entre ellas.
+"""
+
+import json
+import math
+
+from odoo import models, api, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL
+
+DISTRIBUTION_METHODS = [
+    ('uniform', 'Uniforme'),
+    ('front_loaded', 'Carga Inicial'),
+    ('s_curve', 'Curva S'),
+    ('custom', 'Pesos Personalizados'),
+]
+
+
+class BuildingDistributionEngine(models.AbstractModel):
+    """
+    Motor de Distribución Centralizado.
+    Reparte el importe distribuible (importe - anticipo) de las partidas
+    entre sus periodos según un método de pesos.
+    """
+    _name = 'building.distribution.engine'
+    _description = 'Motor de Distribución'
+
+    @api.model
+    def get_weights(self, method, num_periods, custom_weights=None):
+        """
+        Vector de pesos normalizado (suma 1) para num_periods periodos.
+
+        - uniform: todos iguales.
+        - front_loaded: decreciente lineal (n, n-1, ..., 1).
+        - s_curve: incrementos de la curva acumulada 3t² - 2t³
+          (poco al inicio y al final, máximo a la mitad).
+        - custom: custom_weights (lista de números >= 0); si su longitud no
+          coincide con num_periods se reescala por interpolación.
+        """
+        if num_periods <= 0:
+            return []
+        if method == 'front_loaded':
+            raw = [float(num_periods - i) for i in range(num_periods)]
+        elif method == 's_curve':
+            def cumulative(t):
+                return 3 * t * t - 2 * t * t * t
+            raw = [
+                cumulative((i + 1) / num_periods) - cumulative(i / num_periods)
+                for i in range(num_periods)
+            ]
+        elif method == 'custom':
+            raw = self._resample_weights(custom_weights or [], num_periods)
+        else:
+            raw = [1.0] * num_periods
+
+        total = sum(raw)
+        if total <= 0:
+            raise UserError(_('Los pesos de distribución deben sumar un valor mayor a cero.'))
+        return [w / total for w in raw]
+
+    @api.model
+    def _resample_weights(self, weights, num_periods):
+        """Ajusta un vector de pesos personalizado a num_periods (interpolación lineal)."""
+        weights = [float(w) for w in weights]
+        if any(w < 0 for w in weights):
+            raise UserError(_('Los pesos de distribución no pueden ser negativos.'))
+        if not weights:
+            raise UserError(_('Debe indicar los pesos personalizados de la distribución.'))
+        if len(weights) == num_periods:
+            return weights
+        if len(weights) == 1 or num_periods == 1:
+            return [sum(weights) / len(weights)] * num_periods
+        step = (len(weights) - 1) / (num_periods - 1)
+        result = []
+        for i in range(num_periods):
+            pos = i * step
+            low = math.floor(pos)
+            high = min(low + 1, len(weights) - 1)
+            frac = pos - low
+            result.append(weights[low] * (1 - frac) + weights[high] * frac)
+        return result
+
+    @api.model
+    def _get_line_periods(self, line):
+        """Rango de periodos válido (desde, hasta) de una partida, acotado a la duración."""
+        duration = line.budget_id.duration_months
+        period_from = line.period_from or 1
+        period_to = line.period_to or duration
+        period_to = min(period_to, duration)
+        period_from = max(period_from, 1)
+        period_from = min(period_from, period_to)
+        return period_from, period_to
+
+    @api.model
+    def compute_distribution(self, lines, method='uniform', custom_weights=None):
+        """
+        Calcula la distribución de las partidas sin escribirla.
+
+        Los vectores de pesos se calculan una vez por longitud de rango.
+        El residuo de redondeo flotante se asigna al último periodo para que
+        la suma coincida exactamente con el importe distribuible.
+
+        Returns:
+            dict: {line_id: [(period_number, amount), ...]}
+        """
+        weights_cache = {}
+        result = {}
+        for line in lines:
+            if not line.budget_id or line.budget_id.duration_months <= 0:
+                continue
+            period_from, period_to = self._get_line_periods(line)
+            num_periods = period_to - period_from + 1
+            if num_periods not in weights_cache:
+                weights_cache[num_periods] = self.get_weights(method, num_periods, custom_weights)
+            weights = weights_cache[num_periods]
+
+            distributable = line.amount - line.advance
+            amounts = [distributable * w for w in weights]
+            if amounts:
+                amounts[-1] = distributable - sum(amounts[:-1])
+            result[line.id] = list(zip(range(period_from, period_to + 1), amounts))
+        return result
+
+    @api.model
+    def distribute_lines(self, lines, method='uniform', custom_weights=None):
+        """
+        Distribuye las partidas y reemplaza sus valores por periodo con un
+        DELETE y un INSERT masivos (sin creates individuales). Las partidas
+        de presupuestos compactos guardan el vector en lugar de filas.
+
+        Returns:
+            int: número de partidas distribuidas.
+        """
+        lines = lines.filtered('id')
+        distribution = self.compute_distribution(lines, method, custom_weights)
+        if not distribution:
+            return 0
+        compact_ids = set(lines.filtered(lambda l: l.budget_id.compact_distribution).ids)
+        self._write_distribution(
+            {lid: values for lid, values in distribution.items() if lid not in compact_ids},
+            {lid: values for lid, values in distribution.items() if lid in compact_ids},
+        )
+        return len(distribution)
+
+    @api.model
+    def _write_distribution(self, row_distribution, compact_distribution):
+        """
+        Reemplaza la distribución de las partidas indicadas.
+
+        Args:
+            row_distribution: {line_id: [(period, amount)]} a guardar como filas.
+            compact_distribution: {line_id: [(period, amount)]} a guardar como vector.
+        """
+        line_ids = list(row_distribution) + list(compact_distribution)
+        if not line_ids:
+            return
+        Period = self.env['building.budget.period.value']
+        Line = self.env['building.budget.line']
+        Period.flush_model()
+        Line.flush_model(['chapter_id', 'budget_id', 'distribution_vector'])
+        cr = self.env.cr
+
+        # 1. Un DELETE para todas las filas previas
+        cr.execute(SQL(
+            "DELETE FROM building_budget_period_value WHERE line_id = ANY(%s)",
+            line_ids,
+        ))
+
+        # 2. Vectores: los de filas se limpian, los compactos se escriben (un UPDATE)
+        vectors = {lid: None for lid in row_distribution}
+        vectors.update({
+            lid: json.dumps(self._to_vector(values))
+            for lid, values in compact_distribution.items()
+        })
+        cr.execute(SQL(
+            """
+            UPDATE building_budget_line l
+               SET distribution_vector = v.vector,
+                   write_date = (now() at time zone 'UTC')
+              FROM unnest(%s::int[], %s::jsonb[]) AS v(id, vector)
+             WHERE l.id = v.id
+            """,
+            list(vectors), list(vectors.values()),
+        ))
+
+        # 3. Un INSERT para todas las filas nuevas
+        line_col, period_col, amount_col = [], [], []
+        for line_id, values in row_distribution.items():
+            for period_number, amount in values:
+                line_col.append(line_id)
+                period_col.append(period_number)
+                amount_col.append(amount)
+        if line_col:
+            self._insert_period_rows(line_col, period_col, amount_col)
+
+        # Sincronizar caché y disparar los totales dependientes (una vez por registro)
+        Period.invalidate_model()
+        lines = Line.browse(line_ids)
+        lines.invalidate_recordset(['period_value_ids', 'distribution_vector'])
+        lines.modified(['period_value_ids', 'distribution_vector'])
+        self.env['building.budget']._bump_distribution_version(lines.budget_id.ids)
+
+    @api.model
+    def _insert_period_rows(self, line_col, period_col, amount_col):
+        """INSERT masivo de valores por periodo a partir de columnas paralelas."""
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO building_budget_period_value
+                   (line_id, period_number, amount, period_name, chapter_id, budget_id,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT v.line_id, v.period_number, v.amount, 'M' || v.period_number,
+                   l.chapter_id, l.budget_id,
+                   %(uid)s, (now() at time zone 'UTC'), %(uid)s, (now() at time zone 'UTC')
+              FROM unnest(%(lines)s::int[], %(periods)s::int[], %(amounts)s::float8[])
+                   AS v(line_id, period_number, amount)
+              JOIN building_budget_line l ON l.id = v.line_id
+            """,
+            uid=self.env.uid,
+            lines=line_col,
+            periods=period_col,
+            amounts=amount_col,
+        ))
+
+    # === ALMACENAMIENTO COMPACTO ===
+    @api.model
+    def _to_vector(self, values):
+        """[(period, amount)] -> [M1, M2, ...] (ceros fuera del rango)."""
+        values = [(period, amount) for period, amount in values if period and period > 0]
+        if not values:
+            return []
+        vector = [0.0] * max(period for period, _amount in values)
+        for period, amount in values:
+            vector[period - 1] += amount
+        return vector
+
+    @api.model
+    def read_period_matrix(self, lines):
+        """
+        Pivote de la distribución por partida, sin importar cómo se guarda.
+
+        Una consulta agrupada para las filas y una lectura de los vectores.
+
+        Returns:
+            dict: {line_id: {period_number: amount}}
+        """
+        lines = lines.filtered('id')
+        matrix = {line.id: {} for line in lines}
+        if not lines:
+            return matrix
+        groups = self.env['building.budget.period.value']._read_group(
+            [('line_id', 'in', lines.ids)],
+            groupby=['line_id', 'period_number'],
+            aggregates=['amount:sum'],
+        )
+        for line, period_number, amount in groups:
+            row = matrix[line.id]
+            row[period_number] = row.get(period_number, 0.0) + (amount or 0.0)
+        for line in lines:
+            row = matrix[line.id]
+            for index, amount in enumerate(line.distribution_vector or []):
+                if amount:
+                    row[index + 1] = row.get(index + 1, 0.0) + amount
+        return matrix
+
+    @api.model
+    def compact_lines(self, lines):
+        """Convierte la distribución por filas de las partidas a vector compacto."""
+        matrix = self.read_period_matrix(lines)
+        self._write_distribution({}, {
+            line_id: sorted(row.items()) for line_id, row in matrix.items()
+        })
+        return len(matrix)
+
+    @api.model
+    def expand_lines(self, lines):
+        """Materializa el vector compacto de las partidas como filas editables."""
+        lines = lines.filtered('distribution_vector')
+        matrix = self.read_period_matrix(lines)
+        self._write_distribution({
+            line_id: sorted(row.items()) for line_id, row in matrix.items()
+        }, {})
+        return len(matrix)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api, _
+from odoo.tools import SQL
 
 class BuildingFinancialEngine(models.AbstractModel):
     """
@@ -13,127 +14,229 @@ class BuildingFinancialEngine(models.AbstractModel):
     @api.model
     def get_real_amounts(self, work_id, stage_ids=None, line_ids=None):
         """
-        Retorna diccionario con montos reales agrupados por ID.
+        Retorna diccionario con montos reales agrupados por partida.
         Depende de work.real_source.
+
+        Envoltura de get_real_amounts_multi() para una sola obra.
         """
-        work = self.env['building.work'].browse(work_id)
-        if not work:
+        if not work_id:
             return {}
+        return self.get_real_amounts_multi([work_id], line_ids=line_ids).get(work_id, {})
 
-        amounts = {} # {line_id: amount} or {stage_id: amount} logic to be defined by caller need
-        
-        # En esta implementación simplificada, retornamos totales por objeto solicitado.
-        # Pero para eficiencia, calculamos todo lo necesario.
-        
-        # Estrategia: Calcular por PARTIDA (granularidad más baja) y luego sumarizar.
-        
-        domain = [('work_id', '=', work.id)]
+    @api.model
+    def get_real_amounts_multi(self, work_ids, line_ids=None):
+        """
+        Montos reales por partida para muchas obras en una sola consulta.
+
+        Retorna: {work_id: {budget_line_id: amount}}
+        """
+        return self._get_real_amounts_grouped(work_ids, 'budget_line_id', line_ids=line_ids)
+
+    @api.model
+    def _get_real_amounts_grouped(self, work_ids, groupby, line_ids=None, stage_ids=None):
+        """
+        Suma de gastos reales aprobados agrupada por obra y `groupby`
+        (budget_line_id o stage_id) en UNA consulta, respetando la fuente
+        de cada obra:
+
+        - real_source = 'internal' (Plan A): todas las líneas internas aprobadas.
+        - real_source = 'accounting' (Plan B): solo internas NO migradas
+          (las migradas ya vienen en contabilidad) y anteriores a la fecha
+          de corte, si existe ("Solo Corte"), MÁS lo contable desde el corte
+          (ver _get_accounting_amounts_grouped).
+
+        Retorna: {work_id: {groupby_id: amount}} (False si no hay agrupador)
+        """
+        work_ids = list({wid for wid in work_ids if wid})
+        result = {wid: {} for wid in work_ids}
+        if not work_ids:
+            return result
+
+        self.env['building.real.line'].flush_model(
+            ['work_id', 'stage_id', 'budget_line_id', 'amount', 'date', 'is_migrated', 'approval_state']
+        )
+        self.env['building.work'].flush_model(['real_source', 'real_cutover_date'])
+
+        conditions = [
+            SQL("r.work_id = ANY(%s)", work_ids),
+            # Solo gastos aprobados impactan los KPIs (Etapa 5.2)
+            SQL("r.approval_state = 'approved'"),
+            SQL("""(w.real_source = 'internal'
+                    OR (NOT COALESCE(r.is_migrated, FALSE)
+                        AND (w.real_cutover_date IS NULL OR r.date < w.real_cutover_date)))"""),
+        ]
         if line_ids:
-            domain.append(('budget_line_id', 'in', line_ids))
-            
-        RealLine = self.env['building.real.line']
-        
-        # 1. FUENTE INTERNA (Plan A)
-        # Sumar todas las no migradas.
-        # Si fuente es Accounting, sumar solo las pre-corte (que conceptualmente son historicas no migradas o migradas)
-        # NOTA: Si hubo migración, las lineas tienen is_migrated=True.
-        # El motor debe decidir: ¿Sumamos is_migrated?
-        # NO. Si is_migrated=True, se asume que YA están en contabilidad (account.move).
-        # Por tanto, si leemos de contabilidad, ya vendrán ahí.
-        
-        # Si real_source = 'internal':
-        #   Sumar TODAS las internas activo (no borradas). (is_migrated debería ser False siempre, salvo glitch)
-        
-        # Si real_source = 'accounting':
-        #   A) Sumar Contabilidad (account.move.line)
-        #   B) Sumar Internas que NO han sido migradas y fecha < corte (caso "Solo Corte").
-        
-        # Solo contar gastos aprobados en los KPIs (Etapa 5.2)
-        internal_domain = domain + [('approval_state', '=', 'approved')]
-
-        if work.real_source == 'internal':
-             # Plan A puro: Todo lo interno vale (pero solo aprobados)
-             pass
-        else:
-             # Plan B: Contabilidad Activada
-             # Excluir las migradas (porque se sumaran via asientos)
-             internal_domain.append(('is_migrated', '=', False))
-             
-             # Adicionalmente, si hay fecha de corte, asegurar que no sumamos cosas futuras por error
-             if work.real_cutover_date:
-                 internal_domain.append(('date', '<', work.real_cutover_date))
-
-        # Agrupar por budget_line_id
-        # _read_group es lo más eficiente (Odoo 19)
-        groups = RealLine._read_group(internal_domain, groupby=['budget_line_id'], aggregates=['amount:sum'])
-        
-        real_amounts_by_line = {rec.id: (amount_sum or 0.0) for rec, amount_sum in groups}
-        
-        # 2. FUENTE CONTABLE (Plan B)
-        if work.real_source == 'accounting':
-            # TODO: Implementar query a account.move.line
-            # Por ahora retorna 0 + lo interno válido (Solo Corte)
-            pass
-            
-        return real_amounts_by_line
+            conditions.append(SQL("r.budget_line_id = ANY(%s)", list(line_ids)))
+        if stage_ids:
+            conditions.append(SQL("r.stage_id = ANY(%s)", list(stage_ids)))
+
+        self.env.cr.execute(SQL(
+            """
+            SELECT r.work_id, r.%(groupby)s, SUM(r.amount)
+              FROM building_real_line r
+              JOIN building_work w ON w.id = r.work_id
+             WHERE %(conditions)s
+          GROUP BY r.work_id, r.%(groupby)s
+            """,
+            groupby=SQL.identifier(groupby),
+            conditions=SQL(" AND ").join(conditions),
+        ))
+        for work_id, key, amount in self.env.cr.fetchall():
+            result[work_id][key or False] = amount or 0.0
+
+        # 2. FUENTE CONTABLE (Plan B): se suma a lo interno anterior al corte
+        accounting = self._get_accounting_amounts_grouped(
+            work_ids, groupby, line_ids=line_ids, stage_ids=stage_ids,
+        )
+        for work_id, amounts in accounting.items():
+            for key, amount in amounts.items():
+                result[work_id][key] = result[work_id].get(key, 0.0) + amount
+        return result
+
+    @api.model
+    def _get_accounting_amounts_grouped(self, work_ids, groupby, line_ids=None, stage_ids=None):
+        """
+        Gasto contable (Plan B) agrupado por obra y `groupby` sin cargar
+        apuntes en el ORM.
+
+        Suma las líneas analíticas de las cuentas hijas de cada partida
+        (creadas por action_generate_analytics) desde la fecha de corte:
+        - Solo apuntes publicados (o líneas analíticas sin apunte).
+        - El gasto es negativo en analítica: importe = -SUM(amount).
+        - Lo imputado a la cuenta padre de la obra (sin partida) queda en la
+          llave False, salvo que se filtre por partidas o etapas.
+
+        Una consulta agrupada por plan analítico (la columna de la cuenta
+        depende del plan: account_id o x_plan<id>_id).
+
+        Retorna: {work_id: {groupby_id: amount}} solo para obras en Plan B.
+        """
+        Work = self.env['building.work']
+        Work.flush_model(['real_source', 'real_cutover_date', 'analytic_account_id'])
+        works = Work.search([('id', 'in', work_ids), ('real_source', '=', 'accounting')])
+        result = {}
+        if not works:
+            return result
+
+        BudgetLine = self.env['building.budget.line']
+        BudgetLine.flush_model(['work_id', 'stage_id', 'analytic_account_id'])
+        line_domain = [('work_id', 'in', works.ids), ('analytic_account_id', '!=', False)]
+        if line_ids:
+            line_domain.append(('id', 'in', list(line_ids)))
+        if stage_ids:
+            line_domain.append(('stage_id', 'in', list(stage_ids)))
+        lines = BudgetLine.search(line_domain)
+        accounts = lines.analytic_account_id
+        with_work_accounts = not line_ids and not stage_ids
+        if with_work_accounts:
+            accounts |= works.analytic_account_id
+        if not accounts:
+            return result
+
+        self.env['account.analytic.line'].flush_model()
+        self.env['account.move.line'].flush_model(['parent_state'])
+        for plan in accounts.root_plan_id:
+            column = SQL.identifier(plan._column_name())
+            branches = [SQL(
+                """
+                SELECT bl.work_id, bl.%(groupby)s AS key, aal.amount, aal.date
+                  FROM account_analytic_line aal
+                  JOIN building_budget_line bl ON bl.analytic_account_id = aal.%(column)s
+                  LEFT JOIN account_move_line aml ON aml.id = aal.move_line_id
+                 WHERE bl.id = ANY(%(line_ids)s)
+                   AND (aal.move_line_id IS NULL OR aml.parent_state = 'posted')
+                """,
+                groupby=SQL.identifier(groupby),
+                column=column,
+                line_ids=lines.ids,
+            )]
+            if with_work_accounts:
+                # Cuenta padre de la obra: gasto sin partida
+                branches.append(SQL(
+                    """
+                    SELECT w.id, NULL::int4, aal.amount, aal.date
+                      FROM account_analytic_line aal
+                      JOIN building_work w ON w.analytic_account_id = aal.%(column)s
+                      LEFT JOIN account_move_line aml ON aml.id = aal.move_line_id
+                     WHERE w.id = ANY(%(work_ids)s)
+                       AND (aal.move_line_id IS NULL OR aml.parent_state = 'posted')
+                    """,
+                    column=column,
+                    work_ids=works.ids,
+                ))
+            self.env.cr.execute(SQL(
+                """
+                SELECT src.work_id, src.key, -SUM(src.amount)
+                  FROM (%(branches)s) AS src(work_id, key, amount, date)
+                  JOIN building_work w ON w.id = src.work_id
+                 WHERE w.real_cutover_date IS NULL OR src.date >= w.real_cutover_date
+              GROUP BY src.work_id, src.key
+                """,
+                branches=SQL(" UNION ALL ").join(branches),
+            ))
+            for work_id, key, amount in self.env.cr.fetchall():
+                amounts = result.setdefault(work_id, {})
+                amounts[key or False] = amounts.get(key or False, 0.0) + (amount or 0.0)
+        return result
+
+    @api.model
+    def get_real_totals_multi(self, work_ids):
+        """
+        Gasto real total por obra (interno + contable según la fuente).
+
+        Retorna: {work_id: amount}
+        """
+        grouped = self._get_real_amounts_grouped(work_ids, 'budget_line_id')
+        return {work_id: sum(amounts.values()) for work_id, amounts in grouped.items()}
 
     @api.model
     def get_stage_financial_totals(self, work_id, stage_ids=None):
         """
         Retorna totales financieros agrupados por etapa (budget y real).
         Estructura: {stage_id: {'budget': float, 'real': float}}
+
+        Envoltura de get_stage_financial_totals_multi() para una sola obra.
         """
-        work = self.env['building.work'].browse(work_id)
-        if not work:
+        if not work_id:
             return {}
+        return self.get_stage_financial_totals_multi([work_id], stage_ids=stage_ids).get(work_id, {})
 
-        domain_stages = [('work_id', '=', work.id)]
-        if stage_ids:
-            domain_stages.append(('id', 'in', stage_ids))
+    @api.model
+    def get_stage_financial_totals_multi(self, work_ids, stage_ids=None):
+        """
+        Totales financieros por etapa para muchas obras.
+
+        Una consulta agrupada por fuente (presupuesto y real), sin importar
+        el número de obras.
+        Estructura: {work_id: {stage_id: {'budget': float, 'real': float}}}
+        """
+        work_ids = list({wid for wid in work_ids if wid})
+        result = {wid: {} for wid in work_ids}
+        if not work_ids:
+            return result
 
+        domain_stages = [('work_id', 'in', work_ids)]
+        if stage_ids:
+            domain_stages.append(('id', 'in', list(stage_ids)))
         stages = self.env['building.work.stage'].search(domain_stages)
-        
-        # 1. Calcular Presupuesto por Etapa (Suma de partidas)
-        # Eficiente: _read_group sobre building.budget.line
-        BudgetLine = self.env['building.budget.line']
-        budget_groups = BudgetLine._read_group(
-            [('work_id', '=', work_id), ('stage_id', 'in', stages.ids)],
+
+        # 1. Presupuesto por Etapa (Suma de partidas) - _read_group sobre building.budget.line
+        budget_groups = self.env['building.budget.line']._read_group(
+            [('work_id', 'in', work_ids), ('stage_id', 'in', stages.ids)],
             groupby=['stage_id'],
             aggregates=['amount:sum']
         )
         budget_map = {rec.id: (amount_sum or 0.0) for rec, amount_sum in budget_groups}
 
-        # 2. Calcular Real por Etapa (Delegar a get_real_amounts)
-        # Obtenemos real por partida y sumamos, O implementar get_real_amounts por stage
-        # Para eficiencia, hagámoslo directo aquí similar a get_real_amounts pero agrupando por stage
-        
-        RealLine = self.env['building.real.line']
-        # Solo gastos aprobados impactan los KPIs (Etapa 5.2)
-        real_domain = [
-            ('work_id', '=', work.id),
-            ('stage_id', 'in', stages.ids),
-            ('approval_state', '=', 'approved'),
-        ]
-
-        # Lógica de fuente (copiada de get_real_amounts simplificada)
-        if work.real_source == 'accounting':
-             real_domain.append(('is_migrated', '=', False))
-             if work.real_cutover_date:
-                 real_domain.append(('date', '<', work.real_cutover_date))
-        
-        real_groups = RealLine._read_group(
-            real_domain,
-            groupby=['stage_id'],
-            aggregates=['amount:sum']
-        )
-        real_map = {rec.id: (amount_sum or 0.0) for rec, amount_sum in real_groups}
+        # 2. Real por Etapa (respeta fuente y fecha de corte de cada obra)
+        real_by_work = self._get_real_amounts_grouped(work_ids, 'stage_id', stage_ids=stages.ids)
 
         # 3. Construir resultado
-        result = {}
         for stage in stages:
-            result[stage.id] = {
+            work_id = stage.work_id.id
+            result[work_id][stage.id] = {
                 'budget': budget_map.get(stage.id, 0.0),
-                'real': real_map.get(stage.id, 0.0)
+                'real': real_by_work[work_id].get(stage.id, 0.0),
             }
         return result
 
@@ -144,6 +247,25 @@ class BuildingFinancialEngine(models.AbstractModel):
         except:
             return 0.0
 
+    @api.model
+    def get_thresholds(self, default_warning=90.0, default_critical=100.0):
+        """
+        Umbrales de semáforo (building.budget_real_threshold_*).
+
+        get_param ya está en el ormcache de ir.config_parameter (y se
+        invalida al cambiar el parámetro); cada llamador aplica su propio
+        default (partidas 90%, etapas 80%).
+
+        Retorna: (threshold_warning, threshold_critical)
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        warning = ICP.get_param('building.budget_real_threshold_warning')
+        critical = ICP.get_param('building.budget_real_threshold_critical')
+        return (
+            float(warning) if warning else default_warning,
+            float(critical) if critical else default_critical,
+        )
+
     @api.model
     def get_traffic_light(self, budget, real, threshold_warning=90.0, threshold_critical=100.0):
         """
@@ -32,13 +32,51 @@ FÓRMULAS:
 PUNTOS DE ENTRADA:
 ------------------
 - apply_progress(): Registra un nuevo avance y dispara recálculo.
+- apply_progress_batch(): Captura masiva; un create y un recálculo por obra.
 - recompute_hierarchy(): Recalcula toda la cadena (Line -> Stage -> Work).
+- recompute_works(): Recálculo SET-BASED de obras completas. El número de
+  consultas SQL es constante (no depende del número de partidas).
+- building.progress.snapshot: Historial diario (obra y etapa); cada recálculo
+  encola la obra y el snapshot se escribe una vez en el pre-commit.
+  get_curves() devuelve las curvas S en una consulta.
+- verify_work(): Compara los snapshots contra un recálculo completo y repara
+  las diferencias (respaldo del modo incremental).
+
+MODO INCREMENTAL (apply_progress):
+----------------------------------
+Un avance individual no re-suma la historia: aplica el delta directamente.
+   line.progress  = clamp(line.progress + delta, 0, 100)   -> delta efectivo
+   stage.progress_weighted += delta_efectivo * line.amount
+   stage.progress = stage.progress_weighted / stage.planned_amount
+   work.progress  = SUM(stage.progress * stage.planned_amount) / SUM(stage.planned_amount)
+   (promedio simple cuando los importes son 0, igual que el cálculo completo)
+Si la obra ya tiene recálculos pendientes en la cola, el snapshot no es
+confiable y se usa la ruta completa.
+
+COLA DIFERIDA (por transacción):
+--------------------------------
+Los CRUD de avances/partidas NO recalculan directamente: marcan la obra como
+"sucia" con mark_dirty(). La cola se deduplica por obra y se vacía:
+- Al salir del bloque `with engine.deferred_recompute():` más externo.
+- En el pre-commit de la transacción (red de seguridad).
+Fuera de un bloque diferido, mark_dirty() vacía la cola de inmediato
+(comportamiento síncrono tradicional).
 """
 
+import contextlib
+import logging
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL
 from odoo.tools.float_utils import float_compare
 
+# Llave de la cola de recálculo en cr.precommit.data (vive lo que la transacción)
+DIRTY_QUEUE_KEY = 'building.progress.engine.dirty'
+
+_logger = logging.getLogger(__name__)
+
+
 class BuildingProgressEngine(models.AbstractModel):
     _name = 'building.progress.engine'
     _description = 'Motor de Cálculo de Avances'
@@ -75,20 +113,184 @@ class BuildingProgressEngine(models.AbstractModel):
             'notes': note,
             'state': 'confirmed', # Auto-confirmar al venir del engine
         }
-        log = ProgressLog.create(log_vals)
-        
-        # 3. Disparar Recálculo Jerárquico
-        # Pasamos los IDs afectados para optimizar, aunque el recompute suele ser cascada
-        self.recompute_hierarchy(project_id, stage_ids=[stage_id], line_ids=[wbs_item_id])
-        
-        return log
+        # El propio engine propaga el avance: el log no dispara la cola
+        log = ProgressLog.with_context(skip_progress_engine=True).create(log_vals)
+
+        # 3. Propagar el delta (O(1)); ruta completa si la obra tiene pendientes
+        if not self._has_pending(log.work_id.id):
+            self._apply_delta(log.line_id, log.percent_period, log.date, log.user_id.id)
+        else:
+            self.mark_dirty(log.work_id.id, stage_ids=[stage_id], line_ids=[wbs_item_id])
+
+        # No propagar el contexto de omisión a quien reciba el registro
+        return log.with_env(self.env)
+
+    @api.model
+    def apply_progress_batch(self, entries, user_id=None):
+        """
+        Registra muchos avances en una sola operación (captura masiva de obra).
+
+        A diferencia de llamar apply_progress() por renglón:
+        1. El tope de 100% acumulado se valida para todo el lote con una
+           sola consulta agrupada.
+        2. Los logs se crean con un único create(vals_list).
+        3. Cada obra afectada se recalcula una sola vez (modo set-based).
+
+        Args:
+            entries (list): tuplas (partida, porcentaje, fecha, nota). La partida
+                puede ser id o registro; fecha y nota son opcionales.
+            user_id (int): responsable de los avances (por defecto el usuario actual).
+
+        Returns:
+            recordset: los registros creados en building.budget.progress
+        """
+        ProgressLog = self.env['building.budget.progress']
+        if not entries:
+            return ProgressLog
+
+        today = fields.Date.context_today(self)
+        user_id = user_id or self.env.user.id
+        rows = []
+        for entry in entries:
+            line, percent, date, note = (tuple(entry) + (None, None))[:4]
+            line_id = line.id if isinstance(line, models.BaseModel) else line
+            if not line_id:
+                raise ValidationError(_('Cada avance debe indicar la partida.'))
+            rows.append((line_id, percent or 0.0, date or today, note))
+
+        # 1. Tope 100%: acumulado confirmado actual + lo que trae el lote
+        line_ids = list({row[0] for row in rows})
+        current = dict(ProgressLog._read_group(
+            [('line_id', 'in', line_ids), ('state', '=', 'confirmed')],
+            groupby=['line_id'], aggregates=['percent_period:sum'],
+        ))
+        lines = self.env['building.budget.line'].browse(line_ids)
+        batch_totals = dict.fromkeys(line_ids, 0.0)
+        for line_id, percent, _date, _note in rows:
+            batch_totals[line_id] += percent
+        exceeded = [
+            _('%s: acumulado %.2f%%') % (line.display_name, current.get(line, 0.0) + batch_totals[line.id])
+            for line in lines
+            if current.get(line, 0.0) + batch_totals[line.id] > 100.01  # Tolerancia flotante
+        ]
+        if exceeded:
+            raise ValidationError(_(
+                'El avance acumulado no puede exceder el 100%%.\n%s'
+            ) % '\n'.join(exceeded))
+
+        # 2. Un solo create; el engine recalcula al final (no por registro)
+        logs = ProgressLog.with_context(skip_progress_engine=True).create([{
+            'line_id': line_id,
+            'date': date,
+            'percent_period': percent,
+            'user_id': user_id,
+            'notes': note,
+            'state': 'confirmed',
+        } for line_id, percent, date, note in rows])
+
+        # 3. Un recálculo set-based por obra afectada
+        with self.deferred_recompute():
+            for work in lines.work_id:
+                self.mark_dirty(work.id)
+
+        return logs.with_env(self.env)
+
+    @api.model
+    def _has_pending(self, work_id):
+        """Indica si la obra tiene recálculos pendientes en la cola diferida."""
+        queue = self.env.cr.precommit.data.get(DIRTY_QUEUE_KEY)
+        return bool(queue and work_id in queue['works'])
+
+    @api.model
+    def _apply_delta(self, line, delta, date, user_id):
+        """
+        Propaga un avance individual sin re-sumar partidas ni etapas.
+
+        El costo no depende del número de partidas de la obra: se leen los
+        snapshots actuales de partida y etapa (con sus totales guardados) y la
+        obra se pliega sobre sus filas de etapa.
+        """
+        stage = line.stage_id
+        work = line.work_id
+
+        # 1. PARTIDA: clamp 0-100, el delta efectivo es lo que realmente cambió
+        old_progress = line.physical_progress
+        new_progress = max(0.0, min(100.0, old_progress + delta))
+        effective = new_progress - old_progress
+        line_vals = {
+            'physical_progress': new_progress,
+            'executed_amount': line.amount * (new_progress / 100.0),
+            'last_progress_date': line.last_progress_date,
+            'last_progress_user_id': line.last_progress_user_id.id or None,
+        }
+        # El log nuevo tiene el id más alto: es el último si su fecha no es anterior
+        if date and (not line.last_progress_date or date >= line.last_progress_date):
+            line_vals['last_progress_date'] = date
+            line_vals['last_progress_user_id'] = user_id
+        self._bulk_update('building.budget.line', tuple(line_vals), [(line.id,) + tuple(line_vals.values())])
+
+        if not stage:
+            return
+
+        # 2. ETAPA: ajustar el numerador guardado; el importe planeado no cambia
+        weighted = stage.progress_weighted + effective * line.amount
+        if stage.planned_amount > 0:
+            stage_progress = weighted / stage.planned_amount
+        else:
+            stage_progress = stage.progress_pct + effective / (stage.planned_line_count or 1)
+        stage_vals = {'progress_pct': stage_progress, 'progress_weighted': weighted}
+        last_date = line_vals['last_progress_date'] and fields.Datetime.to_datetime(line_vals['last_progress_date'])
+        stage_vals['last_progress_date'] = max(d for d in (stage.last_progress_date, last_date) if d) \
+            if (stage.last_progress_date or last_date) else None
+        self._bulk_update('building.work.stage', tuple(stage_vals), [(stage.id,) + tuple(stage_vals.values())])
+
+        # 3. OBRA: pliegue sobre las filas de etapa
+        if work:
+            self._recompute_work(work)
+
+    @api.model
+    def verify_work(self, work_ids, repair=True):
+        """
+        Verifica los snapshots de las obras contra un recálculo completo.
+
+        Respaldo del modo incremental: detecta deriva (redondeos, escrituras
+        externas) y, si repair=True, la corrige con un único UPDATE por modelo.
+
+        Returns:
+            dict: {'lines': [ids], 'stages': [ids], 'works': [ids]} con diferencias.
+        """
+        work_ids = list({wid for wid in work_ids if wid})
+        if not work_ids:
+            return {'lines': [], 'stages': [], 'works': []}
+        snapshots = self._compute_work_snapshots(work_ids)
+        drift = {
+            key: [rec_id for rec_id, data in snapshots[key].items()
+                  if self._snapshot_changed(data['current'], data['new'])]
+            for key in ('lines', 'stages', 'works')
+        }
+        if any(drift.values()):
+            _logger.warning(
+                "Progress Engine: deriva en obras %s (partidas=%s, etapas=%s, obras=%s)%s",
+                work_ids, drift['lines'], drift['stages'], drift['works'],
+                " - reparada" if repair else "",
+            )
+            if repair:
+                self._write_snapshots(snapshots)
+        return drift
 
     @api.model
     def recompute_hierarchy(self, work_id, stage_ids=None, line_ids=None):
         """
         Recalcula los snapshots de Partidas -> Etapas -> Obra.
         Sigue el orden estricto de abajo hacia arriba.
+
+        Si no se indican partidas ni etapas se recalcula la obra completa
+        con el modo set-based (recompute_works).
         """
+        if work_id and not line_ids and not stage_ids:
+            self.recompute_works([work_id])
+            return
+
         # 1. Recalcular Partidas (Lines) afectadas
         if line_ids:
             lines = self.env['building.budget.line'].browse(line_ids)
@@ -148,70 +350,491 @@ class BuildingProgressEngine(models.AbstractModel):
         """
         Recalcula snapshot 'progress_pct' para las etapas.
         Formula: Promedio Ponderado por Importe.
+
+        Los totales de las partidas (importe, numerador ponderado, conteo)
+        se obtienen con una sola consulta agrupada y quedan guardados en la
+        etapa para que el avance de la obra no vuelva a sumar partidas.
         """
+        totals = self._get_stage_line_totals(stages.ids)
         for stage in stages:
-            lines = stage.budget_line_ids
-            if not lines:
+            data = totals.get(stage.id)
+            if not data:
                 # Fallback: Mantener compatibilidad con modo manual antiguo (Fase 3.2)
                 # Si no tiene líneas, se basa en sus propios logs manuales heredados
                 logs = stage.progress_ids.filtered(lambda r: r.state == 'confirmed')
                 manual_progress = sum(logs.mapped('progress_pct')) if logs else 0.0
-                stage.write({'progress_pct': max(0.0, min(100.0, manual_progress))})
+                stage.write({
+                    'progress_pct': max(0.0, min(100.0, manual_progress)),
+                    'planned_amount': 0.0,
+                    'progress_weighted': 0.0,
+                    'planned_line_count': 0,
+                })
                 continue
-                
-            total_amount = sum(lines.mapped('amount'))
-            
-            if total_amount > 0:
-                weighted_sum = sum(l.physical_progress * l.amount for l in lines)
-                stage_progress = weighted_sum / total_amount
+
+            if data['amount'] > 0:
+                stage_progress = data['weighted'] / data['amount']
             else:
                 # Promedio simple si importes son 0
-                avg_sum = sum(lines.mapped('physical_progress'))
-                stage_progress = avg_sum / len(lines) if len(lines) > 0 else 0.0
-                
-                stage_progress = avg_sum / len(lines) if len(lines) > 0 else 0.0
-            
-            # Obtener la fecha de último avance de las partidas
-            # mapped puede devolver [False, date, False], hay que filtrar
-            last_dates = [d for d in lines.mapped('last_progress_date') if d]
-            last_date = max(last_dates) if last_dates else False
-                
+                stage_progress = data['progress'] / data['count']
+
             stage.write({
                 'progress_pct': stage_progress,
-                'last_progress_date': last_date
+                'last_progress_date': data['last_date'] and fields.Datetime.to_datetime(data['last_date']),
+                'planned_amount': data['amount'],
+                'progress_weighted': data['weighted'],
+                'planned_line_count': data['count'],
             })
 
+    @api.model
+    def _get_stage_line_totals(self, stage_ids):
+        """
+        Totales de las partidas agrupados por etapa en una sola consulta.
+
+        Returns:
+            dict: {stage_id: {'amount', 'weighted', 'progress', 'count', 'last_date'}}
+        """
+        if not stage_ids:
+            return {}
+        self.env['building.budget.line'].flush_model(
+            ['stage_id', 'amount', 'physical_progress', 'last_progress_date']
+        )
+        self.env.cr.execute(SQL(
+            """
+            SELECT stage_id,
+                   COALESCE(SUM(amount), 0),
+                   COALESCE(SUM(COALESCE(physical_progress, 0) * COALESCE(amount, 0)), 0),
+                   COALESCE(SUM(physical_progress), 0),
+                   COUNT(*),
+                   MAX(last_progress_date)
+              FROM building_budget_line
+             WHERE stage_id = ANY(%s)
+          GROUP BY stage_id
+            """,
+            list(stage_ids),
+        ))
+        return {
+            stage_id: {
+                'amount': amount, 'weighted': weighted, 'progress': progress,
+                'count': count, 'last_date': last_date,
+            }
+            for stage_id, amount, weighted, progress, count, last_date in self.env.cr.fetchall()
+        }
+
     @api.model
     def _recompute_work(self, work):
         """
         Recalcula snapshot 'overall_progress' para la obra.
         Formula: Promedio Ponderado de las Etapas.
+
+        Es un pliegue sobre las filas de etapa: usa el importe planeado que
+        el engine guarda en cada etapa, sin sumar partidas.
         """
         stages = work.stage_ids
         if not stages:
             work.write({'overall_progress': 0.0})
+            self.env['building.progress.snapshot'].enqueue(work.ids)
             return
 
-        # Calcular importe total de cada etapa (suma de sus partidas)
-        # Esto podría ser un campo computado en stage, pero el engine lo calcula al vuelo
-        # para asegurar integridad.
-        
-        stage_amounts = {}
-        for stage in stages:
-            stage_amounts[stage.id] = sum(stage.budget_line_ids.mapped('amount'))
-            
-        total_project_amount = sum(stage_amounts.values())
-        
+        total_project_amount = sum(stages.mapped('planned_amount'))
+
         if total_project_amount > 0:
-            weighted_sum = 0.0
-            for stage in stages:
-                amount = stage_amounts[stage.id]
-                weighted_sum += stage.progress_pct * amount
-            
+            weighted_sum = sum(stage.progress_pct * stage.planned_amount for stage in stages)
             work_progress = weighted_sum / total_project_amount
         else:
-             # Promedio simple de etapas
+            # Promedio simple de etapas
             avg_sum = sum(stages.mapped('progress_pct'))
             work_progress = avg_sum / len(stages)
-            
+
         work.write({'overall_progress': work_progress})
+        self.env['building.progress.snapshot'].enqueue(work.ids)
+
+    @api.model
+    def _get_running_totals(self, model_name, partition_field, value_field, partition_ids):
+        """
+        Acumulado histórico de logs de avance con una sola función ventana.
+
+        SUM(valor confirmado) OVER (PARTITION BY partición ORDER BY date, id)
+        reemplaza un search por registro. Lo usan tanto los campos acumulados
+        como las restricciones de tope 100%.
+
+        Args:
+            model_name (str): 'building.budget.progress' o 'building.stage.progress'.
+            partition_field (str): 'line_id' o 'stage_id'.
+            value_field (str): 'percent_period' o 'progress_pct'.
+            partition_ids (list): partidas/etapas a consultar.
+
+        Returns:
+            tuple: ({log_id: acumulado hasta ese log}, {partition_id: total confirmado})
+        """
+        partition_ids = list({pid for pid in partition_ids if pid})
+        if not partition_ids:
+            return {}, {}
+        Model = self.env[model_name]
+        Model.flush_model([partition_field, value_field, 'date', 'state'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT id, %(partition)s,
+                   SUM(CASE WHEN state = 'confirmed' THEN %(value)s ELSE 0 END)
+                       OVER (PARTITION BY %(partition)s ORDER BY date, id)
+              FROM %(table)s
+             WHERE %(partition)s = ANY(%(ids)s)
+          ORDER BY %(partition)s, date, id
+            """,
+            partition=SQL.identifier(partition_field),
+            value=SQL.identifier(value_field),
+            table=SQL.identifier(Model._table),
+            ids=partition_ids,
+        ))
+        running = {}
+        totals = dict.fromkeys(partition_ids, 0.0)
+        for log_id, partition_id, total in self.env.cr.fetchall():
+            # Ordenado por fecha: el último acumulado de la partición es su total
+            running[log_id] = totals[partition_id] = total or 0.0
+        return running, totals
+
+    # =====================================================
+    # COLA DIFERIDA Y DEDUPLICADA DE RECÁLCULO
+    # =====================================================
+
+    @api.model
+    def _get_dirty_queue(self):
+        """
+        Retorna la cola de recálculo de la transacción actual.
+
+        Estructura: {'depth': int, 'works': {work_id: {'full', 'stages', 'lines'}}}
+        Al crearla se registra el vaciado en el pre-commit del cursor.
+        """
+        data = self.env.cr.precommit.data
+        queue = data.get(DIRTY_QUEUE_KEY)
+        if queue is None:
+            queue = data[DIRTY_QUEUE_KEY] = {'depth': 0, 'works': {}}
+            engine = self
+            self.env.cr.precommit.add(lambda: engine._precommit_flush_dirty())
+        return queue
+
+    @api.model
+    def _precommit_flush_dirty(self):
+        """
+        Vaciado del pre-commit: los hooks corren después del flush de la
+        transacción, así que las escrituras ORM del recálculo (y los campos
+        almacenados que dispara) se escriben aquí mismo.
+        """
+        self.flush_dirty()
+        self.env.flush_all()
+
+    @api.model
+    def mark_dirty(self, work_id, stage_ids=None, line_ids=None):
+        """
+        Marca una obra (o algunas de sus etapas/partidas) para recálculo.
+
+        Sin stage_ids ni line_ids la obra completa se recalcula en modo set-based.
+        Si no hay un bloque diferido abierto, la cola se vacía de inmediato.
+        """
+        if not work_id:
+            return
+        queue = self._get_dirty_queue()
+        entry = queue['works'].setdefault(work_id, {'full': False, 'stages': set(), 'lines': set()})
+        if not stage_ids and not line_ids:
+            entry['full'] = True
+        else:
+            entry['stages'].update(stage_ids or [])
+            entry['lines'].update(line_ids or [])
+        if not queue['depth']:
+            self.flush_dirty()
+
+    @api.model
+    @contextlib.contextmanager
+    def deferred_recompute(self):
+        """
+        Context manager que acumula los recálculos hasta el final del bloque.
+
+        Los bloques pueden anidarse; solo el más externo vacía la cola.
+        Si el bloque termina con excepción no se recalcula (la transacción
+        se revertirá y el pre-commit nunca corre).
+        """
+        queue = self._get_dirty_queue()
+        queue['depth'] += 1
+        try:
+            yield
+        finally:
+            queue['depth'] -= 1
+        if not queue['depth']:
+            self.flush_dirty()
+
+    @api.model
+    def flush_dirty(self, work_ids=None):
+        """
+        Vacía la cola: una sola pasada por obra, sin importar cuántos
+        registros la marcaron.
+
+        Args:
+            work_ids (list): si se indica, solo se vacían esas obras.
+        """
+        queue = self.env.cr.precommit.data.get(DIRTY_QUEUE_KEY)
+        if not queue or not queue['works']:
+            return
+        if work_ids is None:
+            dirty, queue['works'] = queue['works'], {}
+        else:
+            dirty = {wid: queue['works'].pop(wid) for wid in work_ids if wid in queue['works']}
+
+        # Obras completas: un único recálculo set-based para todas
+        self.recompute_works([wid for wid, entry in dirty.items() if entry['full']])
+        # Obras parciales: recálculo dirigido a las partidas/etapas tocadas
+        for work_id, entry in dirty.items():
+            if entry['full']:
+                continue
+            self.recompute_hierarchy(
+                work_id,
+                stage_ids=list(entry['stages']) or None,
+                line_ids=list(entry['lines']) or None,
+            )
+
+    # =====================================================
+    # MODO SET-BASED (obra completa)
+    # =====================================================
+
+    @api.model
+    def recompute_works(self, work_ids):
+        """
+        Recalcula los snapshots de TODAS las partidas, etapas y obras indicadas.
+
+        A diferencia de _recompute_lines/_recompute_stages/_recompute_work,
+        el costo está acotado por el número de consultas y no por el número
+        de partidas:
+        1. Una consulta agrupada con el avance confirmado por partida.
+        2. Una consulta con las etapas y su avance manual (Fase 3.2).
+        3. Una consulta con el snapshot actual de las obras.
+        4. Un UPDATE por modelo con los registros que cambiaron.
+        """
+        work_ids = list({wid for wid in work_ids if wid})
+        if not work_ids:
+            return
+        snapshots = self._compute_work_snapshots(work_ids)
+        self._write_snapshots(snapshots)
+        self.env['building.progress.snapshot'].enqueue(work_ids)
+
+    @api.model
+    def _compute_work_snapshots(self, work_ids):
+        """
+        Calcula en memoria los snapshots de las obras indicadas.
+
+        Retorna un dict con las llaves 'lines', 'stages' y 'works'.
+        Cada una mapea {id: {'current': {...}, 'new': {...}}} para que el
+        llamador decida qué escribir (o solo comparar, p.ej. verificación).
+        """
+        # Asegurar que lo pendiente en caché ORM esté en la BD
+        self.env['building.budget.progress'].flush_model(
+            ['line_id', 'work_id', 'state', 'percent_period', 'date', 'user_id']
+        )
+        self.env['building.budget.line'].flush_model(
+            ['amount', 'stage_id', 'work_id', 'physical_progress', 'executed_amount',
+             'last_progress_date', 'last_progress_user_id']
+        )
+        self.env['building.stage.progress'].flush_model(['stage_id', 'state', 'progress_pct'])
+        self.env['building.work.stage'].flush_model(
+            ['work_id', 'progress_pct', 'last_progress_date', 'planned_amount',
+             'progress_weighted', 'planned_line_count']
+        )
+        self.env['building.work'].flush_model(['overall_progress'])
+        cr = self.env.cr
+
+        # 1. PARTIDAS: avance confirmado agrupado por partida (último log = fecha desc, id desc)
+        cr.execute(SQL(
+            """
+            SELECT l.id, l.work_id, l.stage_id, COALESCE(l.amount, 0),
+                   COALESCE(l.physical_progress, 0), COALESCE(l.executed_amount, 0),
+                   l.last_progress_date, l.last_progress_user_id,
+                   COALESCE(p.total, 0), p.last_date, p.last_user_id
+              FROM building_budget_line l
+              LEFT JOIN (
+                    SELECT line_id,
+                           SUM(percent_period) AS total,
+                           (ARRAY_AGG(date ORDER BY date DESC, id DESC))[1] AS last_date,
+                           (ARRAY_AGG(user_id ORDER BY date DESC, id DESC))[1] AS last_user_id
+                      FROM building_budget_progress
+                     WHERE state = 'confirmed'
+                       AND work_id = ANY(%s)
+                  GROUP BY line_id
+              ) p ON p.line_id = l.id
+             WHERE l.work_id = ANY(%s)
+            """,
+            work_ids, work_ids,
+        ))
+        lines = {}
+        stage_acc = {}
+        for (line_id, _work_id, stage_id, amount, cur_progress, cur_executed,
+             cur_date, cur_user, total, last_date, last_user) in cr.fetchall():
+            progress = max(0.0, min(100.0, total))
+            lines[line_id] = {
+                'current': {
+                    'physical_progress': cur_progress,
+                    'executed_amount': cur_executed,
+                    'last_progress_date': cur_date,
+                    'last_progress_user_id': cur_user,
+                },
+                'new': {
+                    'physical_progress': progress,
+                    'executed_amount': amount * (progress / 100.0),
+                    'last_progress_date': last_date,
+                    'last_progress_user_id': last_user,
+                },
+            }
+            if stage_id:
+                acc = stage_acc.setdefault(stage_id, {
+                    'amount': 0.0, 'weighted': 0.0, 'progress': 0.0, 'count': 0, 'last_date': None,
+                })
+                acc['amount'] += amount
+                acc['weighted'] += progress * amount
+                acc['progress'] += progress
+                acc['count'] += 1
+                if last_date and (not acc['last_date'] or last_date > acc['last_date']):
+                    acc['last_date'] = last_date
+
+        # 2. ETAPAS: totales guardados y avance manual heredado (Fase 3.2) para etapas sin partidas
+        cr.execute(SQL(
+            """
+            SELECT s.id, s.work_id, COALESCE(s.progress_pct, 0), s.last_progress_date,
+                   COALESCE(s.planned_amount, 0), COALESCE(s.progress_weighted, 0),
+                   COALESCE(s.planned_line_count, 0),
+                   COALESCE(SUM(sp.progress_pct) FILTER (WHERE sp.state = 'confirmed'), 0)
+              FROM building_work_stage s
+              LEFT JOIN building_stage_progress sp ON sp.stage_id = s.id
+             WHERE s.work_id = ANY(%s)
+          GROUP BY s.id, s.work_id
+            """,
+            work_ids,
+        ))
+        stages = {}
+        work_acc = {wid: {'amount': 0.0, 'weighted': 0.0, 'progress': 0.0, 'count': 0} for wid in work_ids}
+        for (stage_id, work_id, cur_progress, cur_date, cur_amount, cur_weighted,
+             cur_count, manual_total) in cr.fetchall():
+            acc = stage_acc.get(stage_id)
+            current = {
+                'progress_pct': cur_progress,
+                'planned_amount': cur_amount,
+                'progress_weighted': cur_weighted,
+                'planned_line_count': cur_count,
+            }
+            if acc:
+                # Promedio ponderado por importe; promedio simple si los importes son 0
+                if acc['amount'] > 0:
+                    progress = acc['weighted'] / acc['amount']
+                else:
+                    progress = acc['progress'] / acc['count']
+                last_date = acc['last_date'] and fields.Datetime.to_datetime(acc['last_date'])
+                new = {'progress_pct': progress, 'last_progress_date': last_date or None}
+                current['last_progress_date'] = cur_date
+                amount = acc['amount']
+                new.update(planned_amount=amount, progress_weighted=acc['weighted'], planned_line_count=acc['count'])
+            else:
+                # Fallback: modo manual antiguo (Fase 3.2)
+                new = {'progress_pct': max(0.0, min(100.0, manual_total))}
+                amount = 0.0
+                new.update(planned_amount=0.0, progress_weighted=0.0, planned_line_count=0)
+            stages[stage_id] = {'current': current, 'new': new}
+            wacc = work_acc[work_id]
+            wacc['amount'] += amount
+            wacc['weighted'] += new['progress_pct'] * amount
+            wacc['progress'] += new['progress_pct']
+            wacc['count'] += 1
+
+        # 3. OBRAS: promedio ponderado de etapas
+        cr.execute(SQL(
+            "SELECT id, COALESCE(overall_progress, 0) FROM building_work WHERE id = ANY(%s)",
+            work_ids,
+        ))
+        works = {}
+        for work_id, cur_progress in cr.fetchall():
+            wacc = work_acc[work_id]
+            if not wacc['count']:
+                progress = 0.0
+            elif wacc['amount'] > 0:
+                progress = wacc['weighted'] / wacc['amount']
+            else:
+                progress = wacc['progress'] / wacc['count']
+            works[work_id] = {
+                'current': {'overall_progress': cur_progress},
+                'new': {'overall_progress': progress},
+            }
+
+        return {'lines': lines, 'stages': stages, 'works': works}
+
+    @api.model
+    def _write_snapshots(self, snapshots):
+        """Escribe solo los snapshots que cambiaron, un UPDATE por modelo y conjunto de campos."""
+        for model_name, key in (
+            ('building.budget.line', 'lines'),
+            ('building.work.stage', 'stages'),
+            ('building.work', 'works'),
+        ):
+            # Agrupar por conjunto de campos (las etapas manuales no escriben fecha)
+            rows_by_fnames = {}
+            for rec_id, data in snapshots[key].items():
+                if not self._snapshot_changed(data['current'], data['new']):
+                    continue
+                fnames = tuple(data['new'])
+                rows_by_fnames.setdefault(fnames, []).append(
+                    (rec_id,) + tuple(data['new'][f] for f in fnames)
+                )
+            for fnames, rows in rows_by_fnames.items():
+                self._bulk_update(model_name, fnames, rows)
+
+    @api.model
+    def _snapshot_changed(self, current, new):
+        """Compara snapshot actual vs nuevo (tolerancia flotante)."""
+        for fname, value in new.items():
+            old = current.get(fname)
+            if isinstance(value, float):
+                if float_compare(old or 0.0, value, precision_digits=6) != 0:
+                    return True
+            elif (old or None) != (value or None):
+                return True
+        return False
+
+    @api.model
+    def _bulk_update(self, model_name, fnames, rows):
+        """
+        Actualiza muchos registros con valores distintos en un solo UPDATE.
+
+        Args:
+            model_name (str): modelo a actualizar.
+            fnames (tuple): campos (columnas) a escribir.
+            rows (list): tuplas (id, valor_campo_1, valor_campo_2, ...).
+        """
+        if not rows:
+            return
+        Model = self.env[model_name]
+        # Escrituras ORM pendientes sobre estas columnas pisarían el UPDATE
+        Model.flush_model(list(fnames))
+        columns = ('id',) + tuple(fnames)
+        values = SQL(", ").join(
+            SQL("(%s)", SQL(", ").join(SQL("%s", value) for value in row))
+            for row in rows
+        )
+        # Se castea cada columna a su tipo porque VALUES infiere 'text' con NULLs
+        assignments = SQL(", ").join(
+            SQL("%s = v.%s::%s",
+                SQL.identifier(fname), SQL.identifier(fname),
+                SQL(Model._fields[fname].column_type[1]))
+            for fname in fnames
+        )
+        self.env.cr.execute(SQL(
+            """
+            UPDATE %(table)s AS t
+               SET %(assignments)s,
+                   write_uid = %(uid)s,
+                   write_date = (now() at time zone 'UTC')
+              FROM (VALUES %(values)s) AS v(%(columns)s)
+             WHERE t.id = v.id::int4
+            """,
+            table=SQL.identifier(Model._table),
+            assignments=assignments,
+            uid=self.env.uid,
+            values=values,
+            columns=SQL(", ").join(SQL.identifier(c) for c in columns),
+        ))
+        Model.invalidate_model(list(fnames) + ['write_uid', 'write_date'])
+        # Los campos almacenados que dependen de estos (p. ej. consistency_warning)
+        # se recalculan igual que tras un write del ORM
+        Model.browse([row[0] for row in rows]).modified(list(fnames))
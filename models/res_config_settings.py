@@ -27,6 +27,25 @@ class ResConfigSettings(models.TransientModel):
         readonly=False,
     )
 
+    building_sat_ttl_valid_hours = fields.Integer(
+        string='Vigencia de CFDI Vigente (horas)',
+        config_parameter='building.sat.ttl_valid_hours',
+        default=168,
+        help='Tiempo antes de volver a consultar al SAT un CFDI vigente. Los cancelados no se vuelven a consultar.',
+    )
+
+    building_sat_ttl_not_found_hours = fields.Integer(
+        string='Vigencia de CFDI No Encontrado (horas)',
+        config_parameter='building.sat.ttl_not_found_hours',
+        default=24,
+    )
+
+    building_sat_ttl_error_minutes = fields.Integer(
+        string='Espera tras error del SAT (minutos)',
+        config_parameter='building.sat.ttl_error_minutes',
+        default=15,
+    )
+
     def action_generate_encryption_key(self):
         """Genera una nueva clave de cifrado y la asigna."""
         service = self.env['building.encryption.service']
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio de Validación SAT (building.sat.service)
+
+Consulta el estatus de CFDI en el servicio SOAP del SAT
+(ConsultaCFDIService) con un cliente compartido:
+
+- Sesión HTTP con pool de conexiones (keep-alive) por proceso.
+- Consultas concurrentes con un ThreadPoolExecutor acotado.
+- Límite de peticiones por segundo por host (compartido entre hilos).
+- Reintentos con backoff exponencial ante errores de red, 429 y 5xx.
+
+La URL del servicio se puede sustituir con el parámetro
+`building.sat.url` (por ejemplo, un servidor SOAP local en pruebas).
+
+Los resultados se guardan en building.sat.status.cache con vigencia por
+estatus; solo se sale a la red por los CFDI sin entrada vigente.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from odoo import models, api
+
+_logger = logging.getLogger(__name__)
+
+SAT_URL = 'https://consultaqr.facturaelectronica.sat.gob.mx/ConsultaCFDIService.svc'
+SAT_SOAP_ACTION = 'http://tempuri.org/IConsultaCFDIService/Consulta'
+
+SOAP_TEMPLATE = """<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tem="http://tempuri.org/">
+   <soapenv:Body>
+      <tem:Consulta>
+         <tem:expresionImpresa>?re={rfc_emisor}&amp;rr={rfc_receptor}&amp;tt={total}&amp;id={uuid}</tem:expresionImpresa>
+      </tem:Consulta>
+   </soapenv:Body>
+</soapenv:Envelope>"""
+
+# Estados HTTP que justifican reintentar
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class RateLimiter:
+    """Intervalo mínimo entre peticiones, compartido entre hilos."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class SatClient:
+    """
+    Cliente SOAP del SAT con pool de conexiones, concurrencia acotada,
+    límite por host y reintentos. Es seguro compartirlo entre hilos.
+    """
+
+    def __init__(self, url=SAT_URL, max_workers=8, rate=20.0, retries=3,
+                 backoff=0.5, timeout=5.0):
+        self.url = url
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._limiters = {}
+        self._rate = rate
+        self._lock = threading.Lock()
+
+    def _limiter(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = RateLimiter(self._rate)
+            return self._limiters[host]
+
+    @staticmethod
+    def parse_status(text):
+        """Estatus interno a partir de la respuesta SOAP."""
+        if 'Vigente' in text:
+            return 'valid'
+        if 'Cancelado' in text:
+            return 'cancelled'
+        if 'No Encontrado' in text:
+            return 'not_found'
+        _logger.warning("Respuesta SAT desconocida: %s", text[:500])
+        return 'error'
+
+    def check(self, rfc_emisor, rfc_receptor, total, uuid, deadline=None):
+        """
+        Estatus de un CFDI ('valid', 'cancelled', 'not_found' o 'error').
+
+        Con deadline (time.monotonic()) no se inicia ningún intento después
+        de esa hora y se devuelve None (no consultado).
+        """
+        body = SOAP_TEMPLATE.format(
+            rfc_emisor=rfc_emisor or '', rfc_receptor=rfc_receptor or '',
+            total='%.6f' % abs(total or 0.0), uuid=uuid,
+        )
+        headers = {'Content-Type': 'text/xml; charset=utf-8', 'SOAPAction': SAT_SOAP_ACTION}
+        limiter = self._limiter(self.url)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            limiter.acquire()
+            try:
+                response = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                _logger.info("SAT: error de conexión (%s), intento %d: %s", uuid, attempt + 1, e)
+                continue
+            if response.status_code in RETRY_STATUSES:
+                _logger.info("SAT: HTTP %s (%s), intento %d", response.status_code, uuid, attempt + 1)
+                continue
+            return self.parse_status(response.text)
+        _logger.error("SAT: sin respuesta válida para %s tras %d intentos", uuid, self.retries + 1)
+        return 'error'
+
+    def check_many(self, items, deadline=None):
+        """
+        Estatus de muchos CFDI en paralelo.
+
+        Args:
+            items: iterable de (rfc_emisor, rfc_receptor, total, uuid).
+            deadline: hora límite (time.monotonic()); los CFDI que no se
+                alcanzaron a consultar no aparecen en el resultado.
+
+        Returns:
+            dict: {uuid: estatus}
+        """
+        items = list(items)
+        if not items:
+            return {}
+        workers = min(self.max_workers, len(items))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sat') as executor:
+            statuses = executor.map(lambda item: self.check(*item, deadline=deadline), items)
+            return {item[3]: status for item, status in zip(items, statuses) if status is not None}
+
+
+# Clientes compartidos por proceso: {url: SatClient}
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(url=SAT_URL):
+    """Cliente compartido para la URL (se crea una vez por proceso)."""
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(url)
+        if client is None:
+            client = _CLIENTS[url] = SatClient(url)
+        return client
+
+
+class BuildingSatService(models.AbstractModel):
+    """
+    Servicio de validación de CFDI ante el SAT.
+    Punto único para el wizard de carga y las facturas de proveedor.
+    """
+    _name = 'building.sat.service'
+    _description = 'Servicio de Validación SAT'
+
+    @api.model
+    def _get_client(self):
+        """Cliente compartido para la URL configurada."""
+        url = self.env['ir.config_parameter'].sudo().get_param('building.sat.url') or SAT_URL
+        return get_client(url)
+
+    @api.model
+    def check_status(self, rfc_emisor, rfc_receptor, total, uuid, force=False):
+        """Estatus de un CFDI (usa la caché de estatus, ver check_status_many)."""
+        return self.check_status_many([(rfc_emisor, rfc_receptor, total, uuid)], force=force)[uuid]
+
+    @api.model
+    def check_status_many(self, items, force=False, deadline=None):
+        """
+        Estatus de varios CFDI.
+
+        Primero se consulta building.sat.status.cache (una consulta); solo
+        los CFDI sin entrada vigente (o todos, con force) se consultan al SAT
+        en paralelo. Si el SAT responde 'error' y había un estatus previo,
+        se conserva el previo.
+
+        Args:
+            items: lista de (rfc_emisor, rfc_receptor, total, uuid).
+            deadline: hora límite (time.monotonic()) para las consultas al
+                SAT; los CFDI no consultados a tiempo se omiten del resultado.
+
+        Returns:
+            dict: {uuid: estatus}
+        """
+        Cache = self.env['building.sat.status.cache']
+        keyed = {Cache._make_key(*item): item for item in items}
+        # Estatus previo (aunque esté vencido): respuesta si sigue vigente,
+        # respaldo si el SAT falla
+        previous = Cache.lookup(keyed)
+        cached = {} if force else previous
+
+        result = {}
+        to_query = {}
+        for key, item in keyed.items():
+            entry = cached.get(key)
+            if entry and entry[2]:
+                result[item[3]] = entry[0]
+            else:
+                to_query[key] = item
+
+        if to_query:
+            fetched = self._get_client().check_many(list(to_query.values()), deadline=deadline)
+            to_store = {}
+            for key, item in to_query.items():
+                status = fetched.get(item[3])
+                if status is None:
+                    continue
+                fallback = previous.get(key)
+                if status == 'error' and fallback and fallback[0] != 'error':
+                    # SAT lento o caído: se mantiene el último estatus conocido
+                    result[item[3]] = fallback[0]
+                    continue
+                result[item[3]] = status
+                to_store[key] = status
+            Cache.store(to_store)
+        return result
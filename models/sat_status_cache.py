@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Modelo: Caché de Estatus SAT (building.sat.status.cache)
+
+Guarda el último estatus consultado al SAT por (uuid, rfc_emisor,
+rfc_receptor, total) con la fecha de consulta. building.sat.service lo
+consulta antes de salir a la red y decide la vigencia según el estatus:
+
+- cancelled: definitivo, no se vuelve a consultar.
+- valid: se revalida tras `building.sat.ttl_valid_hours`.
+- not_found: caché negativa por `building.sat.ttl_not_found_hours`
+  (el CFDI puede tardar en aparecer en el SAT).
+- error: se recuerda `building.sat.ttl_error_minutes` para no insistir
+  contra un SAT caído; si había un estatus previo se sigue usando.
+
+Lo escribe exclusivamente el servicio vía SQL (INSERT ... ON CONFLICT).
+"""
+
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.models import UniqueIndex
+from odoo.tools import SQL
+
+# Vigencia por defecto de cada estatus (None = definitivo)
+DEFAULT_TTLS = {
+    'valid': ('building.sat.ttl_valid_hours', 'hours', 168),
+    'not_found': ('building.sat.ttl_not_found_hours', 'hours', 24),
+    'error': ('building.sat.ttl_error_minutes', 'minutes', 15),
+    'cancelled': None,
+}
+
+
+class BuildingSatStatusCache(models.Model):
+    """Último estatus SAT conocido por CFDI (solo lectura)."""
+    _name = 'building.sat.status.cache'
+    _description = 'Caché de Estatus SAT'
+    _order = 'checked_at desc'
+    _rec_name = 'uuid'
+
+    # === CONSTRAINTS (Odoo 19 Style) ===
+    _unique_key = UniqueIndex(
+        '(uuid, rfc_emisor, rfc_receptor, total)',
+        message='Ya existe un estatus en caché para ese CFDI.'
+    )
+
+    uuid = fields.Char(string='UUID', required=True, readonly=True)
+    rfc_emisor = fields.Char(string='RFC Emisor', required=True, readonly=True)
+    rfc_receptor = fields.Char(string='RFC Receptor', required=True, readonly=True)
+    total = fields.Float(string='Total', digits=(16, 6), required=True, readonly=True)
+    status = fields.Selection([
+        ('valid', 'Vigente'),
+        ('cancelled', 'Cancelado'),
+        ('not_found', 'No Encontrado'),
+        ('error', 'Error / Sin Conexión'),
+    ], string='Estatus', required=True, readonly=True)
+    checked_at = fields.Datetime(string='Consultado', required=True, readonly=True)
+
+    @api.model
+    def _make_key(self, rfc_emisor, rfc_receptor, total, uuid):
+        """Llave normalizada, igual a la expresión que se envía al SAT."""
+        return ((uuid or '').upper(), rfc_emisor or '', rfc_receptor or '', round(abs(total or 0.0), 6))
+
+    @api.model
+    def _get_ttls(self):
+        """Vigencia por estatus: {status: timedelta | None (definitivo)}."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        ttls = {}
+        for status, config in DEFAULT_TTLS.items():
+            if config is None:
+                ttls[status] = None
+                continue
+            param, unit, default = config
+            value = ICP.get_param(param)
+            ttls[status] = timedelta(**{unit: float(value) if value not in (None, False, '') else default})
+        return ttls
+
+    @api.model
+    def lookup(self, keys):
+        """
+        Entradas en caché de las llaves (una consulta).
+
+        Returns:
+            dict: {llave: (status, checked_at, vigente)}
+        """
+        keys = set(keys)
+        if not keys:
+            return {}
+        ttls = self._get_ttls()
+        now = fields.Datetime.now()
+        result = {}
+        for entry in self.sudo().search([('uuid', 'in', list({key[0] for key in keys}))]):
+            key = (entry.uuid, entry.rfc_emisor, entry.rfc_receptor, round(entry.total, 6))
+            if key not in keys:
+                continue
+            ttl = ttls.get(entry.status)
+            fresh = ttl is None or entry.checked_at + ttl > now
+            result[key] = (entry.status, entry.checked_at, fresh)
+        return result
+
+    @api.model
+    def store(self, statuses):
+        """
+        Guarda estatus consultados con un único INSERT ... ON CONFLICT.
+
+        Args:
+            statuses: {llave: status}
+        """
+        if not statuses:
+            return
+        now = fields.Datetime.now()
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO building_sat_status_cache
+                   (uuid, rfc_emisor, rfc_receptor, total, status, checked_at,
+                    create_uid, create_date, write_uid, write_date)
+            VALUES %(values)s
+                ON CONFLICT (uuid, rfc_emisor, rfc_receptor, total) DO UPDATE
+               SET status = EXCLUDED.status,
+                   checked_at = EXCLUDED.checked_at,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+            """,
+            values=SQL(", ").join(
+                SQL("(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                    uuid, rfc_emisor, rfc_receptor, total, status, now,
+                    self.env.uid, now, self.env.uid, now)
+                for (uuid, rfc_emisor, rfc_receptor, total), status in statuses.items()
+            ),
+        ))
+        self.invalidate_model()
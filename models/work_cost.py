@@ -235,6 +235,7 @@ class BuildingWorkCost(models.Model):
         works = self.mapped('work_id')
         res = super().unlink()
         works._recompute_cost_totals()
+        self.env['building.work.kpi']._mark_dirty(works.ids)
         return res
 
     # === FLUJO DE APROBACIÓN (ETAPA 5.2) ===
@@ -9,3 +9,10 @@ from . import test_budget_line_traffic_light
 from . import test_chapter_loader
 from . import test_budget_versioning
 from . import test_drill_downs
+from . import test_work_kpi
+from . import test_distribution_engine
+from . import test_cashflow_engine
+from . import test_cfdi_bulk_load
+from . import test_sat_service
+from . import test_sat_sweep
+from . import test_cfdi_parser
@@ -35,6 +35,7 @@ class TestBudgetLineTrafficLight(common.TransactionCase):
         # Real: 8,000
         self.RealLine.create({
             'work_id': self.work.id,
+            'approval_state': 'approved',
             'budget_line_id': line_green.id,
             'amount': 8000.0,
             'name': 'Real G'
@@ -53,6 +54,7 @@ class TestBudgetLineTrafficLight(common.TransactionCase):
         # Real: 9,500
         self.RealLine.create({
             'work_id': self.work.id,
+            'approval_state': 'approved',
             'budget_line_id': line_yellow.id,
             'amount': 9500.0,
             'name': 'Real Y'
@@ -71,6 +73,7 @@ class TestBudgetLineTrafficLight(common.TransactionCase):
         # Real: 11,000
         self.RealLine.create({
             'work_id': self.work.id,
+            'approval_state': 'approved',
             'budget_line_id': line_red.id,
             'amount': 11000.0,
             'name': 'Real R'
@@ -96,6 +99,7 @@ class TestBudgetLineTrafficLight(common.TransactionCase):
         # Real: 1000 -> Red
         self.RealLine.create({
             'work_id': self.work.id,
+            'approval_state': 'approved',
             'budget_line_id': line_zero.id,
             'amount': 1000.0,
             'name': 'Real Unexpected'
@@ -114,6 +118,7 @@ class TestBudgetLineTrafficLight(common.TransactionCase):
         })
         self.RealLine.create({
             'work_id': self.work.id,
+            'approval_state': 'approved',
             'budget_line_id': line_red.id,
             'amount': 200.0, # 200%
             'name': 'Real Drill'
@@ -127,6 +132,7 @@ class TestBudgetLineTrafficLight(common.TransactionCase):
         })
         self.RealLine.create({
             'work_id': self.work.id,
+            'approval_state': 'approved',
             'budget_line_id': line_green.id,
             'amount': 50.0, # 50%
             'name': 'Real Green'
@@ -144,3 +150,27 @@ class TestBudgetLineTrafficLight(common.TransactionCase):
         # Check domain contains the tuple or the list version
         domain_str = str(action['domain'])
         self.assertTrue("'traffic_light', 'in', ['yellow', 'red']" in domain_str or "'traffic_light', 'in', ('yellow', 'red')" in domain_str)
+
+    def test_04_only_approved_real(self):
+        """ Only approved real lines feed the line traffic light (same rules as the engine) """
+        line = self.BudgetLine.create({
+            'chapter_id': self.chapter.id,
+            'code': '07', 'name': 'Line Approval', 'amount': 1000.0,
+            'stage_id': self.stage.id
+        })
+        self.RealLine.create({
+            'work_id': self.work.id,
+            'budget_line_id': line.id,
+            'amount': 2000.0,
+            'name': 'Real Draft'
+        })
+        self.RealLine.create({
+            'work_id': self.work.id,
+            'approval_state': 'approved',
+            'budget_line_id': line.id,
+            'amount': 500.0,
+            'name': 'Real Approved'
+        })
+        line.invalidate_recordset()
+        self.assertEqual(line.real_total, 500.0)
+        self.assertEqual(line.traffic_light, 'green')
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Test: Motor de Flujo de Efectivo
+Verifica la matriz obra × mes (planeado, real) y el caché por versión
+de distribución.
+"""
+
+from datetime import date
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.building_dashboard.models import cashflow_engine
+
+
+@tagged('post_install', '-at_install', 'building_dashboard')
+class TestCashflowEngine(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Engine = cls.env['building.cashflow.engine']
+        cls.work = cls.env['building.work'].create({'name': 'Obra Flujo'})
+        cls.budget = cls.env['building.budget'].create({
+            'name': 'Presupuesto Flujo',
+            'work_id': cls.work.id,
+            'duration_months': 3,
+            'date_start': date(2026, 1, 15),
+        })
+        chapter = cls.env['building.budget.chapter'].create({
+            'name': 'Cap Flujo',
+            'budget_id': cls.budget.id,
+        })
+        cls.line = cls.env['building.budget.line'].create({
+            'name': 'Partida Flujo',
+            'code': '1.01',
+            'chapter_id': chapter.id,
+            'amount': 300.0,
+        })
+        cls.budget.action_distribute_all()
+        cls.budget.action_validate()
+
+    def test_01_matrix(self):
+        """El planeado se reparte por mes desde el inicio y el real se superpone."""
+        self.env['building.real.line'].create({
+            'work_id': self.work.id,
+            'budget_line_id': self.line.id,
+            'amount': 80.0,
+            'name': 'Gasto Flujo',
+            'date': date(2026, 2, 10),
+            'approval_state': 'approved',
+        })
+        matrix = self.Engine.get_matrix(self.work.ids)
+        self.assertEqual(matrix['months'], [date(2026, 1, 1), date(2026, 2, 1), date(2026, 3, 1)])
+        row = matrix['rows'][self.work.id]
+        self.assertAlmostEqual(row[date(2026, 1, 1)]['planned'], 100.0)
+        self.assertAlmostEqual(row[date(2026, 2, 1)]['real'], 80.0)
+
+        portfolio = self.Engine.get_matrix(self.work.ids, date_from=date(2026, 2, 1), portfolio=True)
+        self.assertEqual(portfolio['months'], [date(2026, 2, 1), date(2026, 3, 1)])
+        self.assertAlmostEqual(portfolio['rows']['portfolio'][date(2026, 3, 1)]['planned'], 100.0)
+
+    def test_02_cache_follows_version(self):
+        """Cambiar la distribución invalida el planeado en caché del presupuesto."""
+        self.Engine.get_matrix(self.work.ids)
+        self.budget.compact_distribution = True
+        self.env['building.distribution.engine'].distribute_lines(self.line, method='front_loaded')
+        row = self.Engine.get_matrix(self.work.ids)['rows'][self.work.id]
+        self.assertAlmostEqual(row[date(2026, 1, 1)]['planned'], 150.0)
+        self.assertAlmostEqual(row[date(2026, 3, 1)]['planned'], 50.0)
+
+    def test_03_cache_same_transaction(self):
+        """Dos ediciones en la misma transacción (mismos conteos) se ven al momento."""
+        self.Engine.get_matrix(self.work.ids)
+        first = self.line.period_value_ids.sorted('period_number')[:1]
+        first.amount = 200.0
+        row = self.Engine.get_matrix(self.work.ids)['rows'][self.work.id]
+        self.assertAlmostEqual(row[date(2026, 1, 1)]['planned'], 200.0)
+        first.amount = 120.0
+        row = self.Engine.get_matrix(self.work.ids)['rows'][self.work.id]
+        self.assertAlmostEqual(row[date(2026, 1, 1)]['planned'], 120.0)
+
+    def test_04_cache_hit(self):
+        """Sin cambios la segunda lectura sale del caché; un cambio de distribución lo invalida."""
+        cashflow_engine._PLANNED_CACHE.clear()
+        Engine = type(self.Engine)
+        with patch.object(Engine, '_compute_planned', autospec=True,
+                          side_effect=Engine._compute_planned) as compute:
+            first = self.Engine.get_matrix(self.work.ids)
+            second = self.Engine.get_matrix(self.work.ids)
+            self.assertEqual(compute.call_count, 1)
+            self.assertEqual(first, second)
+
+            version = self.budget.distribution_version
+            self.line.period_value_ids.sorted('period_number')[:1].amount = 40.0
+            self.assertNotEqual(self.budget.distribution_version, version)
+            row = self.Engine.get_matrix(self.work.ids)['rows'][self.work.id]
+            self.assertEqual(compute.call_count, 2)
+            self.assertAlmostEqual(row[date(2026, 1, 1)]['planned'], 40.0)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Test: Carga Masiva de CFDI
+Verifica el parseo único, la deduplicación de UUIDs y el resultado por archivo.
+"""
+
+import base64
+import io
+import zipfile
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+CFDI_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4"
+    xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital"
+    Version="4.0" Serie="A" Folio="{folio}" Fecha="2026-02-15T10:30:00"
+    SubTotal="100.00" Total="116.00" Moneda="MXN" TipoDeComprobante="{tipo}">
+  <cfdi:Emisor Rfc="{rfc}" Nombre="Proveedor {rfc}"/>
+  <cfdi:Receptor Rfc="XAXX010101000"/>
+  <cfdi:Conceptos>
+    <cfdi:Concepto Descripcion="Cemento" Cantidad="1" ValorUnitario="100.00" Importe="100.00">
+      <cfdi:Impuestos>
+        <cfdi:Traslados>
+          <cfdi:Traslado TasaOCuota="0.160000"/>
+        </cfdi:Traslados>
+      </cfdi:Impuestos>
+    </cfdi:Concepto>
+  </cfdi:Conceptos>
+  <cfdi:Complemento>
+    <tfd:TimbreFiscalDigital UUID="{uuid}"/>
+  </cfdi:Complemento>
+</cfdi:Comprobante>
+"""
+
+
+def make_cfdi(uuid, folio='1', rfc='AAA010101AAA', tipo='I'):
+    return CFDI_TEMPLATE.format(uuid=uuid, folio=folio, rfc=rfc, tipo=tipo).encode()
+
+
+@tagged('post_install', '-at_install', 'building_dashboard')
+class TestCfdiBulkLoad(AccountTestInvoicingCommon):
+    """Tests para la carga masiva de CFDI."""
+
+    def _attachment(self, name, content):
+        return self.env['ir.attachment'].create({
+            'name': name,
+            'datas': base64.b64encode(content),
+        })
+
+    def _zip(self, files):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, content in files.items():
+                archive.writestr(name, content)
+        return buffer.getvalue()
+
+    def _run(self, attachments):
+        wizard = self.env['building.cfdi.bulk.load.wizard'].create({
+            'company_id': self.env.company.id,
+            'attachment_ids': [(6, 0, attachments.ids)],
+        })
+        wizard.action_process()
+        return {result.filename: result for result in wizard.result_ids}
+
+    def test_01_zip_and_xml_results(self):
+        """ZIP y XML sueltos: una factura por UUID, duplicados y errores reportados."""
+        archive = self._zip({
+            'lote/a.xml': make_cfdi('11111111-1111-1111-1111-111111111111', folio='1'),
+            'lote/b.xml': make_cfdi('22222222-2222-2222-2222-222222222222', folio='2'),
+            'lote/leeme.txt': b'ignorar',
+        })
+        attachments = (
+            self._attachment('lote.zip', archive)
+            | self._attachment('c.xml', make_cfdi('11111111-1111-1111-1111-111111111111', folio='1'))
+            | self._attachment('roto.xml', b'<no-cerrado')
+            | self._attachment('pago.xml', make_cfdi('33333333-3333-3333-3333-333333333333', tipo='P'))
+        )
+        results = self._run(attachments)
+
+        self.assertEqual(set(results), {'a.xml', 'b.xml', 'c.xml', 'roto.xml', 'pago.xml'})
+        self.assertEqual(results['a.xml'].status, 'created')
+        self.assertEqual(results['b.xml'].status, 'created')
+        self.assertEqual(results['c.xml'].status, 'duplicate')
+        self.assertEqual(results['roto.xml'].status, 'error')
+        self.assertEqual(results['pago.xml'].status, 'error')
+
+        move = results['a.xml'].move_id
+        self.assertEqual(move.move_type, 'in_invoice')
+        self.assertEqual(move.l10n_mx_cfdi_uuid, '11111111-1111-1111-1111-111111111111')
+        self.assertEqual(move.partner_id.vat, 'AAA010101AAA')
+        self.assertEqual(move.ref, 'A1')
+        # Un solo proveedor creado para ambos CFDI del mismo RFC
+        self.assertEqual(results['b.xml'].move_id.partner_id, move.partner_id)
+
+    def test_02_existing_uuid_and_draft_match(self):
+        """UUID ya cargado se reporta duplicado; un borrador del mismo proveedor y folio se completa."""
+        partner = self.env['res.partner'].create({'name': 'Proveedor Existente', 'vat': 'BBB010101BBB'})
+        draft = self.env['account.move'].create({
+            'move_type': 'in_invoice',
+            'partner_id': partner.id,
+            'ref': 'A7',
+        })
+        first = self._run(self._attachment('uno.xml', make_cfdi(
+            '44444444-4444-4444-4444-444444444444', folio='7', rfc='BBB010101BBB')))
+        self.assertEqual(first['uno.xml'].status, 'matched')
+        self.assertEqual(first['uno.xml'].move_id, draft)
+        self.assertEqual(draft.l10n_mx_cfdi_uuid, '44444444-4444-4444-4444-444444444444')
+
+        again = self._run(self._attachment('otra_vez.xml', make_cfdi(
+            '44444444-4444-4444-4444-444444444444', folio='7', rfc='BBB010101BBB')))
+        self.assertEqual(again['otra_vez.xml'].status, 'duplicate')
+        self.assertEqual(again['otra_vez.xml'].move_id, draft)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Test: Parser de CFDI
+Verifica el parseo en una pasada (3.3 y 4.0), los impuestos por concepto y
+que la previsualización y la carga compartan el mismo parseo.
+"""
+
+import base64
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+from odoo.addons.building_dashboard.models import cfdi_parser
+from .test_cfdi_bulk_load import make_cfdi
+
+CONCEPTO = """<cfdi:Concepto Descripcion="Varilla {n}" Cantidad="2" ValorUnitario="10.00" Importe="20.00">
+      <cfdi:Impuestos>
+        <cfdi:Traslados>
+          <cfdi:Traslado TasaOCuota="0.080000"/>
+        </cfdi:Traslados>
+      </cfdi:Impuestos>
+    </cfdi:Concepto>
+"""
+
+GLOBAL_TAXES = """<cfdi:Impuestos>
+    <cfdi:Traslados>
+      <cfdi:Traslado TasaOCuota="0.500000"/>
+    </cfdi:Traslados>
+  </cfdi:Impuestos>
+  <cfdi:Complemento>"""
+
+
+@tagged('post_install', '-at_install', 'building_dashboard')
+class TestCfdiParser(AccountTestInvoicingCommon):
+    """Tests para building.cfdi.parser."""
+
+    def setUp(self):
+        super().setUp()
+        self.Parser = self.env['building.cfdi.parser']
+
+    def test_01_cfdi_40(self):
+        """CFDI 4.0: comprobante, emisor, receptor, timbre y conceptos."""
+        cfdi = self.Parser.parse(make_cfdi('aaaaaaaa-0000-0000-0000-000000000001', folio='15'))
+        self.assertEqual(cfdi.version, '4.0')
+        self.assertEqual(cfdi.uuid, 'AAAAAAAA-0000-0000-0000-000000000001')
+        self.assertEqual(cfdi.folio, 'A15')
+        self.assertEqual(cfdi.total, 116.0)
+        self.assertEqual(cfdi.rfc_emisor, 'AAA010101AAA')
+        self.assertEqual(cfdi.rfc_receptor, 'XAXX010101000')
+        self.assertEqual(cfdi.fecha.year, 2026)
+        self.assertEqual([c.descripcion for c in cfdi.conceptos], ['Cemento'])
+        self.assertEqual(cfdi.conceptos[0].tasas, [0.16])
+
+    def test_02_cfdi_33_many_conceptos(self):
+        """CFDI 3.3 con miles de conceptos; los traslados globales no se mezclan."""
+        content = make_cfdi('aaaaaaaa-0000-0000-0000-000000000002').decode()
+        content = content.replace('http://www.sat.gob.mx/cfd/4', 'http://www.sat.gob.mx/cfd/3')
+        content = content.replace('Version="4.0"', 'Version="3.3"')
+        content = content.replace(
+            '<cfdi:Conceptos>',
+            '<cfdi:Conceptos>' + ''.join(CONCEPTO.format(n=n) for n in range(3000)))
+        content = content.replace('<cfdi:Complemento>', GLOBAL_TAXES)
+        cfdi = self.Parser.parse(content.encode())
+        self.assertEqual(cfdi.version, '3.3')
+        self.assertEqual(len(cfdi.conceptos), 3001)
+        self.assertEqual(cfdi.conceptos[0].descripcion, 'Varilla 0')
+        self.assertEqual(cfdi.conceptos[0].cantidad, 2.0)
+        self.assertEqual(cfdi.conceptos[0].tasas, [0.08])
+        self.assertEqual(cfdi.conceptos[-1].tasas, [0.16])
+        self.assertEqual(cfdi.uuid, 'AAAAAAAA-0000-0000-0000-000000000002')
+
+    def test_03_invalid(self):
+        """XML roto, sin timbre o que no es CFDI: UserError."""
+        untimbrado = make_cfdi('x').replace(b'<tfd:TimbreFiscalDigital UUID="x"/>', b'')
+        for content in (b'<no-cerrado', b'<otro/>', untimbrado):
+            with self.assertRaises(UserError):
+                self.Parser.parse(content)
+
+    def test_04_preview_and_load_share_parse(self):
+        """La previsualización y la carga del wizard parsean el XML una sola vez."""
+        content = make_cfdi('aaaaaaaa-0000-0000-0000-000000000004', folio='99')
+        move = self.env['account.move'].create({'move_type': 'in_invoice'})
+        calls = []
+        original = cfdi_parser.parse_cfdi
+
+        def counting(data):
+            calls.append(data)
+            return original(data)
+
+        cfdi_parser._PARSED_CACHE.clear()
+        with patch.object(cfdi_parser, 'parse_cfdi', counting), \
+                patch.object(type(self.env['building.sat.service']), 'check_status',
+                             lambda self, *args, **kwargs: 'valid'):
+            wizard = self.env['building.cfdi.load.wizard'].create({
+                'move_id': move.id,
+                'xml_file': base64.b64encode(content),
+                'xml_filename': 'a.xml',
+            })
+            self.assertEqual(wizard.preview_uuid, 'AAAAAAAA-0000-0000-0000-000000000004')
+            wizard.action_load_and_validate()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(move.l10n_mx_cfdi_uuid, 'AAAAAAAA-0000-0000-0000-000000000004')
+        self.assertEqual(move.ref, 'A99')
@@ -274,3 +274,220 @@ class TestDashboardCompute(TransactionCase):
             'severity': 'critical',
         })
         self.assertEqual(alert_critical.alert_emoji, '🔴')
+
+    def test_13_financial_progress_stored(self):
+        """El avance financiero es almacenado y usa siempre el total global."""
+        self.assertEqual(self.work.budget_global_total, 1000.0)
+        # Almacenado: se puede filtrar por la columna
+        self.assertIn(
+            self.work,
+            self.env['building.work'].search([('financial_progress', '>=', 100.0)])
+        )
+
+        # Seleccionar un presupuesto en borrador no cambia el total global
+        draft = self.env['building.budget'].create({
+            'name': 'Presupuesto Borrador',
+            'work_id': self.work.id,
+        })
+        self.work.selected_budget_id = draft
+        self.assertEqual(self.work.budget_total, 0.0)
+        self.assertEqual(self.work.budget_global_total, 1000.0)
+        self.assertEqual(self.work.financial_progress, 0.0)
+
+    def test_14_budget_kpis_batched(self):
+        """Editar muchos periodos recalcula los KPIs de la obra una sola vez."""
+        from unittest.mock import patch
+
+        Work = type(self.work)
+        original = Work._compute_budget_kpis
+        calls = []
+
+        def counting(records):
+            calls.append(records.ids)
+            return original(records)
+
+        periods = self.line.period_value_ids
+        self.assertTrue(len(periods) > 1)
+        with patch.object(Work, '_compute_budget_kpis', counting):
+            for period in periods:
+                period.amount = period.amount
+            periods.write({'amount': 0.0})
+            self.env.flush_all()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.work.amount_committed, 0.0)
+
+    def test_15_alerts_diff_upsert(self):
+        """Reconstruir alertas conserva su identidad y respeta los descartes."""
+        Engine = self.env['building.alert.engine']
+        Alert = self.env['building.work.alert']
+        rule = 'RULE_02_FINANCIAL_EXCEEDS_PHYSICAL'
+
+        Engine.rebuild_alerts(self.work.id)
+        alert = Alert.search([('work_id', '=', self.work.id), ('rule_code', '=', rule)])
+        self.assertEqual(len(alert), 1)
+
+        # Misma condición: misma alerta (no se borra ni se recrea)
+        Engine.rebuild_alerts(self.work.id)
+        self.assertEqual(Alert.search([('work_id', '=', self.work.id), ('rule_code', '=', rule)]), alert)
+
+        # Descartada: sigue oculta mientras la condición persista
+        alert.action_dismiss()
+        Engine.rebuild_alerts(self.work.id)
+        self.assertFalse(alert.is_active)
+        self.assertTrue(alert.dismissed)
+
+        # Resuelta: se desactiva y se limpia el descarte
+        self.work.financial_tolerance = 1000.0
+        Engine.rebuild_alerts(self.work.id)
+        self.assertTrue(alert.exists())
+        self.assertFalse(alert.is_active)
+        self.assertFalse(alert.dismissed)
+
+        # Reaparece: la misma alerta se reactiva
+        self.work.financial_tolerance = 5.0
+        Engine.rebuild_alerts(self.work.id)
+        self.assertTrue(alert.is_active)
+
+    def test_16_alerts_queue_multi_work(self):
+        """Los cambios solo encolan; la cola evalúa todas las obras en un lote."""
+        from unittest.mock import patch
+        Engine = self.env['building.alert.engine']
+        Alert = self.env['building.work.alert']
+        other = self.env['building.work'].create({'name': 'Obra Test Alertas 2'})
+        self.env['building.budget'].create({
+            'name': 'Presupuesto Borrador',
+            'work_id': other.id,
+            'duration_months': 6,
+        })
+        Alert.search([('work_id', 'in', (self.work | other).ids)]).unlink()
+
+        Engine.enqueue([self.work.id, other.id, other.id])
+        self.assertFalse(Alert.search([('work_id', 'in', (self.work | other).ids)]),
+                         "Encolar no debe evaluar reglas de inmediato")
+
+        EngineClass = type(Engine)
+        original = EngineClass._evaluate_rules
+        calls = []
+
+        def counting(engine, works):
+            calls.append(set(works.ids))
+            return original(engine, works)
+
+        with patch.object(EngineClass, '_evaluate_rules', counting):
+            Engine.flush_queue()
+        self.assertEqual(calls, [{self.work.id, other.id}])
+
+        self.assertTrue(Alert.search([
+            ('work_id', '=', other.id),
+            ('rule_code', '=', 'RULE_01_BUDGET_NOT_VALIDATED'),
+            ('is_active', '=', True),
+        ]))
+        self.assertTrue(Alert.search([
+            ('work_id', '=', self.work.id),
+            ('rule_code', '=', 'RULE_02_FINANCIAL_EXCEEDS_PHYSICAL'),
+            ('is_active', '=', True),
+        ]))
+
+    def test_17_time_rules_sweep(self):
+        """El barrido programado dispara y resuelve las reglas de tiempo sin tocar las demás."""
+        from datetime import timedelta
+        from odoo import fields
+        Engine = self.env['building.alert.engine']
+        Alert = self.env['building.work.alert']
+        today = fields.Date.today()
+
+        self.work.state = 'running'
+        stage = self.env['building.work.stage'].create({
+            'name': 'Etapa Detenida',
+            'work_id': self.work.id,
+            'state': 'in_progress',
+            'date_start': today - timedelta(days=30),
+            'date_deadline': today - timedelta(days=1),
+        })
+        Engine.rebuild_alerts(self.work.id)
+        other_rules = Alert.search([
+            ('work_id', '=', self.work.id),
+            ('rule_code', 'not like', 'RULE_03_'),
+            ('rule_code', '!=', 'LEGACY_OVERDUE_STAGES'),
+            ('is_active', '=', True),
+        ])
+        Alert.search([('work_id', '=', self.work.id)]).filtered(
+            lambda a: a not in other_rules
+        ).unlink()
+
+        metrics = Engine.sweep_time_rules()
+        self.assertGreaterEqual(metrics['created'], 2)
+        no_progress = Alert.search([
+            ('work_id', '=', self.work.id),
+            ('rule_code', '=', 'RULE_03_NO_START_PROGRESS_%d' % stage.id),
+        ])
+        self.assertTrue(no_progress.is_active)
+        self.assertTrue(Alert.search([
+            ('work_id', '=', self.work.id),
+            ('rule_code', '=', 'LEGACY_OVERDUE_STAGES'),
+            ('is_active', '=', True),
+        ]))
+
+        # Mismo resultado que la reconstrucción completa (sin cambios)
+        Engine.rebuild_alerts(self.work.id)
+        self.assertTrue(no_progress.is_active)
+
+        # Avance reciente y etapa cerrada: se resuelven; las demás reglas no se tocan
+        stage.write({'last_progress_date': fields.Datetime.now(), 'state': 'done'})
+        metrics = Engine.sweep_time_rules()
+        self.assertFalse(no_progress.is_active)
+        self.assertEqual(metrics['resolved'], 2)
+        self.assertTrue(all(other_rules.mapped('is_active')))
+
+    def test_18_alert_rule_registry(self):
+        """Cada fuente se carga una vez por lote; umbrales por obra y reglas nuevas sin tocar el motor."""
+        from unittest.mock import patch
+        Engine = self.env['building.alert.engine']
+        EngineClass = type(Engine)
+        Alert = self.env['building.work.alert']
+        rule = 'RULE_02_FINANCIAL_EXCEEDS_PHYSICAL'
+        other = self.env['building.work'].create({'name': 'Obra Test Registro'})
+
+        original_load = EngineClass._load_stages
+        loads = []
+
+        def counting(engine, works):
+            loads.append(set(works.ids))
+            return original_load(engine, works)
+
+        with patch.object(EngineClass, '_load_stages', counting):
+            Engine.rebuild_alerts([self.work.id, other.id])
+        self.assertEqual(loads, [{self.work.id, other.id}])
+        alert = Alert.search([('work_id', '=', self.work.id), ('rule_code', '=', rule)])
+        self.assertTrue(alert.is_active)
+
+        # Umbral ajustado para la obra: tiene prioridad sobre financial_tolerance
+        self.env['building.work.alert.threshold'].create({
+            'work_id': self.work.id,
+            'rule_key': 'financial_exceeds_physical',
+            'value': 1000.0,
+        })
+        Engine.rebuild_alerts(self.work.id)
+        self.assertFalse(alert.is_active)
+
+        # Regla agregada al registro (como lo haría un módulo que hereda el motor)
+        original_rules = EngineClass._get_alert_rules
+
+        def extra_rules(engine):
+            return original_rules(engine) + [{
+                'key': 'always', 'name': 'Siempre', 'method': '_rule_always',
+                'sources': ('work',), 'default_threshold': 1.0,
+            }]
+
+        def rule_always(engine, work, data, threshold):
+            return [engine._alert_vals(work.id, 'Siempre', 'info', 'other', 'TEST_ALWAYS')]
+
+        with patch.object(EngineClass, '_get_alert_rules', extra_rules), \
+                patch.object(EngineClass, '_rule_always', rule_always, create=True):
+            Engine.rebuild_alerts(self.work.id)
+        self.assertTrue(Alert.search([
+            ('work_id', '=', self.work.id),
+            ('rule_code', '=', 'TEST_ALWAYS'),
+            ('is_active', '=', True),
+        ]))
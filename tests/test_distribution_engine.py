@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Test: Motor de Distribución
+Verifica los vectores de pesos y la distribución masiva de un presupuesto.
+"""
+
+from odoo.tests import TransactionCase, tagged
+from odoo.exceptions import UserError
+
+
+@tagged('post_install', '-at_install', 'building_dashboard')
+class TestDistributionEngine(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Engine = cls.env['building.distribution.engine']
+        cls.work = cls.env['building.work'].create({'name': 'Obra Distribución'})
+        cls.budget = cls.env['building.budget'].create({
+            'name': 'Presupuesto Distribución',
+            'work_id': cls.work.id,
+            'duration_months': 6,
+        })
+        cls.chapter = cls.env['building.budget.chapter'].create({
+            'name': 'Cap Distribución',
+            'budget_id': cls.budget.id,
+        })
+        cls.line1 = cls.env['building.budget.line'].create({
+            'name': 'Partida A',
+            'code': '1.01',
+            'chapter_id': cls.chapter.id,
+            'amount': 600.0,
+        })
+        cls.line2 = cls.env['building.budget.line'].create({
+            'name': 'Partida B',
+            'code': '1.02',
+            'chapter_id': cls.chapter.id,
+            'amount': 1000.0,
+            'advance': 100.0,
+            'period_from': 2,
+            'period_to': 4,
+        })
+
+    def test_01_weights(self):
+        """Los vectores suman 1 y respetan la forma de cada método."""
+        for method in ('uniform', 'front_loaded', 's_curve'):
+            weights = self.Engine.get_weights(method, 6)
+            self.assertEqual(len(weights), 6)
+            self.assertAlmostEqual(sum(weights), 1.0)
+
+        front = self.Engine.get_weights('front_loaded', 4)
+        self.assertGreater(front[0], front[-1])
+
+        s_curve = self.Engine.get_weights('s_curve', 6)
+        self.assertGreater(s_curve[2], s_curve[0])
+        self.assertAlmostEqual(s_curve[0], s_curve[-1])
+
+        custom = self.Engine.get_weights('custom', 3, [1, 1, 2])
+        self.assertEqual(custom, [0.25, 0.25, 0.5])
+        with self.assertRaises(UserError):
+            self.Engine.get_weights('custom', 3, [-1, 2])
+
+    def test_02_distribute_all_uniform(self):
+        """Distribuir Todo reemplaza los periodos de todas las partidas en una pasada."""
+        self.budget.action_distribute_all()
+
+        self.assertEqual(self.line1.period_value_ids.mapped('period_number'), [1, 2, 3, 4, 5, 6])
+        self.assertAlmostEqual(self.line1.total_distributed, 600.0)
+        self.assertEqual(self.line2.period_value_ids.mapped('period_number'), [2, 3, 4])
+        self.assertAlmostEqual(self.line2.total_distributed, 900.0)
+        self.assertEqual(self.line2.period_value_ids[0].period_name, 'M2')
+        self.assertEqual(self.line2.period_value_ids[0].budget_id, self.budget)
+
+        # Redistribuir no duplica registros y propaga los totales a la obra
+        self.budget.action_distribute_all()
+        self.assertEqual(len(self.line1.period_value_ids), 6)
+        self.assertAlmostEqual(self.budget.total_distributed, 1500.0)
+
+    def test_03_distribute_front_loaded(self):
+        """La carga inicial concentra el importe en los primeros periodos."""
+        self.budget.distribution_method = 'front_loaded'
+        self.budget.action_distribute_all()
+        amounts = self.line1.period_value_ids.mapped('amount')
+        self.assertGreater(amounts[0], amounts[-1])
+        self.assertAlmostEqual(sum(amounts), 600.0)
+
+    def test_04_compact_storage(self):
+        """La distribución compacta guarda un vector por partida y alimenta los totales."""
+        self.budget.compact_distribution = True
+        self.budget.action_distribute_all()
+
+        self.assertFalse(self.line1.period_value_ids)
+        self.assertEqual(len(self.line1.distribution_vector), 6)
+        self.assertEqual(self.line2.distribution_vector[0], 0.0)
+        self.assertAlmostEqual(self.line1.total_distributed, 600.0)
+        self.assertAlmostEqual(self.budget.total_distributed, 1500.0)
+
+        matrix = self.Engine.read_period_matrix(self.line2)
+        self.assertEqual(sorted(matrix[self.line2.id]), [2, 3, 4])
+        self.assertAlmostEqual(matrix[self.line2.id][3], 300.0)
+
+        # Volver a filas conserva los montos
+        self.budget.compact_distribution = False
+        self.assertFalse(self.line1.distribution_vector)
+        self.assertEqual(self.line2.period_value_ids.mapped('period_number'), [2, 3, 4])
+        self.assertAlmostEqual(self.budget.total_distributed, 1500.0)
+
+    def test_05_compact_single_representation(self):
+        """Crear filas sobre una partida compacta materializa su vector (sin doble conteo)."""
+        self.budget.compact_distribution = True
+        self.budget.action_distribute_all()
+
+        # El reporte por periodo lee el vector compacto
+        Report = self.env['building.budget.period.report']
+        rows = Report.search([('line_id', '=', self.line2.id)])
+        self.assertEqual(rows.mapped('period_number'), [2, 3, 4])
+        self.assertEqual(set(rows.mapped('storage')), {'compact'})
+        self.assertAlmostEqual(sum(Report.search([('budget_id', '=', self.budget.id)]).mapped('amount')), 1500.0)
+
+        # Agregar un periodo a mano (ORM): el vector pasa a filas
+        self.env['building.budget.period.value'].create({
+            'line_id': self.line1.id,
+            'period_number': 7,
+            'amount': 50.0,
+        })
+        self.assertFalse(self.line1.distribution_vector)
+        self.assertEqual(len(self.line1.period_value_ids), 7)
+        self.assertAlmostEqual(self.line1.total_distributed, 650.0)
+        rows = Report.search([('line_id', '=', self.line1.id)])
+        self.assertEqual(set(rows.mapped('storage')), {'rows'})
+        self.assertAlmostEqual(sum(rows.mapped('amount')), 650.0)
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 from odoo.tests import TransactionCase, tagged
 from odoo import fields
+from datetime import timedelta
+from unittest.mock import patch
+from odoo.exceptions import ValidationError
 
 @tagged('post_install', '-at_install', 'progress_engine')
 class TestProgressEngine(TransactionCase):
@@ -220,10 +223,258 @@ class TestProgressEngine(TransactionCase):
         )
         alert_engine.rebuild_alerts(self.work.id)
         
+        # Las alertas resueltas se desactivan (no se borran)
         alerts_clean = self.env['building.work.alert'].search([
             ('work_id', '=', self.work.id),
-            ('rule_code', 'like', 'RULE_03%')
+            ('rule_code', 'like', 'RULE_03%'),
+            ('is_active', '=', True),
         ])
         # Filtrar solo para stage_2
         alerts_stage_2 = alerts_clean.filtered(lambda a: str(self.stage_2.id) in a.rule_code)
         self.assertFalse(alerts_stage_2, "No debe haber alertas si hay avance reciente")
+
+    def test_05_set_based_recompute(self):
+        """El recálculo set-based de la obra debe coincidir con el cálculo por partida."""
+        engine = self.env['building.progress.engine']
+        engine.apply_progress(self.work.id, self.stage_1.id, self.line_1.id, value=50.0)
+        engine.apply_progress(self.work.id, self.stage_2.id, self.line_3.id, value=25.0)
+
+        # Ensuciar snapshots para verificar que el modo set-based los repara
+        self.line_1.write({'physical_progress': 0.0, 'executed_amount': 0.0})
+        self.stage_1.write({'progress_pct': 0.0})
+
+        engine.recompute_works([self.work.id])
+
+        self.assertAlmostEqual(self.line_1.physical_progress, 50.0)
+        self.assertAlmostEqual(self.line_1.executed_amount, 500.0)
+        self.assertAlmostEqual(self.line_3.physical_progress, 25.0)
+        # Etapa 1: (1000 * 50) / 4000 = 12.5% | Etapa 2: 25%
+        self.assertAlmostEqual(self.stage_1.progress_pct, 12.5, places=2)
+        self.assertAlmostEqual(self.stage_2.progress_pct, 25.0, places=2)
+        # Obra: (12.5 * 4000 + 25 * 4000) / 8000 = 18.75%
+        self.assertAlmostEqual(self.work.overall_progress, 18.75, places=2)
+        self.assertEqual(self.line_1.last_progress_date, fields.Date.today())
+
+    def test_06_incremental_delta_matches_full(self):
+        """El delta incremental de apply_progress debe coincidir con el recálculo completo."""
+        engine = self.env['building.progress.engine']
+        engine.apply_progress(self.work.id, self.stage_1.id, self.line_1.id, value=30.0)
+        engine.apply_progress(self.work.id, self.stage_1.id, self.line_2.id, value=10.0)
+        engine.apply_progress(self.work.id, self.stage_1.id, self.line_1.id, value=20.0)
+        engine.apply_progress(self.work.id, self.stage_2.id, self.line_3.id, value=40.0)
+
+        # Etapa 1: (1000 * 50 + 3000 * 10) / 4000 = 20% | Etapa 2: 40%
+        self.assertAlmostEqual(self.line_1.physical_progress, 50.0)
+        self.assertAlmostEqual(self.stage_1.progress_pct, 20.0, places=2)
+        self.assertAlmostEqual(self.stage_2.progress_pct, 40.0, places=2)
+        self.assertAlmostEqual(self.work.overall_progress, 30.0, places=2)
+
+        drift = engine.verify_work([self.work.id], repair=False)
+        self.assertFalse(any(drift.values()), "El modo incremental no debe generar deriva")
+
+        # Deriva externa: la verificación la detecta y la repara
+        self.stage_2.write({'progress_pct': 0.0})
+        drift = engine.verify_work([self.work.id])
+        self.assertEqual(drift['stages'], [self.stage_2.id])
+        self.assertAlmostEqual(self.stage_2.progress_pct, 40.0, places=2)
+
+    def test_07_stage_planned_totals(self):
+        """Los totales guardados por etapa siguen a importes y asignación de partidas."""
+        engine = self.env['building.progress.engine']
+        self.assertAlmostEqual(self.stage_1.planned_amount, 4000.0)
+        self.assertEqual(self.stage_1.planned_line_count, 2)
+
+        engine.apply_progress(self.work.id, self.stage_1.id, self.line_1.id, value=50.0)
+        self.assertAlmostEqual(self.stage_1.progress_weighted, 50000.0)
+
+        # Reasignar partida: ambas etapas actualizan sus totales
+        self.line_2.write({'stage_id': self.stage_2.id})
+        self.assertAlmostEqual(self.stage_1.planned_amount, 1000.0)
+        self.assertAlmostEqual(self.stage_2.planned_amount, 7000.0)
+        self.assertAlmostEqual(self.stage_1.progress_pct, 50.0, places=2)
+
+        # Cambio de importe
+        self.line_1.write({'amount': 2000.0})
+        self.assertAlmostEqual(self.stage_1.planned_amount, 2000.0)
+        self.assertAlmostEqual(self.stage_1.progress_weighted, 100000.0)
+        # Obra: (50 * 2000 + 0 * 7000) / 9000
+        self.assertAlmostEqual(self.work.overall_progress, 100000.0 / 9000.0, places=2)
+        self.assertFalse(any(engine.verify_work([self.work.id], repair=False).values()))
+
+    def test_08_apply_progress_batch(self):
+        """La captura masiva valida el tope de 100% y recalcula la obra una vez."""
+        engine = self.env['building.progress.engine']
+        engine.apply_progress(self.work.id, self.stage_1.id, self.line_1.id, value=60.0)
+
+        # 60 + 30 + 20 > 100: el lote completo se rechaza
+        with self.assertRaises(ValidationError):
+            engine.apply_progress_batch([
+                (self.line_1.id, 30.0, None, 'Semana 1'),
+                (self.line_1, 20.0),
+                (self.line_3.id, 10.0),
+            ])
+
+        logs = engine.apply_progress_batch([
+            (self.line_1.id, 30.0, None, 'Semana 1'),
+            (self.line_2, 50.0),
+            (self.line_3.id, 10.0),
+            (self.line_3.id, 15.0),
+        ])
+        self.assertEqual(len(logs), 4)
+        self.assertAlmostEqual(self.line_1.physical_progress, 90.0)
+        self.assertAlmostEqual(self.line_3.physical_progress, 25.0)
+        # Etapa 1: (1000 * 90 + 3000 * 50) / 4000 = 60%
+        self.assertAlmostEqual(self.stage_1.progress_pct, 60.0, places=2)
+        self.assertFalse(any(engine.verify_work([self.work.id], repair=False).values()))
+
+    def test_09_accumulated_window(self):
+        """El acumulado por fecha se calcula con la función ventana (incluye registros retroactivos)."""
+        engine = self.env['building.progress.engine']
+        today = fields.Date.today()
+        log_b = engine.apply_progress(self.work.id, self.stage_1.id, self.line_1.id, value=20.0, date=today)
+        log_a = engine.apply_progress(
+            self.work.id, self.stage_1.id, self.line_1.id, value=10.0, date=today - timedelta(days=3),
+        )
+        log_a.action_cancel()
+        log_c = engine.apply_progress(
+            self.work.id, self.stage_1.id, self.line_1.id, value=5.0, date=today - timedelta(days=1),
+        )
+        (log_b | log_c).invalidate_recordset(['percent_accumulated'])
+        (log_b | log_c)._compute_accumulated()
+        self.assertEqual(log_a.percent_accumulated, 0.0)
+        self.assertAlmostEqual(log_c.percent_accumulated, 5.0)
+        self.assertAlmostEqual(log_b.percent_accumulated, 25.0)
+
+        running, totals = engine._get_running_totals(
+            'building.budget.progress', 'line_id', 'percent_period', [self.line_1.id],
+        )
+        self.assertAlmostEqual(totals[self.line_1.id], 25.0)
+        self.assertAlmostEqual(running[log_c.id], 5.0)
+
+    def test_10_progress_snapshot_curves(self):
+        """El engine guarda un snapshot diario por obra/etapa y get_curves lo devuelve."""
+        engine = self.env['building.progress.engine']
+        Snapshot = self.env['building.progress.snapshot']
+        engine.apply_progress(self.work.id, self.stage_1.id, self.line_1.id, value=50.0)
+        engine.apply_progress(self.work.id, self.stage_2.id, self.line_3.id, value=25.0)
+
+        # Los recálculos solo encolan la obra; el snapshot se escribe en el pre-commit
+        today = fields.Date.context_today(Snapshot)
+        self.assertFalse(Snapshot.search_count([('work_id', '=', self.work.id)]))
+        Snapshot.flush_queue()
+
+        # Una sola fila por entidad y día aunque haya varios recálculos
+        self.assertEqual(Snapshot.search_count([
+            ('work_id', '=', self.work.id), ('stage_id', '=', False), ('date', '=', today),
+        ]), 1)
+
+        curves = Snapshot.get_curves([self.work.id], include_stages=True)
+        work_curve = curves[(self.work.id, False)]
+        self.assertEqual(len(work_curve), 1)
+        self.assertAlmostEqual(work_curve[-1]['physical_pct'], 18.75, places=2)
+        # Valor ganado: 1000 * 50% + 4000 * 25%
+        self.assertAlmostEqual(work_curve[-1]['executed_amount'], 1500.0, places=2)
+        self.assertAlmostEqual(curves[(self.work.id, self.stage_1.id)][-1]['physical_pct'], 12.5, places=2)
+
+    def test_11_consistency_warning_follows_engine(self):
+        """Los UPDATE del engine recalculan consistency_warning (columna almacenada)."""
+        engine = self.env['building.progress.engine']
+        self.env.flush_all()
+        # Avance financiero 5% sobre avance físico 0%: alerta encendida
+        self.env.cr.execute(
+            "UPDATE building_work SET financial_progress = 5, consistency_warning = TRUE WHERE id = %s",
+            [self.work.id],
+        )
+        self.work.invalidate_recordset(['financial_progress', 'consistency_warning'])
+
+        # 100% en Line 1: avance físico 1000 / 8000 = 12.5% > 5%
+        engine.apply_progress(self.work.id, self.stage_1.id, self.line_1.id, value=100.0)
+        self.env.flush_all()
+        self.env.cr.execute("SELECT consistency_warning FROM building_work WHERE id = %s", [self.work.id])
+        self.assertFalse(self.env.cr.fetchone()[0])
+
+        # El recálculo por conjuntos también la mantiene al día
+        self.env.cr.execute(
+            "UPDATE building_work SET financial_progress = 50 WHERE id = %s", [self.work.id],
+        )
+        self.work.invalidate_recordset(['financial_progress'])
+        self.env.cr.execute(
+            "UPDATE building_work SET overall_progress = 0 WHERE id = %s", [self.work.id],
+        )
+        self.work.invalidate_recordset(['overall_progress'])
+        engine.recompute_works([self.work.id])
+        self.env.flush_all()
+        self.env.cr.execute("SELECT consistency_warning FROM building_work WHERE id = %s", [self.work.id])
+        self.assertTrue(self.env.cr.fetchone()[0])
+
+    def _patch_engine(self, method):
+        """Cuenta las llamadas a un método del engine sin cambiar su efecto."""
+        Engine = type(self.env['building.progress.engine'])
+        return patch.object(Engine, method, autospec=True, side_effect=getattr(Engine, method))
+
+    def test_12_deferred_queue_dedup(self):
+        """N escrituras dentro de deferred_recompute: un solo recálculo por obra."""
+        engine = self.env['building.progress.engine']
+        with self._patch_engine('recompute_hierarchy') as hierarchy:
+            with engine.deferred_recompute():
+                self.line_1.write({'amount': 1100.0})
+                self.line_2.write({'amount': 3100.0})
+                self.line_3.write({'amount': 4100.0})
+                hierarchy.assert_not_called()
+        self.assertEqual(hierarchy.call_count, 1)
+        self.assertEqual(
+            set(hierarchy.call_args.kwargs['line_ids']),
+            {self.line_1.id, self.line_2.id, self.line_3.id},
+        )
+
+        # Importación de partidas: un recálculo set-based para toda la carga
+        with self._patch_engine('recompute_works') as works:
+            self.env['building.budget.line'].load(
+                ['name', 'code', 'chapter_id/.id', 'amount'],
+                [
+                    ['Line 5', '01.05', str(self.chapter.id), '100'],
+                    ['Line 6', '01.06', str(self.chapter.id), '200'],
+                    ['Line 7', '01.07', str(self.chapter.id), '300'],
+                ],
+            )
+        self.assertEqual(works.call_count, 1)
+        self.assertEqual(works.call_args.args[1], [self.work.id])
+
+    def test_13_deferred_queue_nesting_and_errors(self):
+        """Solo el bloque más externo vacía la cola; con excepción no se recalcula."""
+        engine = self.env['building.progress.engine']
+        with self._patch_engine('recompute_works') as works:
+            with engine.deferred_recompute():
+                with engine.deferred_recompute():
+                    engine.mark_dirty(self.work.id)
+                works.assert_not_called()
+            self.assertEqual(works.call_count, 1)
+
+        with self._patch_engine('recompute_works') as works:
+            with self.assertRaises(ValueError):
+                with engine.deferred_recompute():
+                    engine.mark_dirty(self.work.id)
+                    raise ValueError('boom')
+            works.assert_not_called()
+        self.assertEqual(engine._get_dirty_queue()['depth'], 0)
+
+    def test_14_precommit_flush_writes(self):
+        """El vaciado del pre-commit escribe también los campos almacenados que dispara."""
+        engine = self.env['building.progress.engine']
+        engine.apply_progress(self.work.id, self.stage_1.id, self.line_1.id, value=100.0)
+        self.env.flush_all()
+        self.env.cr.execute(
+            """
+            UPDATE building_work
+               SET overall_progress = 0, financial_progress = 5, consistency_warning = TRUE
+             WHERE id = %s
+            """,
+            [self.work.id],
+        )
+        self.work.invalidate_recordset(['overall_progress', 'financial_progress', 'consistency_warning'])
+
+        engine._get_dirty_queue()['works'][self.work.id] = {'full': True, 'stages': set(), 'lines': set()}
+        engine._precommit_flush_dirty()
+        # Sin flush posterior: lectura directa de la columna
+        self.env.cr.execute("SELECT consistency_warning FROM building_work WHERE id = %s", [self.work.id])
+        self.assertFalse(self.env.cr.fetchone()[0])
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Test: Servicio de Validación SAT
+Usa un servidor SOAP local en lugar del SAT (parámetro building.sat.url).
+"""
+
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.building_dashboard.models.sat_service import SatClient
+
+# Latencia simulada por consulta (segundos)
+LATENCY = 0.2
+
+
+class FakeSatHandler(BaseHTTPRequestHandler):
+    """
+    SOAP local: el estatus depende del prefijo del UUID (C=Cancelado,
+    N=No Encontrado, E=siempre HTTP 503, R=503 solo la primera vez).
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        uuid = re.search(r'id=([\w-]+)', body).group(1)
+        server = self.server
+        with server.lock:
+            server.calls[uuid] = server.calls.get(uuid, 0) + 1
+            attempt = server.calls[uuid]
+        time.sleep(LATENCY)
+        # Prefijo R: falla la primera vez (prueba de reintento)
+        if uuid.startswith('E') or (uuid.startswith('R') and attempt == 1):
+            self.send_response(503)
+            self.end_headers()
+            return
+        estado = {'C': 'Cancelado', 'N': 'No Encontrado'}.get(uuid[0], 'Vigente')
+        payload = ('<s:Envelope><s:Body><ConsultaResponse><ConsultaResult>'
+                   '<a:Estado>%s</a:Estado></ConsultaResult></ConsultaResponse></s:Body></s:Envelope>' % estado)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.end_headers()
+        self.wfile.write(payload.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@tagged('post_install', '-at_install', 'building_dashboard')
+class TestSatService(TransactionCase):
+    """Tests del cliente SAT contra un servidor SOAP local."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSatHandler)
+        cls.server.calls = {}
+        cls.server.lock = threading.Lock()
+        thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        thread.start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.url = 'http://127.0.0.1:%d/ConsultaCFDIService.svc' % cls.server.server_address[1]
+
+    def setUp(self):
+        super().setUp()
+        self.server.calls.clear()
+
+    def test_01_statuses(self):
+        """Mapea Vigente, Cancelado y No Encontrado."""
+        client = SatClient(self.url, rate=0)
+        self.assertEqual(client.check('AAA010101AAA', 'XAXX010101000', 116.0, 'V-1'), 'valid')
+        self.assertEqual(client.check('AAA010101AAA', 'XAXX010101000', 116.0, 'C-1'), 'cancelled')
+        self.assertEqual(client.check('AAA010101AAA', 'XAXX010101000', 116.0, 'N-1'), 'not_found')
+
+    def test_02_parallel(self):
+        """Muchas consultas tardan mucho menos que N × latencia."""
+        client = SatClient(self.url, max_workers=8, rate=0)
+        items = [('AAA010101AAA', 'XAXX010101000', 100.0, 'V-%d' % i) for i in range(16)]
+        started = time.monotonic()
+        statuses = client.check_many(items)
+        elapsed = time.monotonic() - started
+        self.assertEqual(statuses, {item[3]: 'valid' for item in items})
+        self.assertLess(elapsed, len(items) * LATENCY / 2)
+
+    def test_03_retry(self):
+        """Un 503 se reintenta con backoff."""
+        client = SatClient(self.url, rate=0, backoff=0.01)
+        self.assertEqual(client.check('AAA010101AAA', 'XAXX010101000', 1.0, 'R-1'), 'valid')
+        self.assertEqual(self.server.calls['R-1'], 2)
+
+        no_retry = SatClient(self.url, rate=0, retries=0)
+        self.assertEqual(no_retry.check('AAA010101AAA', 'XAXX010101000', 1.0, 'R-2'), 'error')
+
+    def test_04_rate_limit(self):
+        """El límite por host espacia las peticiones."""
+        client = SatClient(self.url, max_workers=8, rate=20.0)
+        items = [('AAA010101AAA', 'XAXX010101000', 1.0, 'V-rl-%d' % i) for i in range(6)]
+        started = time.monotonic()
+        client.check_many(items)
+        # 6 peticiones a 20/s: al menos 5 intervalos de 50 ms
+        self.assertGreaterEqual(time.monotonic() - started, 5 * 0.05)
+
+    def test_05_service_uses_configured_url(self):
+        """building.sat.service usa building.sat.url."""
+        self.env['ir.config_parameter'].sudo().set_param('building.sat.url', self.url)
+        Service = self.env['building.sat.service']
+        self.assertEqual(Service.check_status('AAA010101AAA', 'XAXX010101000', 1.0, 'C-9'), 'cancelled')
+        self.assertEqual(
+            Service.check_status_many([
+                ('AAA010101AAA', 'XAXX010101000', 1.0, 'V-9'),
+                ('AAA010101AAA', 'XAXX010101000', 1.0, 'N-9'),
+            ]),
+            {'V-9': 'valid', 'N-9': 'not_found'},
+        )
+
+    def test_06_status_cache(self):
+        """La caché evita consultas repetidas y respeta la vigencia por estatus."""
+        from datetime import timedelta
+        from unittest.mock import patch
+        from odoo import fields
+        self.env['ir.config_parameter'].sudo().set_param('building.sat.url', self.url)
+        Service = self.env['building.sat.service']
+        Cache = self.env['building.sat.status.cache']
+        items = [
+            ('AAA010101AAA', 'XAXX010101000', 1.0, 'V-CACHE'),
+            ('AAA010101AAA', 'XAXX010101000', 1.0, 'C-CACHE'),
+            ('AAA010101AAA', 'XAXX010101000', 1.0, 'N-CACHE'),
+        ]
+        expected = {'V-CACHE': 'valid', 'C-CACHE': 'cancelled', 'N-CACHE': 'not_found'}
+        self.assertEqual(Service.check_status_many(items), expected)
+        self.assertEqual(Service.check_status_many(items), expected)
+        self.assertEqual(self.server.calls, {'V-CACHE': 1, 'C-CACHE': 1, 'N-CACHE': 1})
+
+        # Vencidas: vigente y no encontrado se reconsultan, cancelado es definitivo
+        Cache.search([('uuid', 'in', list(expected))]).write({
+            'checked_at': fields.Datetime.now() - timedelta(days=30),
+        })
+        self.assertEqual(Service.check_status_many(items), expected)
+        self.assertEqual(self.server.calls, {'V-CACHE': 2, 'C-CACHE': 1, 'N-CACHE': 2})
+
+        # SAT con error: se conserva el último estatus conocido
+        Cache.search([('uuid', '=', 'V-CACHE')]).write({
+            'checked_at': fields.Datetime.now() - timedelta(days=30),
+        })
+        client = Service._get_client()
+        with patch.object(type(client), 'check_many', return_value={'V-CACHE': 'error'}):
+            self.assertEqual(Service.check_status(*items[0]), 'valid')
+        # force=True ignora la caché vigente
+        Service.check_status(*items[1], force=True)
+        self.assertEqual(self.server.calls['C-CACHE'], 2)
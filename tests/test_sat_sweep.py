@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Test: Barrido de Revalidación SAT
+Usa el servidor SOAP local de test_sat_service en lugar del SAT.
+"""
+
+import threading
+from datetime import timedelta
+from http.server import ThreadingHTTPServer
+
+from odoo import fields
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+from .test_sat_service import FakeSatHandler
+
+
+@tagged('post_install', '-at_install', 'building_dashboard')
+class TestSatSweep(AccountTestInvoicingCommon):
+    """Tests del cron de revalidación SAT de facturas de proveedor."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSatHandler)
+        cls.server.calls = {}
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.env['ir.config_parameter'].sudo().set_param(
+            'building.sat.url', 'http://127.0.0.1:%d/sat' % cls.server.server_address[1])
+
+        cls.work = cls.env['building.work'].create({'name': 'Obra Test SAT'})
+
+    def _bill(self, uuid):
+        bill = self.init_invoice('in_invoice', amounts=[100.0], post=True)
+        bill.write({
+            'l10n_mx_cfdi_uuid': uuid,
+            'l10n_mx_cfdi_rfc_emisor': 'AAA010101AAA',
+            'l10n_mx_cfdi_rfc_receptor': 'XAXX010101000',
+            'l10n_mx_cfdi_sat_status': 'valid',
+        })
+        return bill
+
+    def test_01_sweep_flags_cancelled_and_alerts_work(self):
+        """El barrido revalida, marca canceladas y alerta a la obra de la factura aplicada."""
+        cancelled = self._bill('C-SWEEP-1')
+        valid = self._bill('V-SWEEP-1')
+        self.env['building.bill.allocation'].create({
+            'move_id': cancelled.id,
+            'line_ids': [(0, 0, {'work_id': self.work.id, 'amount': 100.0})],
+        })
+
+        metrics = self.env['account.move']._cron_recheck_sat(batch_size=1)
+        self.assertGreaterEqual(metrics['moves'], 2)
+        # Las obras afectadas se encolan en el motor de alertas (precommit)
+        self.env['building.alert.engine'].flush_queue()
+        self.assertEqual(cancelled.l10n_mx_cfdi_sat_status, 'cancelled')
+        self.assertEqual(valid.l10n_mx_cfdi_sat_status, 'valid')
+        self.assertTrue(valid.l10n_mx_cfdi_sat_checked_at)
+
+        alert = self.env['building.work.alert'].search([
+            ('work_id', '=', self.work.id),
+            ('rule_code', '=', 'SAT_CANCELLED_%d' % cancelled.id),
+        ])
+        self.assertTrue(alert.is_active)
+        self.assertEqual(alert.severity, 'critical')
+
+        # La reconstrucción completa de alertas la conserva (es una regla registrada)
+        self.env['building.alert.engine'].rebuild_alerts(self.work.id)
+        self.assertTrue(alert.is_active)
+
+    def test_02_sweep_skips_fresh_and_resumes(self):
+        """Las facturas validadas recientemente no se revisan; las vencidas sí."""
+        bill = self._bill('V-SWEEP-2')
+        Move = self.env['account.move']
+        Move._cron_recheck_sat()
+        calls = self.server.calls.get('V-SWEEP-2', 0)
+        self.assertNotIn(bill, Move.search(Move._get_sat_sweep_domain()))
+
+        Move._cron_recheck_sat()
+        self.assertEqual(self.server.calls.get('V-SWEEP-2', 0), calls)
+
+        bill.l10n_mx_cfdi_sat_checked_at = fields.Datetime.now() - timedelta(days=30)
+        self.assertIn(bill, Move.search(Move._get_sat_sweep_domain()))
+
+    def test_03_time_budget(self):
+        """Sin presupuesto de tiempo no se procesa nada (el resto queda para otra corrida)."""
+        self._bill('V-SWEEP-3')
+        metrics = self.env['account.move']._cron_recheck_sat(time_budget=0)
+        self.assertEqual(metrics['moves'], 0)
+
+    def test_04_error_keeps_status_and_stays_due(self):
+        """Un error del SAT no pisa el estatus ni marca la fecha; la factura sigue pendiente."""
+        bill = self._bill('E-SWEEP-4')
+        Move = self.env['account.move']
+        metrics = Move._cron_recheck_sat()
+        self.assertEqual(bill.l10n_mx_cfdi_sat_status, 'valid')
+        self.assertFalse(bill.l10n_mx_cfdi_sat_checked_at)
+        self.assertGreaterEqual(metrics['errors'], 1)
+        self.assertIn(bill, Move.search(Move._get_sat_sweep_domain()))
+
+    def test_05_staleness_per_status(self):
+        """La vigencia depende del estatus: 'no encontrado' se revisa antes que 'vigente'."""
+        valid = self._bill('V-SWEEP-5')
+        missing = self._bill('N-SWEEP-5')
+        checked_at = fields.Datetime.now() - timedelta(days=2)
+        valid.l10n_mx_cfdi_sat_checked_at = checked_at
+        missing.write({'l10n_mx_cfdi_sat_status': 'not_found', 'l10n_mx_cfdi_sat_checked_at': checked_at})
+        Move = self.env['account.move']
+        due = Move.search(Move._get_sat_sweep_domain())
+        self.assertIn(missing, due)
+        self.assertNotIn(valid, due)
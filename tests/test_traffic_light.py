@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from odoo import fields
 from odoo.tests import common
 
 from odoo.tests import common, tagged
@@ -130,3 +133,120 @@ class TestTrafficLight(common.TransactionCase):
         })
         self.stage.invalidate_recordset()
         self.assertEqual(self.stage.traffic_light, 'red', "Budget 0, Real > 0 should be Red")
+
+    def test_05_multi_work_totals(self):
+        """ Totales multi-obra: una llamada respeta la fuente y el corte de cada obra """
+        Engine = self.env['building.financial.engine']
+        work_b = self.Work.create({'name': 'Work Test Multi B'})
+        stage_b = self.Stage.create({'name': 'Stage B', 'work_id': work_b.id})
+        b_line = self.BudgetLine.create({
+            'chapter_id': self.chapter.id,
+            'code': '05', 'name': 'Line 5', 'amount': 1000.0,
+            'stage_id': self.stage.id
+        })
+        today = fields.Date.today()
+        for work, stage, amount, date in (
+            (self.work, self.stage, 300.0, today),
+            (work_b, stage_b, 200.0, today - timedelta(days=10)),
+            (work_b, stage_b, 50.0, today),
+        ):
+            self.RealLine.create({
+                'work_id': work.id,
+                'stage_id': stage.id,
+                'budget_line_id': b_line.id if work == self.work else False,
+                'amount': amount,
+                'date': date,
+                'name': 'Real Multi',
+                'approval_state': 'approved',
+            })
+        # Plan B con corte: solo cuenta lo interno anterior a la fecha de corte
+        work_b.write({'real_source': 'accounting', 'real_cutover_date': today - timedelta(days=1)})
+
+        totals = Engine.get_stage_financial_totals_multi([self.work.id, work_b.id])
+        self.assertEqual(totals[self.work.id][self.stage.id], {'budget': 1000.0, 'real': 300.0})
+        self.assertEqual(totals[work_b.id][stage_b.id], {'budget': 0.0, 'real': 200.0})
+
+        reals = Engine.get_real_amounts_multi([self.work.id, work_b.id])
+        self.assertEqual(reals[self.work.id], {b_line.id: 300.0})
+        self.assertEqual(Engine.get_real_amounts(self.work.id), reals[self.work.id])
+
+    def test_06_accounting_source(self):
+        """ Plan B: interno anterior al corte + analítica publicada desde el corte """
+        Engine = self.env['building.financial.engine']
+        plan = self.env['account.analytic.plan'].create({'name': 'Control de Obras Test'})
+        account = self.env['account.analytic.account'].create({'name': 'Partida Analítica', 'plan_id': plan.id})
+        b_line = self.BudgetLine.create({
+            'chapter_id': self.chapter.id,
+            'code': '06', 'name': 'Line 6', 'amount': 1000.0,
+            'stage_id': self.stage.id
+        })
+        b_line.analytic_account_id = account
+        today = fields.Date.today()
+        self.RealLine.create({
+            'work_id': self.work.id,
+            'stage_id': self.stage.id,
+            'budget_line_id': b_line.id,
+            'amount': 100.0,
+            'date': today - timedelta(days=10),
+            'name': 'Real Pre-Corte',
+            'approval_state': 'approved',
+        })
+        self.work.write({'real_source': 'accounting', 'real_cutover_date': today - timedelta(days=5)})
+
+        AnalyticLine = self.env['account.analytic.line']
+        column = plan._column_name()
+        for amount, date in ((-250.0, today), (-999.0, today - timedelta(days=6))):
+            AnalyticLine.create({
+                'name': 'Gasto contable',
+                column: account.id,
+                'amount': amount,
+                'date': date,
+            })
+
+        # 100 interno (pre-corte) + 250 contable (post-corte); lo contable pre-corte no cuenta
+        self.assertEqual(Engine.get_real_amounts(self.work.id), {b_line.id: 350.0})
+        self.assertEqual(Engine.get_stage_financial_totals(self.work.id)[self.stage.id]['real'], 350.0)
+        self.assertEqual(self.work.amount_paid, 350.0)
+        b_line.invalidate_recordset()
+        self.assertEqual(b_line.real_total, 350.0)
+
+    def test_07_accounting_source_analytic_hooks(self):
+        """ Plan B: solo las escrituras que cambian el real marcan la obra """
+        from unittest.mock import patch
+        plan = self.env['account.analytic.plan'].create({'name': 'Control de Obras Hooks'})
+        account = self.env['account.analytic.account'].create({'name': 'Cuenta Obra', 'plan_id': plan.id})
+        other = self.env['account.analytic.account'].create({'name': 'Cuenta Ajena', 'plan_id': plan.id})
+        self.work.write({'real_source': 'accounting', 'analytic_account_id': account.id})
+
+        AnalyticLine = self.env['account.analytic.line']
+        column = plan._column_name()
+        line = AnalyticLine.create({'name': 'Gasto', column: account.id, 'amount': -200.0})
+        self.assertEqual(self.work.amount_paid, 200.0)
+        self.assertEqual(line._building_get_real_work_ids(), {self.work.id})
+        foreign = AnalyticLine.create({'name': 'Gasto ajeno', column: other.id, 'amount': -50.0})
+        self.assertFalse(foreign._building_get_real_work_ids())
+
+        with patch.object(type(AnalyticLine), '_building_mark_real_dirty') as mark:
+            line.write({'name': 'Gasto renombrado'})
+        mark.assert_not_called()
+
+        with patch.object(type(AnalyticLine), '_building_mark_real_dirty', autospec=True) as mark:
+            line.write({'amount': -250.0})
+        mark.assert_called_once()
+
+        line.write({'amount': -300.0})
+        self.assertEqual(self.work.amount_paid, 300.0)
+        # Cambio de cuenta: la obra anterior también se recalcula
+        line.write({column: other.id})
+        self.assertEqual(self.work.amount_paid, 0.0)
+
+    def test_08_thresholds_follow_parameter(self):
+        """ Los umbrales reflejan un cambio del parámetro en la misma transacción """
+        Engine = self.env['building.financial.engine']
+        ICP = self.env['ir.config_parameter'].sudo()
+        ICP.set_param('building.budget_real_threshold_warning', '70')
+        self.assertEqual(Engine.get_thresholds(), (70.0, 100.0))
+        ICP.set_param('building.budget_real_threshold_warning', '75')
+        self.assertEqual(Engine.get_thresholds(), (75.0, 100.0))
+        ICP.set_param('building.budget_real_threshold_warning', False)
+        self.assertEqual(Engine.get_thresholds(default_warning=80.0), (80.0, 100.0))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Test: KPIs de Portafolio (building.work.kpi)
+Verifica que la tabla materializada coincide con los KPIs de la obra y que
+el refresco incremental solo toca las obras modificadas.
+"""
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.building_dashboard.models.building_work_kpi import TOUCH_TABLES
+
+
+@tagged('post_install', '-at_install', 'building_dashboard')
+class TestWorkKpi(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Kpi = cls.env['building.work.kpi']
+
+        cls.work = cls.env['building.work'].create({'name': 'Obra KPI 1'})
+        cls.other_work = cls.env['building.work'].create({'name': 'Obra KPI 2'})
+        cls.stage = cls.env['building.work.stage'].create({
+            'name': 'Etapa KPI',
+            'work_id': cls.work.id,
+        })
+
+        cls.budget = cls.env['building.budget'].create({
+            'name': 'Presupuesto KPI',
+            'work_id': cls.work.id,
+        })
+        chapter = cls.env['building.budget.chapter'].create({
+            'name': 'Cap KPI',
+            'budget_id': cls.budget.id,
+        })
+        cls.line = cls.env['building.budget.line'].create({
+            'name': 'Partida KPI',
+            'code': '1.01',
+            'chapter_id': chapter.id,
+            'amount': 2000.0,
+            'stage_id': cls.stage.id,
+        })
+        cls.budget.action_validate()
+
+    def _kpi(self, work):
+        return self.Kpi.search([('work_id', '=', work.id)])
+
+    def test_01_full_refresh_matches_work(self):
+        """El refresco explícito replica los KPIs almacenados de la obra."""
+        self.env['building.real.line'].create({
+            'work_id': self.work.id,
+            'stage_id': self.stage.id,
+            'budget_line_id': self.line.id,
+            'amount': 500.0,
+            'name': 'Gasto KPI',
+            'approval_state': 'approved',
+        })
+        self.Kpi.refresh(self.work.ids)
+
+        kpi = self._kpi(self.work)
+        self.assertEqual(len(kpi), 1)
+        self.assertAlmostEqual(kpi.budget_total, self.work.budget_total)
+        self.assertAlmostEqual(kpi.amount_committed, self.work.amount_committed)
+        self.assertAlmostEqual(kpi.amount_paid, 500.0)
+        self.assertAlmostEqual(kpi.amount_available, self.work.amount_available)
+        self.assertAlmostEqual(kpi.financial_progress, self.work.financial_progress)
+
+        # Un segundo refresco actualiza la misma fila (upsert)
+        self.Kpi.refresh(self.work.ids)
+        self.assertEqual(len(self._kpi(self.work)), 1)
+
+    def test_02_incremental_only_touched(self):
+        """El refresco incremental solo recalcula las obras modificadas."""
+        self.Kpi.refresh()
+        self.assertTrue(self._kpi(self.work))
+        self.assertTrue(self._kpi(self.other_work))
+
+        # Todo lo de esta transacción es posterior a la marca: simular que ya
+        # estaba confirmado antes del refresco
+        for table in ('building_work',) + TOUCH_TABLES:
+            self.env.cr.execute(
+                "UPDATE %s SET write_date = write_date - interval '1 hour'" % table
+            )
+        touched = self.Kpi._get_touched_work_ids(
+            self.env['ir.config_parameter'].sudo().get_param('building.work_kpi.last_refresh')
+        )
+        self.assertNotIn(self.other_work.id, touched)
+
+        # Forzar un write_date posterior a la marca en una partida de la obra 1
+        self.env.cr.execute(
+            "UPDATE building_budget_line SET write_date = now() at time zone 'UTC' + interval '1 minute' "
+            "WHERE id = %s", [self.line.id]
+        )
+        touched = self.Kpi._get_touched_work_ids(
+            self.env['ir.config_parameter'].sudo().get_param('building.work_kpi.last_refresh')
+        )
+        self.assertIn(self.work.id, touched)
+        self.assertNotIn(self.other_work.id, touched)
+
+    def test_03_marker_and_deletions(self):
+        """La marca no supera el inicio de la transacción y los borrados se encolan."""
+        self.env.cr.execute("SELECT now() at time zone 'UTC'")
+        started_at = self.env.cr.fetchone()[0]
+        self.assertLessEqual(self.Kpi._get_refresh_marker(), started_at)
+
+        self.Kpi.refresh()
+        self.assertFalse(self.Kpi._pop_dirty_work_ids())
+        real_line = self.env['building.real.line'].create({
+            'work_id': self.work.id,
+            'budget_line_id': self.line.id,
+            'amount': 100.0,
+            'name': 'Gasto a borrar',
+        })
+        real_line.unlink()
+        self.assertEqual(self.Kpi._pop_dirty_work_ids(), [self.work.id])
+        # La cola se consume una sola vez
+        self.assertFalse(self.Kpi._pop_dirty_work_ids())
+
+    def test_04_open_portfolio_does_not_write(self):
+        """Abrir el portafolio no escribe KPIs ni la marca en la transacción del usuario."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        ICP.set_param('building.work_kpi.last_refresh', False)
+        action = self.Kpi.action_open_portfolio()
+        self.assertEqual(action['res_model'], 'building.work.kpi')
+        self.assertFalse(ICP.get_param('building.work_kpi.last_refresh'))
+        self.assertFalse(self._kpi(self.other_work))
+
+    def test_05_alerts_touch_work(self):
+        """Activar o descartar alertas marca la obra para el refresco incremental."""
+        self.Kpi.refresh()
+        for table in ('building_work',) + TOUCH_TABLES:
+            self.env.cr.execute(
+                "UPDATE %s SET write_date = write_date - interval '1 hour'" % table
+            )
+        alert = self.env['building.work.alert'].create({
+            'name': 'Alerta KPI',
+            'work_id': self.work.id,
+        })
+        self.env.flush_all()
+        # El recálculo de active_alert_count no cambia building_work.write_date
+        self.env.cr.execute(
+            "UPDATE building_work SET write_date = write_date - interval '1 hour' WHERE id = %s",
+            [self.work.id],
+        )
+        self.assertIn(self.work.id, self.Kpi._get_touched_work_ids(
+            self.env['ir.config_parameter'].sudo().get_param('building.work_kpi.last_refresh')
+        ))
+
+        self.Kpi.refresh(self.work.ids)
+        self.assertEqual(self._kpi(self.work).active_alert_count, self.work.active_alert_count)
+        alert.action_dismiss()
+        self.Kpi.refresh()
+        self.assertEqual(self._kpi(self.work).active_alert_count, self.work.active_alert_count)
@@ -6,4 +6,5 @@ from . import building_change_real_source_wizard
 from . import building_chapter_loader_wizard
 from . import consolidate_budget_wizard
 from . import cfdi_load_wizard
+from . import cfdi_bulk_load_wizard
 from . import allocate_bill_wizard
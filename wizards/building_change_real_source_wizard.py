@@ -109,6 +109,11 @@ class BuildingChangeRealSourceWizard(models.TransientModel):
             
         return {'type': 'ir.actions.act_window_close'}
 
+    def _get_migration_distribution(self, budget_line):
+        """Distribución analítica para el apunte de gasto migrado."""
+        account = budget_line.analytic_account_id or self.work_id.analytic_account_id
+        return {str(account.id): 100} if account else False
+
     def _execute_migration(self):
         """
         Genera asiento contable y marca líneas.
@@ -153,7 +158,9 @@ class BuildingChangeRealSourceWizard(models.TransientModel):
                 'name': f"Migración {budget_line.name}",
                 'debit': amount,
                 'credit': 0.0,
-                # TODO: Analytics integration if needed
+                # Analítica de la partida (o de la obra): así el histórico
+                # migrado entra al real contable del Plan B
+                'analytic_distribution': self._get_migration_distribution(budget_line),
             }))
              # Linea Puente (Credit) - Sumarizada o por linea?
              # Mejor una contrapartida por linea para claridad o una total?
@@ -67,44 +67,46 @@ class BuildingChapterLoaderWizard(models.TransientModel):
         ctx['allow_stage_assignment_on_validated'] = True
         
         # Iterar Capítulos y sus Partidas
-        # Ya no buscamos "existentes" para clonar. Trabajamos directamente sobre las partidas del presupuesto.
-        for chapter in self.chapter_ids:
-            for line in chapter.line_ids:
+        # El recálculo de avance se difiere: una sola pasada por obra al terminar
+        with self.env['building.progress.engine'].deferred_recompute():
+            # Ya no buscamos "existentes" para clonar. Trabajamos directamente sobre las partidas del presupuesto.
+            for chapter in self.chapter_ids:
+                for line in chapter.line_ids:
                 
-                # 0. Canonical Check (Detectar duplicados históricos)
-                # Protegemos el wizard de actuar sobre datos sucios.
-                domain = [
-                    ('budget_id', '=', self.budget_id.id),
-                    ('chapter_id', '=', chapter.id),
-                    ('code', '=', line.code)
-                ]
-                if self.env['building.budget.line'].search_count(domain) > 1:
-                     raise UserError(_(
-                         'Error Crítico de Integridad: Se detectaron duplicados para la partida "%s".\n'
-                         'El sistema no puede continuar automáticante.\n'
-                         'Solicite a un Administrador Técnico limpiar la base de datos.'
-                     ) % line.display_name)
+                    # 0. Canonical Check (Detectar duplicados históricos)
+                    # Protegemos el wizard de actuar sobre datos sucios.
+                    domain = [
+                        ('budget_id', '=', self.budget_id.id),
+                        ('chapter_id', '=', chapter.id),
+                        ('code', '=', line.code)
+                    ]
+                    if self.env['building.budget.line'].search_count(domain) > 1:
+                         raise UserError(_(
+                             'Error Crítico de Integridad: Se detectaron duplicados para la partida "%s".\n'
+                             'El sistema no puede continuar automáticante.\n'
+                             'Solicite a un Administrador Técnico limpiar la base de datos.'
+                         ) % line.display_name)
 
-                # Caso 1: Ya está en la etapa destino
-                if line.stage_id == self.stage_id:
-                    Stats['skipped'] += 1
-                    continue
-                
-                # Caso 2: Tiene etapa asignada (pero distinta)
-                if line.stage_id:
-                    if self.reassign_mode == 'reassign':
-                        # MOVER
-                        line.with_context(ctx).write({'stage_id': self.stage_id.id})
-                        Stats['moved'] += 1
-                    else:
-                        # OMITIR (Está ocupada)
+                    # Caso 1: Ya está en la etapa destino
+                    if line.stage_id == self.stage_id:
                         Stats['skipped'] += 1
+                        continue
                 
-                # Caso 3: No tiene etapa (Libre)
-                else:
-                    # ASIGNAR
-                    line.with_context(ctx).write({'stage_id': self.stage_id.id})
-                    Stats['assigned'] += 1
+                    # Caso 2: Tiene etapa asignada (pero distinta)
+                    if line.stage_id:
+                        if self.reassign_mode == 'reassign':
+                            # MOVER
+                            line.with_context(ctx).write({'stage_id': self.stage_id.id})
+                            Stats['moved'] += 1
+                        else:
+                            # OMITIR (Está ocupada)
+                            Stats['skipped'] += 1
+                
+                    # Caso 3: No tiene etapa (Libre)
+                    else:
+                        # ASIGNAR
+                        line.with_context(ctx).write({'stage_id': self.stage_id.id})
+                        Stats['assigned'] += 1
 
         return {
             'type': 'ir.actions.client',
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Wizard: Carga Masiva de CFDI (building.cfdi.bulk.load.wizard)
+
+Recibe un ZIP y/o varios XML, parsea cada archivo UNA vez y crea (o
+empata) la factura de proveedor correspondiente. Las búsquedas se hacen
+por lote: una consulta de UUIDs ya cargados, una de proveedores por RFC y
+una de borradores sin CFDI por (proveedor, referencia). El resultado de
+cada archivo queda en building.cfdi.bulk.load.result.
+
+Los archivos se procesan en bloques de CHUNK_SIZE; cada archivo corre en
+su propio savepoint (un error no detiene el lote) y cada bloque se
+confirma por separado, para no sostener una sola transacción gigante.
+"""
+
+import base64
+import io
+import logging
+import zipfile
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+# Archivos por bloque (un commit por bloque)
+CHUNK_SIZE = 100
+
+
+class BuildingCfdiBulkLoadWizard(models.TransientModel):
+    _name = 'building.cfdi.bulk.load.wizard'
+    _description = 'Carga Masiva de CFDI'
+
+    company_id = fields.Many2one(
+        'res.company',
+        string='Compañía',
+        required=True,
+        default=lambda self: self.env.company
+    )
+    attachment_ids = fields.Many2many(
+        'ir.attachment',
+        string='Archivos (XML o ZIP)',
+        help='Uno o varios XML de CFDI, o archivos ZIP que los contengan'
+    )
+    validate_sat = fields.Boolean(
+        string='Validar en SAT',
+        default=False,
+        help='Consulta el estatus de cada CFDI en el SAT (más lento en lotes grandes)'
+    )
+    state = fields.Selection([
+        ('draft', 'Por Cargar'),
+        ('done', 'Procesado'),
+    ], string='Estado', default='draft', readonly=True)
+
+    result_ids = fields.One2many(
+        'building.cfdi.bulk.load.result',
+        'wizard_id',
+        string='Resultados',
+        readonly=True
+    )
+    created_count = fields.Integer(string='Creadas', compute='_compute_counts')
+    matched_count = fields.Integer(string='Empatadas', compute='_compute_counts')
+    duplicate_count = fields.Integer(string='Duplicadas', compute='_compute_counts')
+    error_count = fields.Integer(string='Con Error', compute='_compute_counts')
+
+    @api.depends('result_ids.status')
+    def _compute_counts(self):
+        for wizard in self:
+            statuses = wizard.result_ids.mapped('status')
+            wizard.created_count = statuses.count('created')
+            wizard.matched_count = statuses.count('matched')
+            wizard.duplicate_count = statuses.count('duplicate')
+            wizard.error_count = statuses.count('error')
+
+    # === ARCHIVOS ===
+    def _collect_files(self):
+        """Expande los adjuntos (ZIP o XML) a una lista de (nombre, bytes)."""
+        files = []
+        for attachment in self.attachment_ids:
+            content = attachment.raw or b''
+            if zipfile.is_zipfile(io.BytesIO(content)):
+                with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                    for info in archive.infolist():
+                        name = info.filename
+                        if info.is_dir() or name.startswith('__MACOSX/') \
+                                or not name.lower().endswith('.xml'):
+                            continue
+                        files.append((name.rsplit('/', 1)[-1], archive.read(info)))
+            else:
+                files.append((attachment.name, content))
+        return files
+
+    # === PROCESO ===
+    def action_process(self):
+        """Parsea, deduplica y crea/empata las facturas, con resultado por archivo."""
+        self.ensure_one()
+        files = self._collect_files()
+        if not files:
+            raise UserError(_('Seleccione al menos un archivo XML o ZIP.'))
+
+        Parser = self.env['building.cfdi.parser']
+
+        # 1. Parsear cada archivo UNA vez
+        parsed, results = [], []
+        for filename, content in files:
+            try:
+                parsed.append((filename, content, Parser.parse(content)))
+            except UserError as e:
+                results.append(self._result_vals(filename, 'error', message=str(e)))
+
+        # 2. Deduplicar UUIDs contra facturas existentes (una consulta) y dentro del lote
+        uuids = list({data.uuid for _filename, _content, data in parsed})
+        existing = {
+            move.l10n_mx_cfdi_uuid: move
+            for move in self.env['account.move'].search([
+                ('l10n_mx_cfdi_uuid', 'in', uuids),
+                ('move_type', 'in', ('in_invoice', 'in_refund')),
+            ])
+        } if uuids else {}
+        pending, seen = [], set()
+        for filename, content, data in parsed:
+            uuid = data.uuid
+            if data.tipo not in ('I', 'E'):
+                results.append(self._result_vals(
+                    filename, 'error', data,
+                    message=_('Tipo de comprobante no soportado: %s') % data.tipo))
+            elif uuid in existing:
+                results.append(self._result_vals(
+                    filename, 'duplicate', data, existing[uuid],
+                    _('Ya cargado en %s') % existing[uuid].display_name))
+            elif uuid in seen:
+                results.append(self._result_vals(
+                    filename, 'duplicate', data, message=_('UUID repetido en el lote')))
+            else:
+                seen.add(uuid)
+                pending.append((filename, content, data))
+
+        # 3. Proveedores por RFC (una búsqueda y un create para los faltantes)
+        partners = self._get_partners([data for _filename, _content, data in pending])
+
+        # 4. Borradores sin CFDI que se pueden empatar por (proveedor, referencia)
+        drafts = self._get_matching_drafts(pending, partners)
+
+        # 5. Estatus SAT de todo el lote en paralelo (opcional)
+        sat_statuses = {}
+        if self.validate_sat:
+            sat_statuses = self.env['building.sat.service'].check_status_many([
+                (data.rfc_emisor, data.rfc_receptor, data.total, data.uuid)
+                for _filename, _content, data in pending
+            ])
+
+        Result = self.env['building.cfdi.bulk.load.result']
+        Result.create(results)
+        tax_cache, currency_cache = {}, {}
+        for chunk in split_every(CHUNK_SIZE, pending):
+            chunk_results = []
+            for filename, content, data in chunk:
+                try:
+                    with self.env.cr.savepoint():
+                        chunk_results.append(self._load_one(
+                            filename, content, data, partners, drafts, tax_cache, currency_cache,
+                            sat_statuses.get(data.uuid, 'not_checked')))
+                except Exception as e:
+                    _logger.warning("Carga masiva CFDI: error en %s: %s", filename, e)
+                    chunk_results.append(self._result_vals(filename, 'error', data, message=str(e)))
+            Result.create(chunk_results)
+            self._commit_chunk()
+
+        self.state = 'done'
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _load_one(self, filename, content, data, partners, drafts, tax_cache, currency_cache, sat_status):
+        """Crea o empata la factura de un CFDI y devuelve los valores del resultado."""
+        Loader = self.env['building.cfdi.load.wizard']
+        company = self.company_id
+        partner = partners[data.rfc_emisor]
+        vals = Loader._prepare_cfdi_move_vals(
+            data, partner, company, filename, sat_status, tax_cache, currency_cache)
+        vals['l10n_mx_cfdi_xml_file'] = base64.b64encode(content)
+        move = drafts.pop((partner.id, vals['ref']), None)
+        if move:
+            move.invoice_line_ids.unlink()
+            move.write(vals)
+            status = 'matched'
+        else:
+            vals['move_type'] = 'in_refund' if data.tipo == 'E' else 'in_invoice'
+            move = self.env['account.move'].with_company(company).create(vals)
+            status = 'created'
+        return self._result_vals(filename, status, data, move)
+
+    def _get_partners(self, datas):
+        """Proveedores por RFC emisor: {rfc: partner}; crea los faltantes en un solo create."""
+        Partner = self.env['res.partner']
+        rfcs = list({data.rfc_emisor for data in datas if data.rfc_emisor})
+        partners = {}
+        if rfcs:
+            for partner in Partner.search([('vat', 'in', rfcs)]):
+                partners.setdefault(partner.vat, partner)
+        missing = {}
+        for data in datas:
+            if data.rfc_emisor not in partners:
+                missing.setdefault(data.rfc_emisor, data)
+        if missing:
+            Loader = self.env['building.cfdi.load.wizard']
+            created = Partner.create([Loader._prepare_cfdi_partner_vals(data) for data in missing.values()])
+            partners.update(zip(missing, created))
+        return partners
+
+    def _get_matching_drafts(self, pending, partners):
+        """Borradores de proveedor sin UUID: {(partner_id, ref): move} (una consulta)."""
+        refs = list({data.folio for _filename, _content, data in pending if data.folio})
+        if not refs:
+            return {}
+        drafts = {}
+        for move in self.env['account.move'].search([
+            ('move_type', 'in', ('in_invoice', 'in_refund')),
+            ('state', '=', 'draft'),
+            ('company_id', '=', self.company_id.id),
+            ('l10n_mx_cfdi_uuid', '=', False),
+            ('partner_id', 'in', [partner.id for partner in partners.values()]),
+            ('ref', 'in', refs),
+        ]):
+            drafts.setdefault((move.partner_id.id, move.ref), move)
+        return drafts
+
+    def _result_vals(self, filename, status, data=None, move=None, message=False):
+        """Valores de una línea de resultado."""
+        return {
+            'wizard_id': self.id,
+            'filename': filename,
+            'status': status,
+            'uuid': data and data.uuid,
+            'rfc_emisor': data and data.rfc_emisor,
+            'amount_total': data and data.total,
+            'move_id': move and move.id,
+            'message': message,
+        }
+
+    def _commit_chunk(self):
+        """Confirma el bloque procesado (no en pruebas: la transacción es del test)."""
+        self.env.flush_all()
+        if not self.env.registry.in_test_mode():
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+
+
+class BuildingCfdiBulkLoadResult(models.TransientModel):
+    _name = 'building.cfdi.bulk.load.result'
+    _description = 'Resultado de Carga Masiva de CFDI'
+    _order = 'id'
+
+    wizard_id = fields.Many2one(
+        'building.cfdi.bulk.load.wizard',
+        string='Carga',
+        required=True,
+        ondelete='cascade'
+    )
+    filename = fields.Char(string='Archivo', readonly=True)
+    status = fields.Selection([
+        ('created', 'Creada'),
+        ('matched', 'Empatada'),
+        ('duplicate', 'Duplicada'),
+        ('error', 'Error'),
+    ], string='Resultado', required=True, readonly=True)
+    uuid = fields.Char(string='UUID', readonly=True)
+    rfc_emisor = fields.Char(string='RFC Emisor', readonly=True)
+    amount_total = fields.Float(string='Total', readonly=True)
+    move_id = fields.Many2one('account.move', string='Factura', readonly=True)
+    message = fields.Char(string='Detalle', readonly=True)
@@ -1,9 +1,6 @@
 # -*- coding: utf-8 -*-
 import base64
 import logging
-import requests
-from lxml import etree
-from datetime import datetime
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
@@ -46,83 +43,115 @@ class BuildingCfdiLoadWizard(models.TransientModel):
                 continue
 
             try:
-                root = self._parse_xml(wizard.xml_file)
-                ns = self._get_namespaces(root)
-                
-                # Datos del Comprobante
-                # root = tree.getroot() <- Eliminado, root ya es el elemento
-                wizard.preview_total = float(root.get('Total', '0.0'))
-                wizard.preview_fecha = root.get('Fecha', '')
-                
-                # Moneda
-                moneda_code = root.get('Moneda', 'MXN')
-                currency = self.env['res.currency'].search([('name', '=', moneda_code)], limit=1)
-                if not currency:
-                    # Fallback a MXN si no encuentra
-                    currency = self.env.ref('base.MXN')
-                wizard.currency_id = currency
-
-                # Datos del Emisor
-                emisor = root.find('cfdi:Emisor', ns)
-                if emisor is not None:
-                    wizard.preview_rfc = emisor.get('Rfc', '')
-                    wizard.preview_nombre = emisor.get('Nombre', '')
-
-                # UUID del Timbre
-                tfd = root.find('.//tfd:TimbreFiscalDigital', ns)
-                if tfd is not None:
-                    wizard.preview_uuid = tfd.get('UUID', '')
-                
-                # Validar status SAT preliminar (opcional, si se quiere feedback inmediato)
-                # Por ahora solo parseamos para preview.
-                
+                # Mismo parseo (en caché) que usará la carga
+                cfdi = self._parse_cfdi(wizard.xml_file)
+                wizard.preview_uuid = cfdi.uuid
+                wizard.preview_rfc = cfdi.rfc_emisor
+                wizard.preview_nombre = cfdi.nombre_emisor
+                wizard.preview_total = cfdi.total
+                wizard.preview_fecha = cfdi.fecha.isoformat()
+                wizard.currency_id = self._get_cfdi_currency(cfdi.moneda)
             except Exception as e:
                 _logger.error(f"Error parsing XML preview: {e}")
                 # No levantar error aquí para permitir al usuario ver que algo falló o reintentar
                 wizard.preview_uuid = f'Error al leer XML: {str(e)}'
+                wizard.preview_rfc = False
+                wizard.preview_nombre = False
+                wizard.preview_total = 0.0
+                wizard.preview_fecha = False
+                wizard.currency_id = False
 
-    def _parse_xml(self, file_content):
-        """Decodifica y parsea el archivo XML."""
+    def _decode_xml(self, file_content):
+        """Decodifica el archivo (base64, opcionalmente como data URI) a bytes."""
         try:
             # Asegurar bytes
             if not isinstance(file_content, bytes):
                 # Si viene como string, puede ser data URI
                 if isinstance(file_content, str):
-                     if ',' in file_content:
-                         file_content = file_content.split(',')[1]
-                     file_content = file_content.encode('utf-8')
-
-            decoded = base64.b64decode(file_content)
-            # Eliminar BOM si existe
-            # if decoded.startswith(b'\xef\xbb\xbf'):
-            #    decoded = decoded[3:]
-            return etree.fromstring(decoded)
+                    if ',' in file_content:
+                        file_content = file_content.split(',')[1]
+                    file_content = file_content.encode('utf-8')
+            return base64.b64decode(file_content)
         except Exception as e:
             raise UserError(_('El archivo no es un XML válido: %s') % str(e))
 
-    def _get_namespaces(self, root):
-        """Detecta versión 3.3 o 4.0 y retorna namespaces."""
-        # root = tree.getroot() <- Eliminado
-        if 'http://www.sat.gob.mx/cfd/4' in root.nsmap.values():
-            return {
-                'cfdi': 'http://www.sat.gob.mx/cfd/4',
-                'tfd': 'http://www.sat.gob.mx/TimbreFiscalDigital'
-            }
-        elif 'http://www.sat.gob.mx/cfd/3' in root.nsmap.values():
-            return {
-                'cfdi': 'http://www.sat.gob.mx/cfd/3',
-                'tfd': 'http://www.sat.gob.mx/TimbreFiscalDigital'
-            }
-        else:
-            # Fallback genérico intentando usar el mapa del root
-            # A veces el nsmap tiene None como clave para el default
-            ns = {k:v for k,v in root.nsmap.items() if k}
-            if 'cfdi' not in ns:
-                # Si es default namespace
-                if None in root.nsmap:
-                    ns['cfdi'] = root.nsmap[None]
-            ns['tfd'] = 'http://www.sat.gob.mx/TimbreFiscalDigital'
-            return ns
+    def _parse_cfdi(self, file_content):
+        """CfdiDocument del archivo en base64 (ver building.cfdi.parser)."""
+        return self.env['building.cfdi.parser'].parse(self._decode_xml(file_content))
+
+    def _get_cfdi_currency(self, code, cache=None):
+        """Moneda por código ISO (fallback MXN), con caché opcional por lote."""
+        if cache is not None and code in cache:
+            return cache[code]
+        currency = self.env['res.currency'].search([('name', '=', code)], limit=1)
+        if not currency:
+            currency = self.env.ref('base.MXN')  # Fallback
+        if cache is not None:
+            cache[code] = currency
+        return currency
+
+    def _find_purchase_tax(self, tasa, company, cache=None):
+        """Impuesto de compra por tasa (ej: 0.16 -> 16%), con caché opcional por lote."""
+        key = (tasa, company.id)
+        if cache is not None and key in cache:
+            return cache[key]
+        # Refinar búsqueda por tipo si es posible (IVA vs IEPS) - Simplificado por ahora
+        tax = self.env['account.tax'].search([
+            ('amount', '=', tasa * 100),
+            ('type_tax_use', '=', 'purchase'),
+            ('company_id', '=', company.id),
+        ], limit=1)
+        if cache is not None:
+            cache[key] = tax
+        return tax
+
+    def _prepare_cfdi_move_vals(self, data, partner, company, filename, sat_status, tax_cache=None, currency_cache=None):
+        """Valores de la factura de proveedor a partir de los datos del CFDI."""
+        invoice_lines = []
+        for concepto in data.conceptos:
+            tax_ids = [
+                tax.id for tax in (
+                    self._find_purchase_tax(tasa, company, tax_cache) for tasa in concepto.tasas
+                ) if tax
+            ]
+            invoice_lines.append((0, 0, {
+                'name': concepto.descripcion,
+                'quantity': concepto.cantidad,
+                'price_unit': concepto.valor_unitario,
+                'tax_ids': [(6, 0, tax_ids)],
+                # 'product_uom_id': ... sería ideal mapear unidad SAT -> Odoo UoM pero es complejo
+            }))
+        ref = data.folio or data.uuid[:8]
+        return {
+            'partner_id': partner.id,
+            'ref': ref,
+            'payment_reference': ref,  # Copiar Referencia a Referencia de Pago
+            'invoice_date': data.fecha.date(),
+            'currency_id': self._get_cfdi_currency(data.moneda, currency_cache).id,
+            'invoice_line_ids': invoice_lines,
+            # Campos CFDI
+            'l10n_mx_cfdi_uuid': data.uuid,
+            'l10n_mx_cfdi_sat_status': sat_status,
+            'l10n_mx_cfdi_sat_checked_at': sat_status != 'not_checked' and fields.Datetime.now(),
+            'l10n_mx_cfdi_folio': data.folio,
+            'l10n_mx_cfdi_fecha': data.fecha,
+            'l10n_mx_cfdi_amount': data.total,
+            'l10n_mx_cfdi_forma_pago': data.forma_pago,
+            'l10n_mx_cfdi_metodo_pago': data.metodo_pago,
+            'l10n_mx_cfdi_rfc_emisor': data.rfc_emisor,
+            'l10n_mx_cfdi_rfc_receptor': data.rfc_receptor,
+            'l10n_mx_cfdi_xml_fname': filename or f"{data.uuid}.xml",
+        }
+
+    def _prepare_cfdi_partner_vals(self, data):
+        """Valores del proveedor a crear cuando el RFC emisor no existe."""
+        return {
+            'name': data.nombre_emisor or data.rfc_emisor,
+            'vat': data.rfc_emisor,
+            'company_type': 'company',
+            'supplier_rank': 1,
+            'country_id': self.env.ref('base.mx').id,
+        }
 
     def action_load_and_validate(self):
         """Carga datos, valida en SAT, crea/busca partner y actualiza factura."""
@@ -130,48 +159,9 @@ class BuildingCfdiLoadWizard(models.TransientModel):
         if not self.xml_file:
             raise UserError(_('Por favor seleccione un archivo XML.'))
 
-        root = self._parse_xml(self.xml_file)
-        ns = self._get_namespaces(root)
-        # root = tree.getroot() <- Eliminado
-
         # 1. Extraer Datos
-        try:
-            # Comprobante
-            serie = root.get('Serie', '')
-            folio = root.get('Folio', '')
-            fecha_str = root.get('Fecha', '')
-            # Convertir fecha '2026-02-15T10:30:00' -> datetime
-            # A veces viene con ms o sin T, tratar de ser flexible o usar ISO
-            try:
-                fecha_cfdi = datetime.fromisoformat(fecha_str)
-            except ValueError:
-                fecha_cfdi = datetime.strptime(fecha_str[:19], '%Y-%m-%dT%H:%M:%S')
-
-            forma_pago = root.get('FormaPago', '')
-            metodo_pago = root.get('MetodoPago', '')
-            moneda_code = root.get('Moneda', 'MXN')
-            tipo_cambio = float(root.get('TipoCambio', '1.0'))
-            subtotal = float(root.get('SubTotal', '0.0'))
-            total = float(root.get('Total', '0.0'))
-
-            # Emisor
-            emisor = root.find('cfdi:Emisor', ns)
-            rfc_emisor = emisor.get('Rfc', '')
-            nombre_emisor = emisor.get('Nombre', '')
-            
-            # Receptor
-            receptor = root.find('cfdi:Receptor', ns)
-            rfc_receptor = receptor.get('Rfc', '')
-
-            # Timbre
-            tfd = root.find('.//tfd:TimbreFiscalDigital', ns)
-            if tfd is None:
-                raise UserError(_('El XML no tiene Timbre Fiscal Digital (no está timbrado).'))
-            
-            uuid = tfd.get('UUID').upper()
-            
-        except AttributeError as e:
-            raise UserError(_('Estructura del XML inválida o faltan campos requeridos: %s') % str(e))
+        data = self._parse_cfdi(self.xml_file)
+        uuid = data.uuid
 
         # 2. Verificar duplicados
         duplicated = self.env['account.move'].search([
@@ -183,108 +173,23 @@ class BuildingCfdiLoadWizard(models.TransientModel):
             raise UserError(_('Este CFDI (UUID %s) ya está cargado en la factura: %s') % (uuid, duplicated[0].name))
 
         # 3. Validar Status SAT
-        sat_status = self._check_sat_status_soap(rfc_emisor, rfc_receptor, total, uuid)
+        sat_status = self._check_sat_status_soap(data.rfc_emisor, data.rfc_receptor, data.total, uuid)
 
         # 4. Buscar / Crear Proveedor
-        partner = self.env['res.partner'].search([('vat', '=', rfc_emisor)], limit=1)
+        partner = self.env['res.partner'].search([('vat', '=', data.rfc_emisor)], limit=1)
         if not partner:
-            # Crear contacto
-            partner = self.env['res.partner'].create({
-                'name': nombre_emisor,
-                'vat': rfc_emisor,
-                'company_type': 'company',
-                'supplier_rank': 1,
-                'country_id': self.env.ref('base.mx').id,
-            })
+            partner = self.env['res.partner'].create(self._prepare_cfdi_partner_vals(data))
 
         # 5. Preparar actualización de factura
-        
-        # Moneda
-        currency = self.env['res.currency'].search([('name', '=', moneda_code)], limit=1)
-        if not currency:
-             currency = self.env.ref('base.MXN') # Fallback
-             
         # Limpiar líneas actuales ??? -> Sí, segun spec
         self.move_id.invoice_line_ids.unlink()
+        vals = self._prepare_cfdi_move_vals(
+            data, partner, self.move_id.company_id, self.xml_filename or 'cfdi.xml', sat_status,
+        )
 
-        # Crear nuevas líneas desde Conceptos
-        invoice_lines = []
-        conceptos = root.find('cfdi:Conceptos', ns)
-        
-        for concepto in conceptos.findall('cfdi:Concepto', ns):
-            descripcion = concepto.get('Descripcion', '')
-            cantidad = float(concepto.get('Cantidad', '1.0'))
-            precio_unitario = float(concepto.get('ValorUnitario', '0.0'))
-            importe = float(concepto.get('Importe', '0.0')) # informativo
-            
-            # Impuestos
-            tax_ids = []
-            impuestos_node = concepto.find('cfdi:Impuestos', ns)
-            if impuestos_node is not None:
-                # Traslados
-                traslados = impuestos_node.find('cfdi:Traslados', ns)
-                if traslados is not None:
-                    for traslado in traslados.findall('cfdi:Traslado', ns):
-                        tasa = float(traslado.get('TasaOCuota', '0.0'))
-                        # Buscar impuesto (ej: 0.16 -> 16%)
-                        percentage = tasa * 100
-                        
-                        # Buscar impuesto de compra
-                        tax_domain = [
-                            ('amount', '=', percentage),
-                            ('type_tax_use', '=', 'purchase'),
-                            ('company_id', '=', self.move_id.company_id.id)
-                        ]
-                        
-                        # Refinar búsqueda por tipo si es posible (IVA vs IEPS) - Simplificado por ahora
-                        tax = self.env['account.tax'].search(tax_domain, limit=1)
-                        if tax:
-                             tax_ids.append(tax.id)
-                
-                # Retenciones
-                retenciones = impuestos_node.find('cfdi:Retenciones', ns)
-                if retenciones is not None:
-                    for retencion in retenciones.findall('cfdi:Retencion', ns):
-                         # La logica de retenciones es similar pero con montos negativos en Odoo usualmente
-                         # o configurados como 'purchase' + 'balance' negativo
-                         # Implementación simple: buscar por monto negativo si es ISR/IVA Retenido
-                         # Esto depende mucho de la config local. Haremos un best effort.
-                         pass
-
-            line_vals = {
-                'name': descripcion,
-                'quantity': cantidad,
-                'price_unit': precio_unitario,
-                'tax_ids': [(6, 0, tax_ids)],
-                # 'product_uom_id': ... sería ideal mapear unidad SAT -> Odoo UoM pero es complejo
-            }
-            invoice_lines.append((0, 0, line_vals))
-
-        # Actualizar Invoice
-        # Actualizar Invoice
-        vals = {
-            'partner_id': partner.id,
-            'ref': f"{serie}{folio}".strip() or uuid[:8],
-            'payment_reference': f"{serie}{folio}".strip() or uuid[:8], # Copiar Referencia a Referencia de Pago
-            'invoice_date': fecha_cfdi.date(),
-            'currency_id': currency.id,
-            'invoice_line_ids': invoice_lines,
-            # Campos CFDI
-            'l10n_mx_cfdi_uuid': uuid,
-            'l10n_mx_cfdi_sat_status': sat_status,
-            'l10n_mx_cfdi_folio': f"{serie}{folio}".strip(),
-            'l10n_mx_cfdi_fecha': fecha_cfdi,
-            'l10n_mx_cfdi_amount': total,
-            'l10n_mx_cfdi_forma_pago': forma_pago,
-            'l10n_mx_cfdi_metodo_pago': metodo_pago,
-            'l10n_mx_cfdi_rfc_emisor': rfc_emisor,
-            'l10n_mx_cfdi_rfc_receptor': rfc_receptor,
-            'l10n_mx_cfdi_xml_fname': self.xml_filename or 'cfdi.xml',
-        }
-        
         # Adjuntar XML
         # Primero crear attachment
-        attachment = self.env['ir.attachment'].create({
+        self.env['ir.attachment'].create({
             'name': self.xml_filename or f"{uuid}.xml",
             'datas': self.xml_file,
             'res_model': 'account.move',
@@ -292,7 +197,7 @@ class BuildingCfdiLoadWizard(models.TransientModel):
             'mimetype': 'application/xml',
         })
         vals['l10n_mx_cfdi_xml_file'] = self.xml_file # Campo Binary en move para acceso rápido
-        
+
         self.move_id.write(vals)
 
         # Mensajes de retorno
@@ -319,33 +224,5 @@ class BuildingCfdiLoadWizard(models.TransientModel):
         }
 
     def _check_sat_status_soap(self, rfc_emisor, rfc_receptor, total, uuid):
-        """Consulta SOAP al SAT."""
-        url = 'https://consultaqr.facturaelectronica.sat.gob.mx/ConsultaCFDIService.svc'
-        total_str = '%.6f' % abs(total)
-        soap_body = f"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tem="http://tempuri.org/">
-           <soapenv:Body>
-              <tem:Consulta>
-                 <tem:expresionImpresa>?re={rfc_emisor}&amp;rr={rfc_receptor}&amp;tt={total_str}&amp;id={uuid}</tem:expresionImpresa>
-              </tem:Consulta>
-           </soapenv:Body>
-        </soapenv:Envelope>"""
-        headers = {
-            'Content-Type': 'text/xml; charset=utf-8',
-            'SOAPAction': 'http://tempuri.org/IConsultaCFDIService/Consulta'
-        }
-        try:
-            response = requests.post(url, data=soap_body, headers=headers, timeout=5)
-            # Analisis simple del texto plano (xml response)
-            resp_text = response.text
-            if 'Vigente' in resp_text:
-                return 'valid'
-            elif 'Cancelado' in resp_text:
-                return 'cancelled'
-            elif 'No Encontrado' in resp_text:
-                return 'not_found'
-            else:
-                 _logger.warning(f"Respuesta SAT desconocida: {resp_text}")
-                 return 'error'
-        except Exception as e:
-            _logger.error(f"Error conectando SAT: {e}")
-            return 'error'
+        """Consulta SOAP al SAT (cliente compartido de building.sat.service)."""
+        return self.env['building.sat.service'].check_status(rfc_emisor, rfc_receptor, total, uuid)